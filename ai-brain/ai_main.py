@@ -1,12 +1,15 @@
 from chatbot import generate
-from gen_json import parse_conversation_and_generate_json
-from placesApiCalled import generate_places_api_calls
-from ranker import PlaceScorer
-from gen_iten import TripItineraryGenerator
-import json
+from pipeline import JsonFileSink, PipelineError, TripPipeline
 
 my_api_key = ""
 
+# Also write conversation.txt, trip_details.json, places.json, scored_*.json and trip_itinerary.json
+SAVE_INTERMEDIATE_FILES = True
+
+# Result pages (of up to 20 places) per Places nearby search; more pages find more
+# candidates in big cities at the cost of extra requests and ~2s per page
+PLACES_MAX_PAGES = 1
+
 def main():
     """
     Main function to run the AI chatbot for travel planning.
@@ -16,39 +19,16 @@ def main():
     
     #Start the chatbot conversation
     conversation = generate()
-    with open("conversation.txt", "w", encoding="utf-8") as file:
-        file.write(conversation)
-
-    parse_conversation_and_generate_json(conversation)
-
-    with open("trip_details.json", "r", encoding="utf-8") as file:
-        trip = json.load(file)
-    generate_places_api_calls(trip, my_api_key)
 
-    scorer = PlaceScorer(my_api_key, my_api_key)
+    # Discovery, scoring and itinerary generation run in-process, passing results along directly
+    sink = JsonFileSink() if SAVE_INTERMEDIATE_FILES else None
+    pipeline = TripPipeline(my_api_key, my_api_key, sink=sink, max_pages=PLACES_MAX_PAGES)
     try:
-        results = scorer.score_all_places()
-        scorer.save_results(results)
+        pipeline.plan_from_conversation(conversation)
     except KeyboardInterrupt:
-        print("\n\nProcess interrupted by user. Partial results may have been saved.")
-    except Exception as e:
-        print(f"\n\nError during scoring process: {str(e)}")
-        print("Partial results may have been saved.")
-
-    trip_details_path = 'trip_details.json'
-    attractions_path = 'scored_attractions.json'
-    restaurants_path = 'scored_restaurants.json'
-    lodging_path = 'scored_lodging.json'
-    output_path = 'trip_itinerary.json'
-    generator = TripItineraryGenerator(my_api_key)
-    try:
-        generator.process_trip_files(
-            trip_details_path,
-            attractions_path,
-            restaurants_path,
-            lodging_path,
-            output_path
-        )
+        print("\n\nProcess interrupted by user.")
+    except PipelineError as e:
+        print(f"\n\nError planning trip: {e}")
     except Exception as e:
         print(f"Error generating itinerary: {e}")
         raise
@@ -56,4 +36,4 @@ def main():
     print("\nThank you for using Aitrav! Have a great trip!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
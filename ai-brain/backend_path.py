@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The ai-brain scripts share some clients with travel-ai-backend (e.g. the
+# Google Places client); importing this module makes its `app` package importable.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "travel-ai-backend")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -1,15 +1,33 @@
-from google import genai
 from google.genai import types
 from datetime import date
+import backend_path  # noqa: F401  (makes the shared backend clients importable)
+from app.core.ai_engine import get_llm_gateway
+from app.core.conversation_context import ConversationContext
 
 today = date.today()
 
+
+def build_contents(system_part, context):
+    """
+    Prompt for the next turn: the instructions (plus the condensed earlier
+    conversation, if any) followed by the recent turns, so its size stays
+    roughly constant however long the conversation runs.
+    """
+    parts = [system_part]
+    if context.summary:
+        parts.append(types.Part.from_text(text=f"Earlier in this conversation (condensed):\n{context.summary}"))
+    contents = [types.Content(role="user", parts=parts)]
+    for role, text in context.turns:
+        contents.append(
+            types.Content(
+                role="model" if role == "assistant" else "user",
+                parts=[types.Part.from_text(text=text)]
+            )
+        )
+    return contents
+
 def generate():
-    client = genai.Client(
-        vertexai=True,
-        project="gen-lang-client-0235407741",
-        location="global",
-    )
+    llm = get_llm_gateway(vertex_project="gen-lang-client-0235407741", vertex_location="global")
     
     system_prompt = """You are a travel agent chatbot and your job is to get the following information from the user about the trip they are planning.
 Ask questions progressively until you have information to fill this JSON file:
@@ -43,13 +61,8 @@ Note: Any date mentioned is assumed to be after {today}
     msg1_text1 = types.Part.from_text(text=system_prompt)
     model = "gemini-2.5-flash"
     
-    # Initialize conversation with system prompt
-    contents = [
-        types.Content(
-            role="user",
-            parts=[msg1_text1]
-        ),
-    ]
+    # Recent turns plus a summary of older ones; the full transcript is only kept locally
+    context = ConversationContext()
     
     generate_content_config = types.GenerateContentConfig(
         temperature=1,
@@ -86,9 +99,9 @@ Note: Any date mentioned is assumed to be after {today}
     
     # Generate initial response
     chatbot_response = ""
-    for chunk in client.models.generate_content_stream(
+    for chunk in llm.client_generate_content_stream(
         model=model,
-        contents=contents,
+        contents=build_contents(msg1_text1, context),
         config=generate_content_config,
     ):
         chatbot_response += chunk.text
@@ -98,12 +111,7 @@ Note: Any date mentioned is assumed to be after {today}
     full_conversation_text += "Chatbot: " + chatbot_response + "\n"
     
     # Add the chatbot's initial response to the conversation history
-    contents.append(
-        types.Content(
-            role="model",
-            parts=[types.Part.from_text(text=chatbot_response)]
-        )
-    )
+    context.add("assistant", chatbot_response)
     
     # Main conversation loop
     while True:
@@ -120,20 +128,15 @@ Note: Any date mentioned is assumed to be after {today}
         
         # Add user input to conversation history
         full_conversation_text += "User: " + user_input + "\n"
-        contents.append(
-            types.Content(
-                role="user",
-                parts=[types.Part.from_text(text=user_input)]
-            )
-        )
+        context.add("user", user_input)
         
         # Generate chatbot response
         print("\nChatbot: ", end="")
         chatbot_response = ""
         try:
-            for chunk in client.models.generate_content_stream(
+            for chunk in llm.client_generate_content_stream(
                 model=model,
-                contents=contents,
+                contents=build_contents(msg1_text1, context),
                 config=generate_content_config,
             ):
                 chatbot_response += chunk.text
@@ -143,12 +146,7 @@ Note: Any date mentioned is assumed to be after {today}
             
             # Add to conversation history
             full_conversation_text += "Chatbot: " + chatbot_response + "\n"
-            contents.append(
-                types.Content(
-                    role="model",
-                    parts=[types.Part.from_text(text=chatbot_response)]
-                )
-            )
+            context.add("assistant", chatbot_response)
             
             # Check if the conversation seems complete
             # You can customize this logic based on your needs
@@ -3,12 +3,13 @@ import os
 from datetime import datetime, timedelta
 import google.generativeai as genai
 from typing import Dict, List, Any
+import backend_path  # noqa: F401  (makes the shared backend clients importable)
+from app.core.ai_engine import get_llm_gateway
 
 class TripItineraryGenerator:
     def __init__(self, api_key: str):
         """Initialize the generator with Gemini API key."""
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.llm = get_llm_gateway(api_key)
         
     def load_json_file(self, filepath: str) -> Dict[str, Any]:
         """Load a JSON file and return its contents."""
@@ -115,7 +116,7 @@ class TripItineraryGenerator:
                                      sorted_restaurants, sorted_lodging)
         
         # Generate response
-        response = self.model.generate_content(
+        response = self.llm.generate_content(
             context,
             generation_config=genai.GenerationConfig(
                 temperature=0.7,
@@ -141,6 +142,21 @@ class TripItineraryGenerator:
             json.dump(itinerary, f, indent=2)
         print(f"Itinerary saved to: {output_path}")
     
+    def build_itinerary(self, trip_details: Dict, attractions: Dict,
+                        restaurants: Dict, lodging: Dict) -> Dict[str, Any]:
+        """Generate an itinerary from in-memory trip details and scores, with metadata attached."""
+        itinerary = self.generate_itinerary(trip_details, attractions, 
+                                          restaurants, lodging)
+        
+        # Add metadata
+        itinerary['metadata'] = {
+            'generated_at': datetime.now().isoformat(),
+            'trip_destination': trip_details['destination'],
+            'trip_dates': trip_details['dates_of_travel'],
+            'number_of_travelers': trip_details['number_of_travelers']
+        }
+        return itinerary
+    
     def process_trip_files(self, trip_details_path: str, attractions_path: str,
                           restaurants_path: str, lodging_path: str, 
                           output_path: str = "trip_itinerary.json"):
@@ -154,16 +170,7 @@ class TripItineraryGenerator:
         
         # Generate itinerary
         print("Generating itinerary with Gemini API...")
-        itinerary = self.generate_itinerary(trip_details, attractions, 
-                                          restaurants, lodging)
-        
-        # Add metadata
-        itinerary['metadata'] = {
-            'generated_at': datetime.now().isoformat(),
-            'trip_destination': trip_details['destination'],
-            'trip_dates': trip_details['dates_of_travel'],
-            'number_of_travelers': trip_details['number_of_travelers']
-        }
+        itinerary = self.build_itinerary(trip_details, attractions, restaurants, lodging)
         
         # Save itinerary
         self.save_itinerary(itinerary, output_path)
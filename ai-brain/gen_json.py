@@ -1,24 +1,23 @@
 import json
-from google import genai
 from google.genai import types
 import os
+from typing import Optional
+import backend_path  # noqa: F401  (makes the shared backend clients importable)
+from app.core.ai_engine import get_llm_gateway
 
-def parse_conversation_and_generate_json(full_conversation_text: str, output_filename: str = "trip_details.json"):
+def parse_conversation_and_generate_json(full_conversation_text: str, output_filename: Optional[str] = "trip_details.json"):
     """
     Parses the full conversation text using the Gemini API to extract trip details
     and saves them into a JSON file.
 
     Args:
         full_conversation_text (str): The complete chat log between the user and the travel agent.
-        output_filename (str): The name of the JSON file to save the extracted data.
+        output_filename (str): The name of the JSON file to save the extracted data,
+            or None to only return it.
     """
     try:
-        # Initialize the Gemini client
-        client = genai.Client(
-            vertexai=True,
-            project="gen-lang-client-0235407741",
-            location="global",
-        )
+        # Reuse the process-wide Gemini client
+        llm = get_llm_gateway(vertex_project="gen-lang-client-0235407741", vertex_location="global")
 
         # Use the same model as the main chatbot for consistency
         model = "gemini-2.5-flash"
@@ -93,7 +92,7 @@ Based on the conversation above, extract the information and return ONLY the JSO
 
         # Call the Gemini API to generate content
         print("Extracting trip information from conversation...")
-        response = client.models.generate_content(
+        response = llm.client_generate_content(
             model=model,
             contents=contents,
             config=generate_content_config,
@@ -170,10 +169,12 @@ Based on the conversation above, extract the information and return ONLY the JSO
                     extracted_data["dates_of_travel"]["end_date"] = ""
 
         # Save the extracted data to a JSON file
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(extracted_data, f, indent=4, ensure_ascii=False)
-
-        print(f"\n✅ Successfully extracted information and saved to '{output_filename}'")
+        if output_filename:
+            with open(output_filename, 'w', encoding='utf-8') as f:
+                json.dump(extracted_data, f, indent=4, ensure_ascii=False)
+            print(f"\n✅ Successfully extracted information and saved to '{output_filename}'")
+        else:
+            print("\n✅ Successfully extracted information")
         print("\n--- EXTRACTED TRIP DETAILS ---")
         print(json.dumps(extracted_data, indent=2))
         
@@ -0,0 +1,65 @@
+import math
+from typing import Any, Dict, List
+
+EARTH_RADIUS_METERS = 6371000
+# Shortest length of one degree of latitude (at the equator), so grid cells never undershoot
+METERS_PER_DEGREE_LAT = 110574
+
+
+def haversine_meters(a: Dict[str, float], b: Dict[str, float]) -> float:
+    """Great-circle distance in meters between two {"lat", "lng"} points."""
+    lat1, lat2 = math.radians(a["lat"]), math.radians(b["lat"])
+    d_lat = lat2 - lat1
+    d_lng = math.radians(b["lng"] - a["lng"])
+    h = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(h))
+
+
+def cluster_search_anchors(pois: List[Dict[str, Any]], merge_distance_m: float) -> List[Dict[str, Any]]:
+    """
+    Greedily cover POIs with as few search anchors as possible.
+
+    POIs are visited in order; each one joins the first existing cluster whose
+    center is within `merge_distance_m`, otherwise it becomes the center of a
+    new cluster. Candidate clusters are looked up through a coarse lat/lng grid
+    with cells of `merge_distance_m`, so only neighbouring cells are checked.
+
+    Args:
+        pois (list): Dicts with a "location" ({"lat", "lng"}) and a "place_id".
+        merge_distance_m (float): Maximum distance from a POI to its cluster center.
+
+    Returns:
+        list: Clusters as {"center": location, "poi_place_ids": [...]}, in the
+              order their first POI appeared.
+    """
+    clusters = []
+    grid = {}
+    if not pois:
+        return clusters
+    # Cells are at least merge_distance_m wide in both directions, so any center
+    # within range lies in the POI's cell or one of its eight neighbours.
+    # Longitude cells are sized for the POI closest to a pole.
+    lat_cell_degrees = max(merge_distance_m / METERS_PER_DEGREE_LAT, 1e-6)
+    max_abs_lat = min(max(abs(poi["location"]["lat"]) for poi in pois), 89.0)
+    lng_cell_degrees = lat_cell_degrees / math.cos(math.radians(max_abs_lat))
+
+    for poi in pois:
+        location = poi["location"]
+        cell = (int(math.floor(location["lat"] / lat_cell_degrees)),
+                int(math.floor(location["lng"] / lng_cell_degrees)))
+
+        match = None
+        for d_lat in (-1, 0, 1):
+            for d_lng in (-1, 0, 1):
+                for index in grid.get((cell[0] + d_lat, cell[1] + d_lng), []):
+                    if haversine_meters(clusters[index]["center"], location) <= merge_distance_m:
+                        if match is None or index < match:
+                            match = index
+
+        if match is None:
+            match = len(clusters)
+            clusters.append({"center": location, "poi_place_ids": []})
+            grid.setdefault(cell, []).append(match)
+        clusters[match]["poi_place_ids"].append(poi.get("place_id"))
+
+    return clusters
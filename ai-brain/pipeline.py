@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional
+from gen_json import parse_conversation_and_generate_json
+from gen_iten import TripItineraryGenerator
+from placesApiCalled import (
+    DEFAULT_ANCHOR_MERGE_DISTANCE_METERS,
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_MAX_PAGES,
+    new_places_summary,
+    record_place_event,
+    stream_places
+)
+from ranker import PlaceScorer
+
+DEFAULT_QUEUE_SIZE = 64
+# Marks the end of the discovery stream on the queue
+_END_OF_STREAM = object()
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline stage cannot continue, e.g. the destination is not found."""
+
+
+class JsonFileSink:
+    """
+    Optional sink that persists each pipeline stage to the JSON files the
+    stand-alone scripts read and write (trip_details.json, places.json,
+    scored_*.json, trip_itinerary.json).
+    """
+
+    def __init__(self, directory: str = "."):
+        self.directory = directory
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def write_conversation(self, conversation: str):
+        with open(self._path("conversation.txt"), "w", encoding="utf-8") as file:
+            file.write(conversation)
+
+    def write_trip_details(self, trip_details: Dict[str, Any]):
+        with open(self._path("trip_details.json"), "w", encoding="utf-8") as file:
+            json.dump(trip_details, file, indent=4, ensure_ascii=False)
+
+    def write_places(self, places: Dict[str, Any]):
+        with open(self._path("places.json"), "w") as file:
+            file.write(json.dumps(places, indent=2))
+
+    def write_scores(self, scorer: PlaceScorer, results: Dict[str, Any]):
+        scorer.save_results(results, self.directory)
+
+    def write_itinerary(self, generator: TripItineraryGenerator, itinerary: Dict[str, Any]):
+        generator.save_itinerary(itinerary, self._path("trip_itinerary.json"))
+
+
+class TripPipeline:
+    """
+    In-process trip planning pipeline: discovery -> scoring -> itinerary.
+
+    Stages hand Python objects to each other instead of re-reading JSON files.
+    Places discovered by the Places API are passed through a bounded queue to
+    the scorer, which starts scoring batches while searches are still running;
+    when the queue is full, discovery waits for scoring to catch up. The
+    itinerary needs the full ranking, so it starts as soon as the last score
+    is in. Pass a sink (such as JsonFileSink) to also persist every stage.
+    """
+
+    def __init__(self, google_api_key: str, gemini_api_key: str,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 sink: Optional[JsonFileSink] = None,
+                 max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 anchor_merge_distance_m: float = DEFAULT_ANCHOR_MERGE_DISTANCE_METERS,
+                 max_pages: int = DEFAULT_MAX_PAGES,
+                 scorer_options: Optional[Dict[str, Any]] = None):
+        self.google_api_key = google_api_key
+        self.gemini_api_key = gemini_api_key
+        self.queue_size = queue_size
+        self.sink = sink
+        self.max_concurrent_requests = max_concurrent_requests
+        self.anchor_merge_distance_m = anchor_merge_distance_m
+        self.max_pages = max_pages
+        self.scorer_options = scorer_options or {}
+
+    def plan_from_conversation(self, conversation: str) -> Dict[str, Any]:
+        """Extract trip details from a chatbot transcript and run the pipeline on them."""
+        if self.sink:
+            self.sink.write_conversation(conversation)
+        trip_details = parse_conversation_and_generate_json(conversation, output_filename=None)
+        if trip_details is None:
+            raise PipelineError("Could not extract trip details from the conversation")
+        return asyncio.run(self.run(trip_details))
+
+    async def run(self, trip_details: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run discovery, scoring and itinerary generation for a trip.
+
+        Returns:
+            dict: {"trip_details", "places", "scores", "itinerary"}, where
+                  "scores" is ranked highest first within each category.
+        """
+        if self.sink:
+            self.sink.write_trip_details(trip_details)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        places = new_places_summary()
+        scorer = PlaceScorer(self.google_api_key, self.gemini_api_key,
+                             trip_details=trip_details, places_data={}, **self.scorer_options)
+
+        async def discover():
+            try:
+                async for kind, payload in stream_places(trip_details, self.google_api_key,
+                                                         self.max_concurrent_requests,
+                                                         self.anchor_merge_distance_m, self.max_pages):
+                    if kind == "error":
+                        raise PipelineError(payload)
+                    record_place_event(places, kind, payload)
+                    await queue.put((kind, payload))
+            finally:
+                await queue.put(_END_OF_STREAM)
+
+        async def discovered_places():
+            while True:
+                event = await queue.get()
+                if event is _END_OF_STREAM:
+                    return
+                yield event
+
+        discovery = asyncio.create_task(discover())
+        try:
+            scores = await scorer.score_places_stream(discovered_places())
+        finally:
+            if not discovery.done():
+                discovery.cancel()
+        # Surfaces a fatal discovery error (an unknown destination yields no places to score)
+        await discovery
+        scorer.rank_results(scores)
+
+        generator = TripItineraryGenerator(self.gemini_api_key)
+        itinerary_task = loop.run_in_executor(None, generator.build_itinerary, trip_details,
+                                              {'attractions': scores['attractions']},
+                                              {'restaurants': scores['restaurants']},
+                                              {'lodging': scores['lodging']})
+        if self.sink:
+            # Intermediate results are written while the itinerary is being generated
+            await loop.run_in_executor(None, self.sink.write_places, places)
+            await loop.run_in_executor(None, self.sink.write_scores, scorer, scores)
+        itinerary = await itinerary_task
+        if self.sink:
+            self.sink.write_itinerary(generator, itinerary)
+
+        return {
+            "trip_details": trip_details,
+            "places": places,
+            "scores": scores,
+            "itinerary": itinerary
+        }
@@ -0,0 +1,83 @@
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+from sqlite_cache import SQLiteCache
+
+DEFAULT_PLACE_CACHE_PATH = "place_details_cache.sqlite"
+DEFAULT_PLACE_CACHE_TTL_SECONDS = 3 * 24 * 60 * 60
+DEFAULT_PLACE_CACHE_MAX_ENTRIES = 20000
+
+
+def field_set_key(fields: List[str]) -> str:
+    """Return a short, order-independent identifier for a Places field set."""
+    return hashlib.sha1(",".join(sorted(fields)).encode("utf-8")).hexdigest()[:12]
+
+
+class PlaceDetailsCache:
+    """
+    Persistent cache for Google Places Details responses.
+
+    Entries are keyed by (place_id, field set, language). The cache also
+    remembers which field set actually succeeded for a requested field set,
+    so a place that needed the basic-fields fallback goes straight to it on
+    the next run instead of repeating the failing request first.
+    """
+
+    def __init__(self, path: str = DEFAULT_PLACE_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_PLACE_CACHE_TTL_SECONDS,
+                 max_entries: int = DEFAULT_PLACE_CACHE_MAX_ENTRIES):
+        self._details = SQLiteCache(path, ttl_seconds, max_entries, table="place_details")
+        self._field_sets = SQLiteCache(path, ttl_seconds, max_entries, table="place_field_sets")
+        self.saved_requests = 0
+        self.saved_seconds = 0.0
+        self.fallbacks_skipped = 0
+
+    @staticmethod
+    def _key(place_id: str, fields: List[str], language: str) -> str:
+        return f"{place_id}|{field_set_key(fields)}|{language}"
+
+    def lookup(self, place_id: str, requested_fields: List[str],
+               language: str) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+        """
+        Resolve the field set to request for a place and look up cached details.
+
+        Returns:
+            tuple: The field set known to succeed for this place (or the requested
+                   one) and the cached details for it, or None on a miss.
+        """
+        fields = self._field_sets.get(self._key(place_id, requested_fields, language)) or requested_fields
+        entry = self._details.get(self._key(place_id, fields, language))
+        if entry is None:
+            if fields != requested_fields:
+                # The failing first request will be skipped when this is fetched
+                self.fallbacks_skipped += 1
+            return fields, None
+        self.saved_requests += entry['requests']
+        self.saved_seconds += entry['fetch_seconds']
+        return fields, entry['result']
+
+    def set(self, place_id: str, fields: List[str], language: str, result: Dict[str, Any],
+            fetch_seconds: float, requests: int = 1):
+        """Store details along with the cost (requests and seconds) of fetching them."""
+        self._details.set(self._key(place_id, fields, language), {
+            'result': result,
+            'fetch_seconds': fetch_seconds,
+            'requests': requests
+        })
+
+    def record_resolved_fields(self, place_id: str, requested_fields: List[str], language: str,
+                               resolved_fields: List[str]):
+        """Remember that `resolved_fields` is what works when `requested_fields` is asked for."""
+        self._field_sets.set(self._key(place_id, requested_fields, language), resolved_fields)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the API requests and seconds saved so far."""
+        details_stats = self._details.stats()
+        return {
+            'hits': details_stats['hits'],
+            'misses': details_stats['misses'],
+            'hit_rate': details_stats['hit_rate'],
+            'entries': details_stats['entries'],
+            'saved_requests': self.saved_requests + self.fallbacks_skipped,
+            'saved_seconds': round(self.saved_seconds, 2),
+            'fallbacks_skipped': self.fallbacks_skipped
+        }
@@ -1,53 +1,148 @@
-import requests
+import asyncio
 import json
 from datetime import datetime
+from geo_clustering import cluster_search_anchors
+import backend_path  # noqa: F401  (makes the shared backend clients importable)
+from app.core.google_places.places_client import PlacesApiError, PlacesClient
 
-def generate_places_api_calls(trip_data, google_places_api_key):
+# Upper bound on Places requests in flight at once (also the connection pool size)
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+REQUEST_TIMEOUT_SECONDS = 15
+
+# Restaurant searches use this radius around each anchor; POIs closer than the
+# merge distance to an existing anchor share its search (the circles overlap by ~80%)
+RESTAURANT_SEARCH_RADIUS_METERS = 1500
+DEFAULT_ANCHOR_MERGE_DISTANCE_METERS = 500
+
+# Pages (of up to 20 results) fetched per nearby search. Google only accepts a
+# next_page_token a couple of seconds after it is issued. Pagination is opt-in:
+# one page keeps places.json as it was, more find more candidates in big cities.
+DEFAULT_MAX_PAGES = 1
+NEXT_PAGE_TOKEN_DELAY_SECONDS = 2
+NEXT_PAGE_TOKEN_RETRIES = 3
+
+PLACE_CATEGORIES = ("lodging", "attractions", "restaurants")
+
+
+async def iter_nearby_search(client, params, max_pages=DEFAULT_MAX_PAGES):
     """
-    Generates Google Places API calls for lodging, attractions, and nearby restaurants,
-    aligning with user's specific needs.
+    Yield the result pages of a Nearby Search, following next_page_token.
 
     Args:
-        trip_data (dict): A dictionary containing trip information, including:
-            - "destination" (str): The primary destination for the trip.
-            - "dates_of_travel" (dict): {"start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}
-            - "accessibility_needs" (str): User's accessibility requirements.
-            - "dietary_needs" (str): User's dietary restrictions.
-            - "interests" (list): List of user's interests.
-            - Other fields as per the user's provided format.
-        google_places_api_key (str): Your Google Places API key.
+        client (PlacesClient): Shared Places client.
+        params (dict): Query parameters for the first page.
+        max_pages (int): Maximum number of pages to fetch.
 
-    Returns:
-        dict: A dictionary containing the actual API responses for lodging, attractions,
-              and restaurants, or error messages if calls fail.
+    Yields:
+        dict: Each page's decoded response, as soon as it arrives.
+    """
+    data = await client.get_json_async("nearbysearch", params)
+    yield data
+    pages = 1
+    while pages < max_pages and data.get("next_page_token"):
+        page_params = {"pagetoken": data["next_page_token"]}
+        for _ in range(NEXT_PAGE_TOKEN_RETRIES):
+            # The token becomes valid shortly after it is issued; until then Google answers INVALID_REQUEST
+            await asyncio.sleep(NEXT_PAGE_TOKEN_DELAY_SECONDS)
+            data = await client.get_json_async("nearbysearch", page_params)
+            if data.get("status") != "INVALID_REQUEST":
+                break
+        if data.get("status") == "INVALID_REQUEST":
+            return
+        yield data
+        pages += 1
+
+
+def _accessible_places(data, user_accessibility_needs):
+    """Yield place entries from a nearby-search page that match the user's accessibility needs."""
+    for place in data.get("results", []):
+        # Simple check for accessibility in name/types - for more robust, need Place Details
+        place_name = place.get("name", "").lower()
+        place_types = [t.lower() for t in place.get("types", [])]
+
+        is_accessible_match = True
+        if "wheelchair accessible" in user_accessibility_needs:
+            # Very basic check: does "wheelchair" appear in name or type?
+            if "wheelchair" not in place_name and "wheelchair_accessible" not in place_types:
+                is_accessible_match = False
+
+        if is_accessible_match:
+            if "geometry" in place and "location" in place["geometry"]:
+                yield {
+                    "name": place.get("name"),
+                    "address": place.get("vicinity") or place.get("formatted_address"),
+                    "location": place["geometry"]["location"],
+                    "place_id": place.get("place_id")
+                }
+
+
+async def stream_places(trip_data, google_places_api_key,
+                        max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                        anchor_merge_distance_m=DEFAULT_ANCHOR_MERGE_DISTANCE_METERS,
+                        max_pages=DEFAULT_MAX_PAGES, places_client=None):
+    """
+    Discover lodging, attractions and restaurants for a trip as an async stream.
+
+    After geocoding the destination, the lodging and attractions searches run
+    concurrently and each follows next_page_token for up to `max_pages` pages.
+    Places are yielded as soon as their page arrives, so a consumer (such as
+    PlaceScorer.score_places_stream) can start working before the searches
+    finish. Restaurant searches then fan out over the clustered anchors with at
+    most `max_concurrent_requests` in flight on one pooled HTTP session; they
+    follow further pages (up to `max_pages`) only while an anchor's restaurant
+    limit is not filled.
+    Pass `places_client` to reuse an existing PlacesClient; otherwise one is
+    created for the stream and closed when it ends.
+
+    Lodging and attractions within `anchor_merge_distance_m` of each other
+    share one restaurant search, which keeps MAX_RESTAURANTS_PER_POI
+    restaurants for each POI it covers.
+
+    Yields:
+        tuple: (kind, payload) where kind is one of:
+            - "destination_info": the geocoded destination
+            - "lodging", "attractions", "restaurants": one place entry
+            - "lodging_error", "attractions_error", "restaurants_error": a failure message
+            - "restaurant_search_clusters": each anchor with the POIs it covers and
+              the restaurants its search returned (not written to places.json)
+            - "error": a fatal failure; nothing follows it
     """
 
-    base_url = "https://maps.googleapis.com/maps/api/place/"
     destination = trip_data.get("destination")
 
     if not destination:
         print("Error: 'destination' is missing from trip_data.")
-        return {"error": "'destination' is missing from trip_data."}
+        yield "error", "'destination' is missing from trip_data."
+        return
 
     print(f"--- Making Google Places API calls for destination: {destination} ---")
 
+    client = places_client or PlacesClient(google_places_api_key, timeout_seconds=REQUEST_TIMEOUT_SECONDS,
+                                           pool_size=max_concurrent_requests)
+    try:
+        async for event in _stream_places_searches(client, destination, trip_data,
+                                                   max_concurrent_requests, anchor_merge_distance_m, max_pages):
+            yield event
+    finally:
+        if places_client is None:
+            await client.aclose()
+
+
+async def _stream_places_searches(client, destination, trip_data,
+                                  max_concurrent_requests, anchor_merge_distance_m, max_pages):
     dest_lat = None
     dest_lng = None
     destination_name = None
 
     # Step 1: Find the latitude and longitude of the main destination
-    find_place_url = f"{base_url}findplacefromtext/json"
     find_place_params = {
         "input": destination,
         "inputtype": "textquery",
-        "fields": "geometry,name,place_id",
-        "key": google_places_api_key
+        "fields": "geometry,name,place_id"
     }
     print("\n--- Calling Find Place from Text API (to get destination coordinates and place_id) ---")
     try:
-        response = requests.get(find_place_url, params=find_place_params)
-        response.raise_for_status()
-        data = response.json()
+        data = await client.get_json_async("findplacefromtext", find_place_params)
 
         if data and data.get("candidates"):
             location = data["candidates"][0]["geometry"]["location"]
@@ -58,10 +153,18 @@ def generate_places_api_calls(trip_data, google_places_api_key):
             print(f"Found destination coordinates for {destination_name}: Lat={dest_lat}, Lng={dest_lng}, Place ID={destination_place_id}")
         else:
             print(f"Could not find coordinates for the destination: {destination}. Response: {data}")
-            return {"error": f"Could not find coordinates for {destination}"}
-    except requests.exceptions.RequestException as e:
+            yield "error", f"Could not find coordinates for {destination}"
+            return
+    except PlacesApiError as e:
         print(f"Error making Find Place API call: {e}")
-        return {"error": f"Find Place API call failed: {e}"}
+        yield "error", f"Find Place API call failed: {e}"
+        return
+
+    yield "destination_info", {
+        "name": destination_name,
+        "location": {"lat": dest_lat, "lng": dest_lng},
+        "place_id": destination_place_id
+    }
 
     # Calculate length of stay for attractions radius
     length_of_stay_days = 0
@@ -90,20 +193,7 @@ def generate_places_api_calls(trip_data, google_places_api_key):
     user_dietary_needs = trip_data.get("dietary_needs", "").lower()
     user_interests = [interest.lower() for interest in trip_data.get("interests", [])]
 
-    # Store locations of found lodging and attractions to find nearby restaurants
-    found_poi_locations = []
-    results_summary = {
-        "destination_info": {
-            "name": destination_name,
-            "location": {"lat": dest_lat, "lng": dest_lng},
-            "place_id": destination_place_id
-        },
-        "lodging": [],
-        "attractions": [],
-        "restaurants": []
-    }
-
-    # Step 2: Find Lodging options around the destination
+    # Step 2: Lodging options around the destination
     lodging_keywords = ["hotel", "resort", "motel", "accommodation"]
     if "wheelchair accessible" in user_accessibility_needs:
         lodging_keywords.append("wheelchair accessible") # Add as keyword for bias
@@ -111,44 +201,10 @@ def generate_places_api_calls(trip_data, google_places_api_key):
         "location": f"{dest_lat},{dest_lng}",
         "radius": 5000,
         "type": "lodging",
-        "keyword": " OR ".join(lodging_keywords),
-        "key": google_places_api_key
+        "keyword": " OR ".join(lodging_keywords)
     }
-    print("\n--- Calling Nearby Search API for Lodging (with accessibility bias) ---")
-    lodging_url = f"{base_url}nearbysearch/json"
-    try:
-        response = requests.get(lodging_url, params=lodging_params)
-        response.raise_for_status()
-        data = response.json()
-        if data and data.get("results"):
-            for place in data["results"]:
-                # Simple check for accessibility in name/types - for more robust, need Place Details
-                place_name = place.get("name", "").lower()
-                place_types = [t.lower() for t in place.get("types", [])]
-
-                is_accessible_match = True
-                if "wheelchair accessible" in user_accessibility_needs:
-                    # Very basic check: does "wheelchair" appear in name or type?
-                    if "wheelchair" not in place_name and "wheelchair_accessible" not in place_types:
-                        is_accessible_match = False
-
-                if is_accessible_match:
-                    if "geometry" in place and "location" in place["geometry"]:
-                        found_poi_locations.append(place["geometry"]["location"])
-                        results_summary["lodging"].append({
-                            "name": place.get("name"),
-                            "address": place.get("vicinity") or place.get("formatted_address"),
-                            "location": place["geometry"]["location"],
-                            "place_id": place.get("place_id")
-                        })
-            print(f"Found {len(results_summary['lodging'])} lodging options aligning with needs.")
-        else:
-            print("No lodging options found.")
-    except requests.exceptions.RequestException as e:
-        print(f"Error making Lodging Nearby Search API call: {e}")
-        results_summary["lodging_error"] = f"Lodging search failed: {e}"
 
-    # Step 3: Find Attractions around the destination
+    # Step 3: Attractions around the destination
     attraction_keywords = ["tourist_attraction", "sightseeing"]
     attraction_keywords.extend(user_interests) # Add user interests as keywords
     if "wheelchair accessible" in user_accessibility_needs:
@@ -158,109 +214,204 @@ def generate_places_api_calls(trip_data, google_places_api_key):
         "location": f"{dest_lat},{dest_lng}",
         "radius": attractions_radius,
         "type": "tourist_attraction", # Use one type, keywords cover broader
-        "keyword": " OR ".join(set(attraction_keywords)), # Use set to avoid duplicate keywords
-        "key": google_places_api_key
+        "keyword": " OR ".join(set(attraction_keywords)) # Use set to avoid duplicate keywords
     }
-    print("\n--- Calling Nearby Search API for Attractions (with interests and accessibility bias) ---")
-    attractions_url = f"{base_url}nearbysearch/json"
-    try:
-        response = requests.get(attractions_url, params=attractions_params)
-        response.raise_for_status()
-        data = response.json()
-        if data and data.get("results"):
-            for place in data["results"]:
-                # Simple check for accessibility in name/types
-                place_name = place.get("name", "").lower()
-                place_types = [t.lower() for t in place.get("types", [])]
-
-                is_accessible_match = True
-                if "wheelchair accessible" in user_accessibility_needs:
-                    if "wheelchair" not in place_name and "wheelchair_accessible" not in place_types:
-                        is_accessible_match = False
-
-                if is_accessible_match:
-                    if "geometry" in place and "location" in place["geometry"]:
-                        found_poi_locations.append(place["geometry"]["location"])
-                        results_summary["attractions"].append({
-                            "name": place.get("name"),
-                            "address": place.get("vicinity") or place.get("formatted_address"),
-                            "location": place["geometry"]["location"],
-                            "place_id": place.get("place_id")
-                        })
-            print(f"Found {len(results_summary['attractions'])} attractions aligning with needs.")
-        else:
-            print("No attractions found.")
-    except requests.exceptions.RequestException as e:
-        print(f"Error making Attractions Nearby Search API call: {e}")
-        results_summary["attractions_error"] = f"Attractions search failed: {e}"
 
+    # Steps 2 and 3 only depend on the destination, so their pages are fetched
+    # concurrently and funnelled through one queue as they arrive
+    print("\n--- Calling Nearby Search API for Lodging and Attractions concurrently (with interests and accessibility bias) ---")
+    pages = asyncio.Queue()
+
+    async def fetch_pages(category, params):
+        try:
+            async for page in iter_nearby_search(client, params, max_pages):
+                await pages.put((category, page))
+        except PlacesApiError as e:
+            await pages.put((category, e))
+        finally:
+            await pages.put((category, None))
+
+    search_tasks = [
+        asyncio.create_task(fetch_pages("lodging", lodging_params)),
+        asyncio.create_task(fetch_pages("attractions", attractions_params))
+    ]
+    # POIs are kept per category so restaurant anchors do not depend on page arrival order
+    found_pois = {"lodging": [], "attractions": []}
+    labels = {"lodging": ("Lodging", "lodging options"), "attractions": ("Attractions", "attractions")}
+    try:
+        pending_searches = len(search_tasks)
+        while pending_searches:
+            category, page = await pages.get()
+            title, noun = labels[category]
+            if page is None:
+                pending_searches -= 1
+                if found_pois[category]:
+                    print(f"Found {len(found_pois[category])} {noun} aligning with needs.")
+                else:
+                    print(f"No {noun} found.")
+            elif isinstance(page, BaseException):
+                print(f"Error making {title} Nearby Search API call: {page}")
+                yield f"{category}_error", f"{title} search failed: {page}"
+            else:
+                for place in _accessible_places(page, user_accessibility_needs):
+                    found_pois[category].append(place)
+                    yield category, place
+    finally:
+        for task in search_tasks:
+            task.cancel()
 
     # Step 4: Find Restaurants near the found lodging and attractions
-    restaurant_api_calls_made = []
-    processed_locations = set()
-    MAX_RESTAURANTS_PER_LOCATION = 2
+    MAX_RESTAURANTS_PER_POI = 2
+    all_pois = found_pois["lodging"] + found_pois["attractions"]
 
     print("\n--- Calling Nearby Search API for Restaurants (near found lodging/attractions, with dietary bias) ---")
-    if not found_poi_locations:
+    if not all_pois:
         print("No lodging or attractions found to base restaurant searches on.")
 
-    for loc in found_poi_locations:
-        loc_tuple = (loc["lat"], loc["lng"])
-        if loc_tuple not in processed_locations:
-            processed_locations.add(loc_tuple)
-
-            restaurant_keywords = ["food", "dine", "cafe", "restaurant"]
-            if user_dietary_needs:
-                restaurant_keywords.append(user_dietary_needs) # Add dietary need as keyword for bias
-
-            restaurant_params = {
-                "location": f"{loc['lat']},{loc['lng']}",
-                "radius": 1500,
-                "type": "restaurant",
-                "keyword": " OR ".join(set(restaurant_keywords)),
-                "key": google_places_api_key
-            }
-            restaurant_url = f"{base_url}nearbysearch/json" 
+    # Merge POIs whose search circles overlap heavily into shared anchors
+    clusters = cluster_search_anchors(all_pois, anchor_merge_distance_m)
+    print(f"Clustered {len(all_pois)} lodging/attraction locations into {len(clusters)} restaurant search anchors.")
+
+    restaurant_keywords = ["food", "dine", "cafe", "restaurant"]
+    if user_dietary_needs:
+        restaurant_keywords.append(user_dietary_needs) # Add dietary need as keyword for bias
+    restaurant_keyword = " OR ".join(set(restaurant_keywords))
+
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+    async def search_restaurants(loc, limit):
+        """The first `limit` restaurants near `loc`, following up to max_pages pages to fill them"""
+        restaurant_params = {
+            "location": f"{loc['lat']},{loc['lng']}",
+            "radius": RESTAURANT_SEARCH_RADIUS_METERS,
+            "type": "restaurant",
+            "keyword": restaurant_keyword
+        }
+        async with semaphore:
+            print(f"Searching restaurants near Lat={loc['lat']}, Lng={loc['lng']}")
+            results = []
             try:
-                print(f"Searching restaurants near Lat={loc['lat']}, Lng={loc['lng']}")
-                response = requests.get(restaurant_url, params=restaurant_params)
-                response.raise_for_status()
-                data = response.json()
-                if data and data.get("results"):
-                    # Limit the number of restaurants to MAX_RESTAURANTS_PER_LOCATION
-                    restaurants_for_this_location = data["results"][:MAX_RESTAURANTS_PER_LOCATION]
-                    for place in restaurants_for_this_location:
-                        # Basic dietary check (already biased by keyword, but can refine)
-                        place_name = place.get("name", "").lower()
-                        place_types = [t.lower() for t in place.get("types", [])]
-                        
-                        is_dietary_match = True
-                        if user_dietary_needs:
-                            # A more robust check might involve parsing reviews or Place Details,
-                            # but for now, we rely on keyword biasing and a basic name/type check.
-                            if user_dietary_needs not in place_name and user_dietary_needs not in " ".join(place_types):
-                                # This is a very simple check, the keyword in API params does most of the work
-                                pass # Keep it simple as keyword biasing is primary
-
-                        if is_dietary_match:
-                            results_summary["restaurants"].append({
-                                "name": place.get("name"),
-                                "address": place.get("vicinity") or place.get("formatted_address"),
-                                "location": place.get("geometry", {}).get("location"),
-                                "place_id": place.get("place_id")
-                            })
-                    print(f"  Found {len(restaurants_for_this_location)} restaurants (limited to {MAX_RESTAURANTS_PER_LOCATION}) aligning with needs.")
-                else:
-                    print(f"  No restaurants found near Lat={loc['lat']}, Lng={loc['lng']}.")
-                restaurant_api_calls_made.append(data)
-            except requests.exceptions.RequestException as e:
-                print(f"Error making Restaurant Nearby Search API call near {loc_tuple}: {e}")
-                results_summary["restaurants_error"] = f"Restaurant search failed near {loc_tuple}: {e}"
+                async for page in iter_nearby_search(client, restaurant_params, max_pages):
+                    results.extend(page.get("results", []))
+                    if len(results) >= limit:
+                        break
+            except PlacesApiError as e:
+                return e
+            return results[:limit]
+
+    # A shared search keeps as many restaurants as its POIs' own searches would have
+    restaurant_tasks = [
+        asyncio.create_task(search_restaurants(cluster["center"],
+                                               MAX_RESTAURANTS_PER_POI * len(cluster["poi_place_ids"])))
+        for cluster in clusters
+    ]
+
+    # All searches are in flight; results are yielded in anchor order as each one completes
+    seen_restaurant_ids = set()
+    search_clusters = []
+    try:
+        for cluster, task in zip(clusters, restaurant_tasks):
+            data = await task
+            loc = cluster["center"]
+            loc_tuple = (loc["lat"], loc["lng"])
+            cluster_restaurant_ids = []
+            if isinstance(data, BaseException):
+                print(f"Error making Restaurant Nearby Search API call near {loc_tuple}: {data}")
+                yield "restaurants_error", f"Restaurant search failed near {loc_tuple}: {data}"
+            elif data:
+                # Limited to MAX_RESTAURANTS_PER_POI per covered POI by the search
+                restaurants_for_this_location = data
+                for place in restaurants_for_this_location:
+                    cluster_restaurant_ids.append(place.get("place_id"))
+                    # Neighbouring anchors can still return the same restaurant
+                    if place.get("place_id") in seen_restaurant_ids:
+                        continue
+                    seen_restaurant_ids.add(place.get("place_id"))
+                    # Dietary needs are applied as a keyword bias in the search itself
+                    yield "restaurants", {
+                        "name": place.get("name"),
+                        "address": place.get("vicinity") or place.get("formatted_address"),
+                        "location": place.get("geometry", {}).get("location"),
+                        "place_id": place.get("place_id")
+                    }
+                print(f"  Found {len(restaurants_for_this_location)} restaurants (limited to "
+                      f"{MAX_RESTAURANTS_PER_POI * len(cluster['poi_place_ids'])}) near {loc_tuple}.")
+            else:
+                print(f"  No restaurants found near Lat={loc['lat']}, Lng={loc['lng']}.")
+            search_clusters.append({
+                "center": loc,
+                "poi_place_ids": cluster["poi_place_ids"],
+                "restaurant_place_ids": cluster_restaurant_ids
+            })
+    finally:
+        for task in restaurant_tasks:
+            task.cancel()
+
+    yield "restaurant_search_clusters", search_clusters
+
+
+def new_places_summary():
+    """Return an empty places.json structure for record_place_event to fill."""
+    return {
+        "destination_info": None,
+        "lodging": [],
+        "attractions": [],
+        "restaurants": []
+    }
+
+
+def record_place_event(results_summary, kind, payload):
+    """Apply one stream_places event to a places.json structure."""
+    if kind in PLACE_CATEGORIES:
+        results_summary[kind].append(payload)
+    elif kind == "restaurant_search_clusters":
+        # Bookkeeping for stream consumers; places.json keeps its original keys
+        return
+    else:
+        # Failure messages keep the last one reported, as the sequential search did
+        results_summary[kind] = payload
+
+
+async def generate_places_api_calls_async(trip_data, google_places_api_key,
+                                          max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS,
+                                          anchor_merge_distance_m=DEFAULT_ANCHOR_MERGE_DISTANCE_METERS,
+                                          max_pages=DEFAULT_MAX_PAGES):
+    """
+    Async version of generate_places_api_calls: collects stream_places into places.json.
+    """
+    results_summary = new_places_summary()
+    async for kind, payload in stream_places(trip_data, google_places_api_key, max_concurrent_requests,
+                                             anchor_merge_distance_m, max_pages):
+        if kind == "error":
+            return {"error": payload}
+        record_place_event(results_summary, kind, payload)
 
     print("\n--- End of API Calls ---")
     with open("places.json", "w") as file:
         file.write(json.dumps(results_summary, indent=2))
 
+
+def generate_places_api_calls(trip_data, google_places_api_key):
+    """
+    Generates Google Places API calls for lodging, attractions, and nearby restaurants,
+    aligning with user's specific needs.
+
+    Args:
+        trip_data (dict): A dictionary containing trip information, including:
+            - "destination" (str): The primary destination for the trip.
+            - "dates_of_travel" (dict): {"start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}
+            - "accessibility_needs" (str): User's accessibility requirements.
+            - "dietary_needs" (str): User's dietary restrictions.
+            - "interests" (list): List of user's interests.
+            - Other fields as per the user's provided format.
+        google_places_api_key (str): Your Google Places API key.
+
+    Returns:
+        dict: A dictionary containing the actual API responses for lodging, attractions,
+              and restaurants, or error messages if calls fail.
+    """
+    return asyncio.run(generate_places_api_calls_async(trip_data, google_places_api_key))
+
 # Sample trip data based on the format you provided
 sample_trip_data = {
     "budget": "moderate",
@@ -0,0 +1,116 @@
+import json
+from typing import Any, Dict, List
+
+# Place Details fields each category's scoring criteria actually use
+CATEGORY_FIELDS = {
+    'lodging': [
+        'formatted_address',
+        'rating',
+        'user_ratings_total',
+        'price_level',
+        'types',
+        'editorial_summary',
+        'wheelchair_accessible_entrance',
+        'reviews'
+    ],
+    'restaurant': [
+        'rating',
+        'user_ratings_total',
+        'price_level',
+        'types',
+        'editorial_summary',
+        'wheelchair_accessible_entrance',
+        'serves_vegetarian_food',
+        'serves_vegan_food',
+        'dine_in',
+        'reservable',
+        'serves_beer',
+        'serves_wine',
+        'live_music',
+        'good_for_groups',
+        'reviews'
+    ],
+    'attraction': [
+        'rating',
+        'user_ratings_total',
+        'price_level',
+        'types',
+        'editorial_summary',
+        'wheelchair_accessible_entrance',
+        'opening_hours',
+        'live_music',
+        'good_for_groups',
+        'reviews'
+    ]
+}
+
+# Generic Places types that say nothing about a place
+IGNORED_TYPES = {'point_of_interest', 'establishment'}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini prompts (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+class FullDetails:
+    """Pass-through compactor that embeds the full Places response, as scoring originally did."""
+
+    def compact(self, place_type: str, place_details: Dict[str, Any]) -> Dict[str, Any]:
+        return place_details
+
+    def serialize(self, value: Any) -> str:
+        return json.dumps(value, indent=2)
+
+
+class DetailCompactor:
+    """
+    Shrinks Place Details before they are embedded in a scoring prompt.
+
+    Details are projected to the fields the category's criteria use, reviews
+    are sampled and truncated, opening hours are reduced to their weekday
+    text, and the result is serialized without indentation. Any object with
+    `compact(place_type, place_details)` and `serialize(value)` methods can be
+    passed to PlaceScorer in its place.
+    """
+
+    def __init__(self, max_reviews: int = 3, max_review_chars: int = 280,
+                 category_fields: Dict[str, List[str]] = None):
+        self.max_reviews = max_reviews
+        self.max_review_chars = max_review_chars
+        self.category_fields = category_fields or CATEGORY_FIELDS
+
+    def compact(self, place_type: str, place_details: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the subset of `place_details` relevant to scoring a `place_type`."""
+        compacted = {}
+        for field in self.category_fields.get(place_type, []):
+            value = place_details.get(field)
+            if value is None:
+                continue
+            if field == 'reviews':
+                value = self._sample_reviews(value)
+            elif field == 'editorial_summary':
+                value = value.get('overview') if isinstance(value, dict) else value
+            elif field == 'opening_hours':
+                value = value.get('weekday_text') if isinstance(value, dict) else value
+            elif field == 'types':
+                value = [type_name for type_name in value if type_name not in IGNORED_TYPES]
+            # Keep explicit False/0 values; they matter for accessibility and price
+            if value not in (None, '', [], {}):
+                compacted[field] = value
+        return compacted
+
+    def _sample_reviews(self, reviews: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the most informative reviews: the longest ones, truncated, with their ratings."""
+        with_text = [review for review in reviews if review.get('text')]
+        with_text.sort(key=lambda review: len(review['text']), reverse=True)
+        sampled = []
+        for review in with_text[:self.max_reviews]:
+            text = review['text'].strip()
+            if len(text) > self.max_review_chars:
+                text = text[:self.max_review_chars].rstrip() + '...'
+            sampled.append({'rating': review.get('rating'), 'text': text})
+        return sampled
+
+    def serialize(self, value: Any) -> str:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
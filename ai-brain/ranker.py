@@ -1,98 +1,211 @@
+import asyncio
 import json
 import os
 import time
-from typing import Dict, List, Any
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 import google.generativeai as genai
 from datetime import datetime
+from rate_limiter import TokenBucket
+from place_cache import PlaceDetailsCache
+from prompt_compaction import DetailCompactor, estimate_tokens
+from score_cache import ScoreCache, trip_preference_fingerprint
+import backend_path  # noqa: F401  (makes the shared backend clients importable)
+from app.core.google_places.places_client import PlacesClient
+from app.core.ai_engine import get_llm_gateway
+
+# Concurrency and per-upstream request rates for the scoring engine
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PLACES_REQUESTS_PER_SECOND = 10.0
+DEFAULT_GEMINI_REQUESTS_PER_SECOND = 4.0
+
+# Bump whenever scoring prompts or criteria change so cached scores are not reused
+SCORING_PROMPT_VERSION = "1"
+
+# Places of one category scored per Gemini call; 1 scores each place separately
+DEFAULT_BATCH_SIZE = 20
+
+# Place Details fields requested for scoring, using the official API field names
+DETAIL_FIELDS = [
+    'name',
+    'formatted_address',
+    'geometry/location',
+    'rating',
+    'user_ratings_total',
+    'price_level',
+    'types',
+    'opening_hours',
+    'website',
+    'formatted_phone_number',
+    'reviews',
+    'editorial_summary',
+    'wheelchair_accessible_entrance',
+    'serves_vegetarian_food',
+    'serves_vegan_food',
+    'dine_in',
+    'delivery',
+    'takeout',
+    'reservable',
+    'serves_breakfast',
+    'serves_lunch',
+    'serves_dinner',
+    'serves_beer',
+    'serves_wine',
+    'live_music',
+    'good_for_groups'
+]
+
+# Fallback field set for places that reject some of the fields above
+BASIC_DETAIL_FIELDS = [
+    'name',
+    'formatted_address',
+    'geometry/location',
+    'rating',
+    'user_ratings_total',
+    'price_level',
+    'types',
+    'website',
+    'wheelchair_accessible_entrance'
+]
+
+# Output category -> place type used in scoring prompts
+CATEGORY_PLACE_TYPES = {
+    'lodging': 'lodging',
+    'restaurants': 'restaurant',
+    'attractions': 'attraction'
+}
+
+# Category-specific scoring criteria embedded in every scoring prompt
+SCORING_CRITERIA = {
+    'lodging': """
+        LODGING SCORING CRITERIA (weight accordingly):
+        1. Wheelchair accessibility (30 points) - Essential due to walker
+        2. Location convenience (20 points) - Close to attractions, minimal travel needed
+        3. Price/Budget fit (20 points) - Within budget for 4 people for 2 nights
+        4. Reviews/Rating (15 points) - Quality and guest satisfaction
+        5. Amenities for young adults (15 points) - WiFi, common areas, etc.
+        """,
+    'restaurant': """
+        RESTAURANT SCORING CRITERIA (weight accordingly):
+        1. Vegetarian options (25 points) - Must have good vegetarian menu
+        2. Wheelchair accessibility (25 points) - Essential due to walker
+        3. Music/Atmosphere (20 points) - Aligns with music interest
+        4. Price range (15 points) - Reasonable for young adults
+        5. Reviews/Rating (15 points) - Food quality and service
+        """,
+    'attraction': """
+        ATTRACTION SCORING CRITERIA (weight accordingly):
+        1. Wheelchair accessibility (30 points) - Essential due to walker
+        2. Music relevance (25 points) - Aligns with music interest
+        3. Relaxed pace friendly (20 points) - Not too demanding or rushed
+        4. Group friendly (15 points) - Good for friends in their 20s
+        5. Value/Cost (10 points) - Worth the price
+        """
+}
+
+# Structured-output schema for batch scoring: one entry per place, keyed by place_id
+BATCH_SCORE_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'place_id': {'type': 'STRING'},
+            'score': {'type': 'INTEGER'},
+            'reasoning': {'type': 'STRING'}
+        },
+        'required': ['place_id', 'score', 'reasoning']
+    }
+}
 
 class PlaceScorer:
-    def __init__(self, google_api_key: str, gemini_api_key: str):
-        """Initialize the PlaceScorer with API keys."""
+    def __init__(self, google_api_key: str, gemini_api_key: str,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 places_requests_per_second: float = DEFAULT_PLACES_REQUESTS_PER_SECOND,
+                 gemini_requests_per_second: float = DEFAULT_GEMINI_REQUESTS_PER_SECOND,
+                 details_cache: Optional[PlaceDetailsCache] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 compactor: Optional[Any] = None,
+                 score_cache: Optional[ScoreCache] = None,
+                 trip_details: Optional[Dict] = None,
+                 places_data: Optional[Dict] = None,
+                 places_client: Optional[PlacesClient] = None):
+        """Initialize the PlaceScorer with API keys, concurrency, caching and prompt compaction settings."""
         self.google_api_key = google_api_key
         self.gemini_api_key = gemini_api_key
         
-        # Configure Gemini
-        genai.configure(api_key=gemini_api_key)
-        self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        # Scoring runs on a thread pool; each upstream gets its own rate limiter
+        self.max_workers = max_workers
+        self.places_limiter = TokenBucket(places_requests_per_second)
+        self.gemini_limiter = TokenBucket(gemini_requests_per_second)
+        self.batch_size = batch_size
+        
+        # Place Details share one pooled, retrying HTTP client across worker threads
+        self.places_client = places_client if places_client is not None else PlacesClient(
+            google_api_key, pool_size=max_workers)
+        
+        # Place Details responses persist across runs and trips
+        self.details_cache = details_cache if details_cache is not None else PlaceDetailsCache()
+        
+        # Place Details are compacted before being embedded in scoring prompts
+        self.compactor = compactor if compactor is not None else DetailCompactor()
+        self.tokens_saved = {}
+        
+        # Gemini scores are memoized across trips with the same preference profile
+        self.score_cache = score_cache if score_cache is not None else ScoreCache()
+        self.prompt_version = f"{SCORING_PROMPT_VERSION}:{type(self.compactor).__name__}"
+        
+        # Gemini models are shared process-wide through the LLM gateway
+        self.llm = get_llm_gateway(gemini_api_key)
         
         # Load data
-        self.load_data()
+        self.load_data(trip_details, places_data)
         
-    def load_data(self):
-        """Load places and trip details from JSON files."""
-        with open('places.json', 'r') as f:
-            self.places_data = json.load(f)
+    def load_data(self, trip_details: Optional[Dict] = None, places_data: Optional[Dict] = None):
+        """
+        Load places and trip details, reading places.json / trip_details.json for any not given.
         
-        with open('trip_details.json', 'r') as f:
-            self.trip_details = json.load(f)
+        Pass places_data={} when places will be streamed into score_places_stream instead.
+        """
+        if places_data is None:
+            with open('places.json', 'r') as f:
+                places_data = json.load(f)
+        self.places_data = places_data
+        
+        if trip_details is None:
+            with open('trip_details.json', 'r') as f:
+                trip_details = json.load(f)
+        self.trip_details = trip_details
+        self.preference_fingerprint = trip_preference_fingerprint(self.trip_details)
     
     def get_place_details(self, place_id: str) -> Dict[str, Any]:
-        """Fetch detailed information about a place from Google Places API."""
-        # Using correct field names from the official API documentation
-        fields = [
-            'name',
-            'formatted_address',
-            'geometry/location',
-            'rating',
-            'user_ratings_total',
-            'price_level',
-            'types',
-            'opening_hours',
-            'website',
-            'formatted_phone_number',
-            'reviews',
-            'editorial_summary',
-            'wheelchair_accessible_entrance',
-            'serves_vegetarian_food',
-            'serves_vegan_food',
-            'dine_in',
-            'delivery',
-            'takeout',
-            'reservable',
-            'serves_breakfast',
-            'serves_lunch',
-            'serves_dinner',
-            'serves_beer',
-            'serves_wine',
-            'live_music',
-            'good_for_groups'
-        ]
-        
-        url = "https://maps.googleapis.com/maps/api/place/details/json"
-        params = {
-            'place_id': place_id,
-            'fields': ','.join(fields),
-            'key': self.google_api_key,
-            'language': 'en'
-        }
+        """Fetch detailed information about a place, served from the local cache when possible."""
+        language = 'en'
+        fields, cached = self.details_cache.lookup(place_id, DETAIL_FIELDS, language)
+        if cached is not None:
+            return cached
         
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            started = time.monotonic()
+            requests_made = 1
+            self.places_limiter.acquire()
+            data = self.places_client.place_details(place_id, fields, language)
             
-            if data['status'] == 'OK':
-                return data.get('result', {})
-            elif data['status'] == 'INVALID_REQUEST':
+            if data['status'] == 'INVALID_REQUEST' and fields != BASIC_DETAIL_FIELDS:
                 # Some fields might not be available for all place types
                 # Retry with basic fields only
-                basic_fields = [
-                    'name',
-                    'formatted_address',
-                    'geometry/location',
-                    'rating',
-                    'user_ratings_total',
-                    'price_level',
-                    'types',
-                    'website',
-                    'wheelchair_accessible_entrance'
-                ]
-                params['fields'] = ','.join(basic_fields)
-                response = requests.get(url, params=params)
-                data = response.json()
+                requests_made += 1
+                self.places_limiter.acquire()
+                data = self.places_client.place_details(place_id, BASIC_DETAIL_FIELDS, language)
                 if data['status'] == 'OK':
-                    return data.get('result', {})
+                    # Remember the fallback so later runs skip the failing request
+                    fields = BASIC_DETAIL_FIELDS
+                    self.details_cache.record_resolved_fields(place_id, DETAIL_FIELDS, language, fields)
+            
+            if data['status'] == 'OK':
+                result = data.get('result', {})
+                self.details_cache.set(place_id, fields, language, result,
+                                       time.monotonic() - started, requests_made)
+                return result
                     
             print(f"Error fetching details for place_id {place_id}: {data.get('status')}")
             if 'error_message' in data:
@@ -102,12 +215,9 @@ class PlaceScorer:
             print(f"Exception fetching details for place_id {place_id}: {str(e)}")
             return {}
     
-    def create_scoring_prompt(self, place_type: str, place_data: Dict, place_details: Dict) -> str:
-        """Create a prompt for Gemini to score a place based on user preferences."""
-        base_prompt = f"""
-        Score this {place_type} for a group trip based on the following criteria.
-        Return ONLY a JSON object with the format: {{"score": <number 0-100>, "reasoning": "<brief explanation>"}}
-        
+    def create_trip_details_block(self) -> str:
+        """Describe the trip for scoring prompts; shared by single and batch prompts."""
+        return f"""
         TRIP DETAILS:
         - Budget: ${self.trip_details['budget']} per person ({self.trip_details['number_of_travelers']} travelers)
         - Accessibility: One traveler uses a walker, group is NOT ok with much walking
@@ -117,63 +227,82 @@ class PlaceScorer:
         - Trip style: {self.trip_details['how_packed_trip']}
         - Trip type: {self.trip_details['trip_type']}
         - Dates: {self.trip_details['dates_of_travel']['start_date']} to {self.trip_details['dates_of_travel']['end_date']}
-        
+        """
+    
+    def prepare_place_details(self, place_type: str, place_data: Dict, place_details: Dict) -> Any:
+        """Compact place details for a prompt and record the tokens saved for this place."""
+        compacted = self.compactor.compact(place_type, place_details)
+        full_tokens = estimate_tokens(json.dumps(place_details, indent=2))
+        compact_tokens = estimate_tokens(self.compactor.serialize(compacted))
+        self.tokens_saved[place_data.get('place_id')] = full_tokens - compact_tokens
+        return compacted
+    
+    def create_scoring_prompt(self, place_type: str, place_data: Dict, place_details: Dict) -> str:
+        """Create a prompt for Gemini to score a place based on user preferences."""
+        return f"""
+        Score this {place_type} for a group trip based on the following criteria.
+        Return ONLY a JSON object with the format: {{"score": <number 0-100>, "reasoning": "<brief explanation>"}}
+        {self.create_trip_details_block()}
         PLACE INFORMATION:
         Name: {place_data.get('name', 'Unknown')}
         Address: {place_data.get('address', 'Unknown')}
-        """
-        
-        # Add specific criteria based on place type
-        if place_type == 'lodging':
-            prompt = base_prompt + f"""
-        
-        LODGING SCORING CRITERIA (weight accordingly):
-        1. Wheelchair accessibility (30 points) - Essential due to walker
-        2. Location convenience (20 points) - Close to attractions, minimal travel needed
-        3. Price/Budget fit (20 points) - Within budget for 4 people for 2 nights
-        4. Reviews/Rating (15 points) - Quality and guest satisfaction
-        5. Amenities for young adults (15 points) - WiFi, common areas, etc.
-        
+        {SCORING_CRITERIA[place_type]}
         Google Places Details:
-        {json.dumps(place_details, indent=2)}
+        {self.compactor.serialize(self.prepare_place_details(place_type, place_data, place_details))}
         """
-        
-        elif place_type == 'restaurant':
-            prompt = base_prompt + f"""
-        
-        RESTAURANT SCORING CRITERIA (weight accordingly):
-        1. Vegetarian options (25 points) - Must have good vegetarian menu
-        2. Wheelchair accessibility (25 points) - Essential due to walker
-        3. Music/Atmosphere (20 points) - Aligns with music interest
-        4. Price range (15 points) - Reasonable for young adults
-        5. Reviews/Rating (15 points) - Food quality and service
-        
-        Google Places Details:
-        {json.dumps(place_details, indent=2)}
-        """
-        
-        elif place_type == 'attraction':
-            prompt = base_prompt + f"""
-        
-        ATTRACTION SCORING CRITERIA (weight accordingly):
-        1. Wheelchair accessibility (30 points) - Essential due to walker
-        2. Music relevance (25 points) - Aligns with music interest
-        3. Relaxed pace friendly (20 points) - Not too demanding or rushed
-        4. Group friendly (15 points) - Good for friends in their 20s
-        5. Value/Cost (10 points) - Worth the price
-        
-        Google Places Details:
-        {json.dumps(place_details, indent=2)}
+    
+    def create_batch_scoring_prompt(self, place_type: str, batch: List[Tuple[Dict, Dict]]) -> str:
+        """Create one prompt that scores several places of the same category."""
+        places = [
+            {
+                'place_id': place_data.get('place_id'),
+                'name': place_data.get('name', 'Unknown'),
+                'address': place_data.get('address', 'Unknown'),
+                'details': self.prepare_place_details(place_type, place_data, place_details)
+            }
+            for place_data, place_details in batch
+        ]
+        return f"""
+        Score each of the following {len(places)} {place_type} options for a group trip based on the criteria below.
+        Score every place independently. Return a JSON array with one object per place, using the
+        place_id exactly as given: [{{"place_id": "<place_id>", "score": <number 0-100>, "reasoning": "<brief explanation>"}}]
+        {self.create_trip_details_block()}
+        {SCORING_CRITERIA[place_type]}
+        PLACES (with Google Places Details):
+        {self.compactor.serialize(places)}
         """
-        
-        return prompt
+    
+    def _build_score_result(self, place_data: Dict, score: Any, reasoning: str) -> Dict:
+        """Shape a scored place the way save_results and the itinerary generator expect."""
+        return {
+            'name': place_data.get('name'),
+            'address': place_data.get('address'),
+            'place_id': place_data.get('place_id'),
+            'score': score,
+            'reasoning': reasoning,
+            'location': place_data.get('location', {})
+        }
+    
+    def get_cached_score(self, place_type: str, place_data: Dict) -> Optional[Dict]:
+        """Return a score result from the cross-trip score cache, or None on a miss."""
+        cached = self.score_cache.get(self.preference_fingerprint, place_type,
+                                      place_data.get('place_id'), self.prompt_version)
+        if cached is None:
+            return None
+        return self._build_score_result(place_data, cached['score'], cached['reasoning'])
+    
+    def cache_score(self, place_type: str, place_data: Dict, score: Any, reasoning: str):
+        """Memoize a successful Gemini score for later trips with the same preferences."""
+        self.score_cache.set(self.preference_fingerprint, place_type, place_data.get('place_id'),
+                             self.prompt_version, score, reasoning)
     
     def score_place_with_gemini(self, place_type: str, place_data: Dict, place_details: Dict) -> Dict:
         """Use Gemini to score a place based on the criteria."""
         prompt = self.create_scoring_prompt(place_type, place_data, place_details)
         
         try:
-            response = self.gemini_model.generate_content(prompt)
+            self.gemini_limiter.acquire()
+            response = self.llm.generate_content(prompt)
             result_text = response.text.strip()
             
             # Extract JSON from response
@@ -183,120 +312,187 @@ class PlaceScorer:
                 result_text = result_text[3:-3]
             
             score_data = json.loads(result_text)
-            
-            return {
-                'name': place_data.get('name'),
-                'address': place_data.get('address'),
-                'place_id': place_data.get('place_id'),
-                'score': score_data.get('score', 0),
-                'reasoning': score_data.get('reasoning', ''),
-                'location': place_data.get('location', {})
-            }
+            score, reasoning = score_data.get('score', 0), score_data.get('reasoning', '')
+            self.cache_score(place_type, place_data, score, reasoning)
+            return self._build_score_result(place_data, score, reasoning)
             
         except Exception as e:
             print(f"Error scoring {place_data.get('name')}: {str(e)}")
-            return {
-                'name': place_data.get('name'),
-                'address': place_data.get('address'),
-                'place_id': place_data.get('place_id'),
-                'score': 0,
-                'reasoning': f'Error during scoring: {str(e)}',
-                'location': place_data.get('location', {})
-            }
+            return self._build_score_result(place_data, 0, f'Error during scoring: {str(e)}')
     
-    def score_all_places(self):
-        """Score all places in each category."""
-        results = {
-            'lodging': [],
-            'restaurants': [],
-            'attractions': []
-        }
-        
-        # Score lodging
-        print("Scoring lodging options...")
-        for i, place in enumerate(self.places_data.get('lodging', [])):
-            print(f"  Processing {i+1}/{len(self.places_data['lodging'])}: {place['name']}")
-            
-            # Get place details from Google
-            details = self.get_place_details(place['place_id'])
-            time.sleep(0.5)  # Rate limiting
-            
-            # Score with Gemini
-            score_result = self.score_place_with_gemini('lodging', place, details)
-            results['lodging'].append(score_result)
-            time.sleep(1)  # Rate limiting for Gemini
-        
-        # Score restaurants
-        print("\nScoring restaurants...")
-        # Remove duplicates based on place_id
-        unique_restaurants = {}
-        for r in self.places_data.get('restaurants', []):
-            unique_restaurants[r['place_id']] = r
-        
-        restaurant_list = list(unique_restaurants.values())
+    def score_places_batch_with_gemini(self, place_type: str, batch: List[Tuple[Dict, Dict]]) -> List[Dict]:
+        """
+        Score several places of one category with a single structured-output Gemini call.
+
+        Places missing from the reply (or the whole batch, if the call fails) are
+        scored individually with score_place_with_gemini.
+
+        Args:
+            place_type (str): 'lodging', 'restaurant' or 'attraction'.
+            batch (list): (place_data, place_details) pairs.
+
+        Returns:
+            list: Score results in the same order as `batch`.
+        """
+        prompt = self.create_batch_scoring_prompt(place_type, batch)
+        scores_by_id = {}
         
-        for i, place in enumerate(restaurant_list):
-            print(f"  Processing {i+1}/{len(restaurant_list)}: {place['name']}")
-            
-            # Get place details from Google
-            details = self.get_place_details(place['place_id'])
-            time.sleep(0.5)  # Rate limiting
+        try:
+            self.gemini_limiter.acquire()
+            response = self.llm.generate_content(
+                prompt,
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=BATCH_SCORE_SCHEMA
+                )
+            )
+            for item in json.loads(response.text):
+                if isinstance(item, dict) and item.get('place_id'):
+                    scores_by_id[item['place_id']] = item
+        except Exception as e:
+            print(f"Error batch scoring {len(batch)} {place_type} places: {str(e)}")
+        
+        results = []
+        for place_data, place_details in batch:
+            score_data = scores_by_id.get(place_data.get('place_id'))
+            if score_data is None:
+                results.append(self.score_place_with_gemini(place_type, place_data, place_details))
+            else:
+                score, reasoning = score_data.get('score', 0), score_data.get('reasoning', '')
+                self.cache_score(place_type, place_data, score, reasoning)
+                results.append(self._build_score_result(place_data, score, reasoning))
+        return results
+    
+    def score_place(self, place_type: str, place: Dict, position: str = "") -> Dict:
+        """Fetch details for a single place and score it with Gemini, unless its score is cached."""
+        print(f"  Processing {position}: {place['name']}")
+        cached = self.get_cached_score(place_type, place)
+        if cached is not None:
+            return cached
+        details = self.get_place_details(place['place_id'])
+        return self.score_place_with_gemini(place_type, place, details)
+    
+    def score_batch(self, details_executor: ThreadPoolExecutor, place_type: str,
+                    places: List[Dict], position: str = "") -> List[Dict]:
+        """Fetch details for a batch of places concurrently, then score the uncached ones in one Gemini call."""
+        print(f"  Processing {place_type} batch {position} ({len(places)} places)")
+        results = [self.get_cached_score(place_type, place) for place in places]
+        uncached = [place for place, result in zip(places, results) if result is None]
+        if uncached:
+            details = list(details_executor.map(self.get_place_details, [place['place_id'] for place in uncached]))
+            scored = iter(self.score_places_batch_with_gemini(place_type, list(zip(uncached, details))))
+            results = [result if result is not None else next(scored) for result in results]
+        return results
+    
+    async def score_places_stream(self, places: AsyncIterator[Tuple[str, Any]]) -> Dict[str, List[Dict]]:
+        """
+        Score places as they arrive from an async stream, preserving arrival order.
+
+        A batch is handed to the thread pool as soon as it fills up, so scoring
+        overlaps with discovery instead of waiting for every search to finish.
+
+        Args:
+            places: Async iterator of (category, place) pairs, where category is
+                    'lodging', 'restaurants' or 'attractions', such as
+                    placesApiCalled.stream_places. Other events are ignored.
+
+        Returns:
+            dict: Score results per category, in the shape save_results expects.
+        """
+        loop = asyncio.get_running_loop()
+        futures = {category: [] for category in CATEGORY_PLACE_TYPES}
+        buffers = {category: [] for category in CATEGORY_PLACE_TYPES}
+        seen_restaurant_ids = set()
+        
+        print(f"Scoring places with {self.max_workers} workers (batch size {self.batch_size})...")
+        # Details lookups get their own pool so batch tasks can wait on them without deadlocking.
+        # The pools are shut down without waiting: on an error or cancellation, waiting for the
+        # in-flight Gemini and Places calls would block the event loop
+        details_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            def submit(category):
+                place_type = CATEGORY_PLACE_TYPES[category]
+                batch, buffers[category] = buffers[category], []
+                position = f"#{len(futures[category]) + 1}"
+                if self.batch_size > 1:
+                    future = loop.run_in_executor(executor, self.score_batch, details_executor,
+                                                  place_type, batch, position)
+                else:
+                    future = loop.run_in_executor(executor, self.score_place, place_type, batch[0],
+                                                  f"{place_type} {position}")
+                futures[category].append(future)
             
-            # Score with Gemini
-            score_result = self.score_place_with_gemini('restaurant', place, details)
-            results['restaurants'].append(score_result)
-            time.sleep(1)  # Rate limiting for Gemini
-        
-        # Score attractions
-        print("\nScoring attractions...")
-        for i, place in enumerate(self.places_data.get('attractions', [])):
-            print(f"  Processing {i+1}/{len(self.places_data['attractions'])}: {place['name']}")
+            async for category, place in places:
+                if category not in CATEGORY_PLACE_TYPES:
+                    continue
+                # Remove duplicate restaurants based on place_id. stream_places never repeats one;
+                # score_all_places has already deduplicated places.json the way it always did
+                if category == 'restaurants':
+                    if place['place_id'] in seen_restaurant_ids:
+                        continue
+                    seen_restaurant_ids.add(place['place_id'])
+                buffers[category].append(place)
+                if len(buffers[category]) >= max(self.batch_size, 1):
+                    submit(category)
             
-            # Get place details from Google
-            details = self.get_place_details(place['place_id'])
-            time.sleep(0.5)  # Rate limiting
+            for category in CATEGORY_PLACE_TYPES:
+                if buffers[category]:
+                    submit(category)
             
-            # Score with Gemini
-            score_result = self.score_place_with_gemini('attraction', place, details)
-            results['attractions'].append(score_result)
-            time.sleep(1)  # Rate limiting for Gemini
-        
+            results = {}
+            for category, category_futures in futures.items():
+                results[category] = []
+                for scored in await asyncio.gather(*category_futures):
+                    results[category].extend(scored if isinstance(scored, list) else [scored])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            details_executor.shutdown(wait=False, cancel_futures=True)
+        
+        cache_stats = self.details_cache.stats()
+        print(f"Place details cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['saved_requests']} API requests and ~{cache_stats['saved_seconds']}s saved")
+        score_stats = self.score_cache.stats()
+        print(f"Score cache: {score_stats['hits']} hits, {score_stats['misses']} misses")
+        if self.tokens_saved:
+            total_saved = sum(self.tokens_saved.values())
+            print(f"Prompt compaction: ~{total_saved} input tokens saved "
+                  f"(~{total_saved // len(self.tokens_saved)} per place)")
         return results
     
-    def save_results(self, results: Dict):
-        """Save scored results to JSON files, sorted by score."""
-        # Sort each category by score (highest to lowest)
+    def score_all_places(self):
+        """Score all loaded places in each category concurrently, preserving input order."""
+        async def loaded_places():
+            for category in CATEGORY_PLACE_TYPES:
+                places = self.places_data.get(category, [])
+                if category == 'restaurants':
+                    # Duplicates keep the first one's position and the last one's data
+                    places = list({place['place_id']: place for place in places}.values())
+                for place in places:
+                    yield category, place
+        
+        return asyncio.run(self.score_places_stream(loaded_places()))
+    
+    def rank_results(self, results: Dict) -> Dict:
+        """Sort each category by score (highest to lowest), in place."""
         for category in results:
             results[category].sort(key=lambda x: x['score'], reverse=True)
-        
-        # Save lodging scores
-        with open('scored_lodging.json', 'w') as f:
-            json.dump({
-                'trip_details': self.trip_details,
-                'scored_at': datetime.now().isoformat(),
-                'lodging': results['lodging']
-            }, f, indent=2)
-        
-        # Save restaurant scores
-        with open('scored_restaurants.json', 'w') as f:
-            json.dump({
-                'trip_details': self.trip_details,
-                'scored_at': datetime.now().isoformat(),
-                'restaurants': results['restaurants']
-            }, f, indent=2)
-        
-        # Save attraction scores
-        with open('scored_attractions.json', 'w') as f:
-            json.dump({
-                'trip_details': self.trip_details,
-                'scored_at': datetime.now().isoformat(),
-                'attractions': results['attractions']
-            }, f, indent=2)
+        return results
+    
+    def save_results(self, results: Dict, output_dir: str = '.'):
+        """Save scored results to JSON files, sorted by score."""
+        self.rank_results(results)
         
         print("\nResults saved to:")
-        print("  - scored_lodging.json")
-        print("  - scored_restaurants.json")
-        print("  - scored_attractions.json")
+        for category in ('lodging', 'restaurants', 'attractions'):
+            filename = os.path.join(output_dir, f'scored_{category}.json')
+            with open(filename, 'w') as f:
+                json.dump({
+                    'trip_details': self.trip_details,
+                    'scored_at': datetime.now().isoformat(),
+                    category: results[category]
+                }, f, indent=2)
+            print(f"  - {filename}")
 
 
 # def main():
@@ -0,0 +1,69 @@
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from sqlite_cache import SQLiteCache
+
+DEFAULT_SCORE_CACHE_PATH = "place_scores_cache.sqlite"
+DEFAULT_SCORE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_SCORE_CACHE_MAX_ENTRIES = 50000
+
+
+def _normalize_text(value: Any) -> str:
+    return " ".join(str(value).lower().split()) if value is not None else ""
+
+
+def trip_preference_fingerprint(trip_details: Dict[str, Any]) -> str:
+    """
+    Hash the trip preferences that influence a place's score.
+
+    Travel dates and destination are deliberately left out, so two trips with
+    the same preference profile share scores for the places they have in common.
+    """
+    profile = {
+        'budget': _normalize_text(trip_details.get('budget')),
+        'accessibility_needs': _normalize_text(trip_details.get('accessibility_needs')),
+        'ok_with_walking': trip_details.get('ok_with_walking'),
+        'dietary_needs': _normalize_text(trip_details.get('dietary_needs')),
+        'interests': sorted(_normalize_text(interest) for interest in trip_details.get('interests') or []),
+        'how_packed_trip': _normalize_text(trip_details.get('how_packed_trip')),
+        'trip_type': _normalize_text(trip_details.get('trip_type')),
+        'age_group_of_travelers': _normalize_text(trip_details.get('age_group_of_travelers')),
+        'number_of_travelers': trip_details.get('number_of_travelers')
+    }
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    Persistent memo of Gemini place scores shared across trips.
+
+    Entries are keyed by the trip preference fingerprint, the place category,
+    the place_id and the prompt template version, expire after a TTL and are
+    evicted least recently used first once the cache is full.
+    """
+
+    def __init__(self, path: str = DEFAULT_SCORE_CACHE_PATH,
+                 ttl_seconds: float = DEFAULT_SCORE_CACHE_TTL_SECONDS,
+                 max_entries: int = DEFAULT_SCORE_CACHE_MAX_ENTRIES):
+        self._scores = SQLiteCache(path, ttl_seconds, max_entries, table="place_scores")
+
+    @staticmethod
+    def _key(fingerprint: str, place_type: str, place_id: str, prompt_version: str) -> str:
+        raw = f"{fingerprint}|{place_type}|{place_id}|{prompt_version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, fingerprint: str, place_type: str, place_id: str,
+            prompt_version: str) -> Optional[Dict[str, Any]]:
+        """Return the cached {'score', 'reasoning'} for a place, or None on a miss."""
+        return self._scores.get(self._key(fingerprint, place_type, place_id, prompt_version))
+
+    def set(self, fingerprint: str, place_type: str, place_id: str, prompt_version: str,
+            score: Any, reasoning: str):
+        self._scores.set(self._key(fingerprint, place_type, place_id, prompt_version), {
+            'score': score,
+            'reasoning': reasoning
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries."""
+        return self._scores.stats()
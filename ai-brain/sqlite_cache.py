@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class SQLiteCache:
+    """
+    Small on-disk key/value cache backed by SQLite.
+
+    Every entry carries its own expiry time, reads refresh the entry's last
+    access time, and once the table grows past `max_entries` the least
+    recently used entries are evicted. Values are stored as JSON. A single
+    connection guarded by a lock is shared so the cache can be used from the
+    scoring thread pool. The number of entries is counted once when the cache
+    opens and tracked from then on, so writes never scan the table.
+    """
+
+    def __init__(self, path: str, default_ttl_seconds: float, max_entries: int, table: str = "entries"):
+        self.path = path
+        self.default_ttl_seconds = default_ttl_seconds
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+            (self._count,) = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            with self._conn:
+                if expires_at <= now:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._count -= 1
+                    self.misses += 1
+                    return None
+                self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Store `value` under `key`, evicting least recently used entries if full."""
+        now = time.time()
+        ttl = self.default_ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                f"UPDATE {self.table} SET value = ?, expires_at = ?, last_access = ? WHERE key = ?",
+                (json.dumps(value), now + ttl, now, key)
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    f"INSERT INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now + ttl, now)
+                )
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used ones until the cache fits."""
+        self._count -= self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            self._count -= self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                (overflow,)
+            ).rowcount
+
+    def __len__(self) -> int:
+        return self._count
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self)
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,225 @@
+import json
+
+import pytest
+
+
+TRIP_DETAILS = {
+    "budget": "moderate", "destination": "Paris", "accessibility_needs": "none", "dietary_needs": "vegetarian",
+    "age_group_of_travelers": "adults", "interests": ["museums"], "how_packed_trip": "relaxed",
+    "ok_with_walking": True, "trip_type": "leisure", "number_of_travelers": 2,
+    "dates_of_travel": {"start_date": "2025-07-01", "end_date": "2025-07-07"}
+}
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.time and time.sleep, advancing instantly."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_refills_and_blocks(monkeypatch):
+    """
+    Tests that the bucket allows a burst of `capacity` calls, then waits for tokens to refill at `rate`.
+    """
+    import rate_limiter
+
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.time)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+
+    bucket = rate_limiter.TokenBucket(rate=2.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+
+    # Empty: the next token takes half a second at 2 tokens/second
+    bucket.acquire()
+    assert clock.sleeps == [0.5]
+
+    # Idle time refills the bucket, but never past its capacity
+    clock.now += 60
+    for _ in range(2):
+        bucket.acquire()
+    assert clock.sleeps == [0.5]
+    bucket.acquire()
+    assert clock.sleeps == [0.5, 0.5]
+
+    with pytest.raises(ValueError):
+        rate_limiter.TokenBucket(rate=0)
+
+
+def test_sqlite_cache_expires_and_evicts_least_recently_used(tmp_path, monkeypatch):
+    """
+    Tests per-entry TTLs, LRU eviction past max_entries and the tracked entry count.
+    """
+    import sqlite_cache
+
+    clock = FakeClock()
+    monkeypatch.setattr(sqlite_cache.time, "time", clock.time)
+    path = str(tmp_path / "cache.sqlite")
+    cache = sqlite_cache.SQLiteCache(path, default_ttl_seconds=60, max_entries=2)
+
+    cache.set("a", {"value": 1})
+    cache.set("short", [1, 2], ttl_seconds=5)
+    assert cache.get("short") == [1, 2]
+    clock.now += 10
+    assert cache.get("short") is None
+    assert len(cache) == 1
+
+    # Reading "a" makes "b" the least recently used entry
+    clock.now += 1
+    cache.set("b", "two")
+    clock.now += 1
+    assert cache.get("a") == {"value": 1}
+    clock.now += 1
+    cache.set("c", "three")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ({"value": 1}, "three")
+
+    # Overwriting an entry does not count as a new one
+    cache.set("c", "three again")
+    assert len(cache) == 2
+    assert cache.stats() == {"hits": 4, "misses": 2, "hit_rate": 4 / 6, "entries": 2}
+    cache.close()
+
+    # The count is read back when the cache is reopened
+    assert len(sqlite_cache.SQLiteCache(path, default_ttl_seconds=60, max_entries=2)) == 2
+
+
+def test_place_details_cache_remembers_the_fallback_field_set(tmp_path):
+    """
+    Tests that a place that needed the basic-fields fallback goes straight to it on the next lookup.
+    """
+    from place_cache import PlaceDetailsCache
+
+    full_fields, basic_fields = ["name", "rating", "reviews"], ["name"]
+    cache = PlaceDetailsCache(str(tmp_path / "places.sqlite"))
+    assert cache.lookup("p1", full_fields, "en") == (full_fields, None)
+
+    cache.record_resolved_fields("p1", full_fields, "en", basic_fields)
+    assert cache.lookup("p1", full_fields, "en") == (basic_fields, None)
+    assert cache.fallbacks_skipped == 1
+
+    cache.set("p1", basic_fields, "en", {"name": "Louvre"}, fetch_seconds=0.4, requests=2)
+    # Field order does not matter
+    assert cache.lookup("p1", ["reviews", "name", "rating"], "en") == (basic_fields, {"name": "Louvre"})
+    assert cache.lookup("p1", full_fields, "fr") == (full_fields, None)
+    stats = cache.stats()
+    assert (stats["saved_requests"], stats["saved_seconds"]) == (2 + 1, 0.4)
+
+
+def test_trip_preference_fingerprint_ignores_dates_and_destination():
+    """
+    Tests that only the preferences that affect scores change the fingerprint.
+    """
+    from score_cache import trip_preference_fingerprint
+
+    trip = {"destination": "Paris", "dates_of_travel": {"start_date": "2025-07-01", "end_date": "2025-07-07"},
+            "budget": "Moderate", "interests": ["museums", "food"], "number_of_travelers": 2}
+    fingerprint = trip_preference_fingerprint(trip)
+
+    assert trip_preference_fingerprint({**trip, "destination": "Rome",
+                                        "dates_of_travel": {"start_date": "2026-01-01"}}) == fingerprint
+    # Case, spacing and interest order are normalized
+    assert trip_preference_fingerprint({**trip, "budget": "  moderate ", "interests": ["Food", "museums"]}) == fingerprint
+    assert trip_preference_fingerprint({**trip, "budget": "luxury"}) != fingerprint
+    assert trip_preference_fingerprint({**trip, "number_of_travelers": 3}) != fingerprint
+
+
+def test_detail_compactor_keeps_scoring_fields_and_trims_reviews():
+    """
+    Tests the per-category field projection and the review sampling and truncation.
+    """
+    from prompt_compaction import DetailCompactor
+
+    details = {
+        "name": "Cafe", "formatted_address": "1 Main St", "rating": 4.5, "price_level": 0,
+        "types": ["cafe", "point_of_interest", "establishment"],
+        "editorial_summary": {"overview": "Cozy."},
+        "wheelchair_accessible_entrance": False,
+        "serves_vegan_food": None,
+        "photos": [{"photo_reference": "x"}],
+        "reviews": [{"rating": 5, "text": "Short."}, {"rating": 3, "text": "x" * 50},
+                    {"rating": 4, "text": "  A medium review.  "}, {"rating": 1, "text": ""}]
+    }
+    compacted = DetailCompactor(max_reviews=2, max_review_chars=20).compact("restaurant", details)
+
+    assert compacted == {
+        "rating": 4.5,
+        "price_level": 0,
+        "types": ["cafe"],
+        "editorial_summary": "Cozy.",
+        "wheelchair_accessible_entrance": False,
+        # The longest reviews with text, truncated
+        "reviews": [{"rating": 3, "text": "x" * 20 + "..."}, {"rating": 4, "text": "A medium review."}]
+    }
+    assert DetailCompactor().serialize({"a": [1]}) == '{"a":[1]}'
+
+
+def test_cluster_search_anchors_merges_nearby_pois():
+    """
+    Tests that POIs within the merge distance share an anchor, and a distance of 0 only merges identical points.
+    """
+    from geo_clustering import cluster_search_anchors, haversine_meters
+
+    def poi(place_id, lat, lng):
+        return {"place_id": place_id, "location": {"lat": lat, "lng": lng}}
+
+    # About 110 m and 2.2 km north of the first POI
+    pois = [poi("a", 48.8600, 2.3400), poi("b", 48.8610, 2.3400), poi("c", 48.8800, 2.3400),
+            poi("d", 48.8600, 2.3400)]
+    assert 100 < haversine_meters(pois[0]["location"], pois[1]["location"]) < 120
+
+    assert cluster_search_anchors(pois, 500) == [
+        {"center": {"lat": 48.8600, "lng": 2.3400}, "poi_place_ids": ["a", "b", "d"]},
+        {"center": {"lat": 48.8800, "lng": 2.3400}, "poi_place_ids": ["c"]},
+    ]
+    assert [cluster["poi_place_ids"] for cluster in cluster_search_anchors(pois, 0)] == [["a", "d"], ["b"], ["c"]]
+    assert cluster_search_anchors([], 500) == []
+
+
+def test_batch_scoring_falls_back_to_single_scores(tmp_path):
+    """
+    Tests that places missing from the structured batch reply are scored one at a time, in batch order.
+    """
+    from place_cache import PlaceDetailsCache
+    from ranker import PlaceScorer
+    from score_cache import ScoreCache
+
+    class FakeGemini:
+        def __init__(self):
+            self.calls = []
+
+        def generate_content(self, prompt, generation_config=None):
+            self.calls.append("batch" if generation_config is not None else "single")
+            if generation_config is not None:
+                text = json.dumps([{"place_id": "a", "score": 80, "reasoning": "batched"},
+                                   {"place_id": "unknown", "score": 1, "reasoning": "ignored"}])
+            else:
+                text = json.dumps({"score": 55, "reasoning": "single"})
+            return type("Response", (), {"text": text})()
+
+    scorer = PlaceScorer("places-key", "gemini-key", gemini_requests_per_second=1000,
+                         details_cache=PlaceDetailsCache(str(tmp_path / "details.sqlite")),
+                         score_cache=ScoreCache(str(tmp_path / "scores.sqlite")),
+                         trip_details=TRIP_DETAILS, places_data={})
+    scorer.llm = FakeGemini()
+
+    batch = [({"place_id": "a", "name": "A"}, {}), ({"place_id": "b", "name": "B"}, {})]
+    results = scorer.score_places_batch_with_gemini("restaurant", batch)
+
+    assert [(result["place_id"], result["score"], result["reasoning"]) for result in results] == [
+        ("a", 80, "batched"), ("b", 55, "single")
+    ]
+    assert scorer.llm.calls == ["batch", "single"]
+    # Both scores are memoized for the next trip with the same preferences
+    assert scorer.get_cached_score("restaurant", {"place_id": "b", "name": "B"})["score"] == 55
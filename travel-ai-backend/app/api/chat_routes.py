@@ -1,11 +1,19 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, date
+import asyncio
+import copy
+import json
 
-from app.conversational_bot import call_gemini_update_state, INITIAL_STATE, extract_flight_parameters_from_state, is_conversation_complete
-from app.utils.session_manager import get_session, update_session
-from app.flights.flight_search import FlightSearchService
+from app.conversational_bot import call_gemini_update_state_async, stream_gemini_update_state, INITIAL_STATE, extract_flight_parameters_from_state_async, flight_parameters_from_state, is_conversation_complete
+from app.core.conversation_context import ConversationContext
+from app.core.preference_extractor import get_preference_extractor
+from app.utils.session_manager import get_session, update_session, modify_session, get_session_store
+from app.flights.flight_search import get_flight_search_service
+from app.flights.prefetch import get_flight_prefetcher
+from app.config import settings
 from app.models.travel_models import FlightSearchRequest, BudgetLevel
 
 router = APIRouter()
@@ -22,84 +30,197 @@ class ChatResponse(BaseModel):
     flight_parameters: Optional[Dict[str, Any]] = None
     flight_results: Optional[Dict[str, Any]] = None
 
+def _session_context(session: Dict[str, Any]) -> ConversationContext:
+    if "context" in session:
+        return ConversationContext.from_dict(session["context"])
+    # Sessions from before the bounded context kept every user message in "history"
+    return ConversationContext.from_user_messages(session.pop("history", []))
+
+
+_UNSET = object()
+
+
+class _ChatTurn:
+    """
+    One chat turn's copy of its session.
+
+    The session is read when the turn starts, but the LLM call in between takes
+    seconds, so save() merges what this turn changed into the latest stored session
+    instead of overwriting it: the state fields it changed, the messages it added and
+    the other keys it set. Concurrent turns on the same session keep each other's changes.
+    The session store may block (the SQLite store waits for its write lock), so it is
+    called from a worker thread.
+    """
+
+    def __init__(self, session_id: Optional[str], session: Optional[Dict[str, Any]]):
+        self.session_id = session_id
+        self.session = session or {"state": INITIAL_STATE.copy()}
+        self.context = _session_context(self.session)
+        self._saved = copy.deepcopy(self.session)
+        self._messages: List[Tuple[str, str]] = []
+
+    @classmethod
+    async def load(cls, session_id: Optional[str]) -> "_ChatTurn":
+        return cls(session_id, await asyncio.to_thread(get_session, session_id))
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        return self.session.get("state", INITIAL_STATE.copy())
+
+    def add_message(self, role: str, text: str):
+        self.context.add(role, text)
+        if text:
+            self._messages.append((role, text))
+
+    async def save(self) -> str:
+        """Merge this turn's changes since the last save into the stored session; returns its id."""
+        saved_state = self._saved.get("state") or {}
+        state_changes = {key: value for key, value in (self.session.get("state") or {}).items()
+                         if saved_state.get(key, _UNSET) != value}
+        field_changes = {key: value for key, value in self.session.items()
+                         if key not in ("state", "context") and self._saved.get(key, _UNSET) != value}
+        messages = self._messages
+
+        def merge(stored):
+            stored["state"] = {**(stored.get("state") or INITIAL_STATE), **state_changes}
+            context = _session_context(stored)
+            for role, text in messages:
+                context.add(role, text)
+            stored["context"] = context.to_dict()
+            stored.update(field_changes)
+
+        if not self.session_id or await asyncio.to_thread(modify_session, self.session_id, merge) is None:
+            # New (or expired) session
+            stored = {}
+            merge(stored)
+            self.session_id = await asyncio.to_thread(update_session, stored, self.session_id)
+        self._saved = copy.deepcopy(self.session)
+        self._messages = []
+        return self.session_id
+
+
+def _apply_state_update(turn: _ChatTurn, message, updated_state, missing_fields, next_question):
+    """
+    Record the user's turn and the updated state in the session.
+    Returns (conversation_complete, next_question).
+    """
+    turn.session["state"] = updated_state
+    turn.add_message("user", message)
+
+    # Improved conversation completion logic
+    conversation_complete = is_conversation_complete(updated_state)
+
+    # Override next_question if conversation is complete
+    if conversation_complete:
+        next_question = "Perfect! I have all the information I need. Let me search for the best flights for you..."
+        turn.session["conversation_complete"] = True
+    elif not missing_fields:
+        # If Gemini says no missing fields but our validation says incomplete
+        # Force a question to get remaining info
+        next_question = next_question or "Could you provide any additional details about your trip preferences?"
+    return conversation_complete, next_question
+
+
+async def _extract_flight_parameters(session, updated_state):
+    """Extract flight parameters for a completed conversation, keeping them in the session if usable."""
+    flight_parameters = await extract_flight_parameters_from_state_async(updated_state)
+    if flight_parameters and "error" not in flight_parameters:
+        session["flight_parameters"] = flight_parameters
+    return flight_parameters
+
+
+def _search_request(flight_parameters) -> FlightSearchRequest:
+    return FlightSearchRequest(
+        origin=flight_parameters.get("origin", ""),
+        destination=flight_parameters.get("destination", ""),
+        departure_date=datetime.strptime(flight_parameters.get("departure_date", ""), "%Y-%m-%d").date() if flight_parameters.get("departure_date") else date.today(),
+        return_date=datetime.strptime(flight_parameters.get("return_date", ""), "%Y-%m-%d").date() if flight_parameters.get("return_date") else date.today(),
+        num_travelers=flight_parameters.get("num_travelers", 1),
+        budget=BudgetLevel(flight_parameters.get("budget", "medium")),
+        accessibility_requirements=flight_parameters.get("accessibility_requirements", False)
+    )
+
+
+def _prefetch_flights(session_id, state):
+    """
+    Start the flight search in the background once the route and dates are known, so it is
+    ready (or in flight) when the conversation completes; changed parameters restart it.
+    """
+    if not settings.FLIGHT_PREFETCH_ENABLED:
+        return
+    flight_parameters = flight_parameters_from_state(state)
+    search_request = None
+    if all(flight_parameters.get(field) for field in ("origin", "destination", "departure_date", "return_date")):
+        try:
+            # The number of travelers is often asked for last; assume one until then
+            search_request = _search_request({**flight_parameters, "num_travelers": flight_parameters.get("num_travelers") or 1})
+        except ValueError as e:
+            print(f"[DEBUG] Not prefetching flights: {e}")
+    get_flight_prefetcher().update(session_id, search_request)
+
+
+async def _search_flights(session, flight_parameters, session_id=None):
+    """
+    Run the flight search for a completed conversation and save the results in the session.
+    A speculative search started for the session by _prefetch_flights is taken over.
+    Returns (flight_results, message); flight_results is None if the search failed.
+    """
+    try:
+        search_request = _search_request(flight_parameters)
+        # A matching prefetch already filled the flight cache or is still fetching; either way
+        # the search below reuses its upstream results
+        prefetch = get_flight_prefetcher().claim(session_id, search_request)
+        print(f"[DEBUG] Flight prefetch for session {session_id}: {prefetch}")
+
+        service = get_flight_search_service()
+        search_response = await service.search_flights(search_request)
+
+        # Save flight results in session
+        flight_results = {
+            "search_id": search_response.search_id,
+            "offers": [offer.model_dump() for offer in search_response.offers],
+            "total_results": search_response.total_results,
+            "search_summary": search_response.search_summary,
+            "searched_at": datetime.now().isoformat()
+        }
+        session["flight_results"] = flight_results
+        return flight_results, f"Great! I found {len(search_response.offers)} excellent flight options for you. The search results have been saved and you can view them anytime."
+
+    except Exception as search_error:
+        print(f"[ERROR] Flight search failed: {search_error}")
+        return None, "I have all your travel details, but there was an issue searching for flights. You can try the search again later."
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """
     Endpoint to handle chat messages and update session state.
     When conversation is complete, extracts flight parameters and runs search.
     """
-    session_id = request.session_id
-    session = get_session(session_id)
-
-    if not session:
-        session = {"state": INITIAL_STATE.copy(), "history": []}
-
-    state = session.get("state", INITIAL_STATE.copy())
-    history = session.get("history", [])
+    turn = await _ChatTurn.load(request.session_id)
 
     try:
-        updated_state, missing_fields, next_question = call_gemini_update_state(
-            state,
+        updated_state, missing_fields, next_question = await call_gemini_update_state_async(
+            turn.state,
             request.message,
-            history
+            turn.context
+        )
+        conversation_complete, next_question = _apply_state_update(
+            turn, request.message, updated_state, missing_fields, next_question
         )
 
-        session["state"] = updated_state
-        session["history"].append(request.message)
-        
-        # Improved conversation completion logic
-        conversation_complete = is_conversation_complete(updated_state)
         flight_parameters = None
         flight_results = None
-        
-        # Override next_question if conversation is complete
         if conversation_complete:
-            next_question = "Perfect! I have all the information I need. Let me search for the best flights for you..."
-            session["conversation_complete"] = True
-            
-            # Extract flight parameters when conversation is complete
-            flight_parameters = extract_flight_parameters_from_state(updated_state)
+            flight_parameters = await _extract_flight_parameters(turn.session, updated_state)
             if flight_parameters and "error" not in flight_parameters:
-                session["flight_parameters"] = flight_parameters
-                
                 # Automatically run flight search and save results
-                try:
-                    search_request = FlightSearchRequest(
-                        origin=flight_parameters.get("origin", ""),
-                        destination=flight_parameters.get("destination", ""),
-                        departure_date=datetime.strptime(flight_parameters.get("departure_date", ""), "%Y-%m-%d").date() if flight_parameters.get("departure_date") else date.today(),
-                        return_date=datetime.strptime(flight_parameters.get("return_date", ""), "%Y-%m-%d").date() if flight_parameters.get("return_date") else date.today(),
-                        num_travelers=flight_parameters.get("num_travelers", 1),
-                        budget=BudgetLevel(flight_parameters.get("budget", "medium")),
-                        accessibility_requirements=flight_parameters.get("accessibility_requirements", False)
-                    )
-                    
-                    service = FlightSearchService()
-                    search_response = await service.search_flights(search_request)
-                    
-                    # Save flight results in session
-                    flight_results = {
-                        "search_id": search_response.search_id,
-                        "offers": [offer.model_dump() for offer in search_response.offers],
-                        "total_results": search_response.total_results,
-                        "search_summary": search_response.search_summary,
-                        "searched_at": datetime.now().isoformat()
-                    }
-                    session["flight_results"] = flight_results
-                    
-                    # Update the response message
-                    next_question = f"Great! I found {len(search_response.offers)} excellent flight options for you. The search results have been saved and you can view them anytime."
-                    
-                except Exception as search_error:
-                    print(f"[ERROR] Flight search failed: {search_error}")
-                    next_question = "I have all your travel details, but there was an issue searching for flights. You can try the search again later."
-                    
-        elif not missing_fields:
-            # If Gemini says no missing fields but our validation says incomplete
-            # Force a question to get remaining info
-            next_question = next_question or "Could you provide any additional details about your trip preferences?"
-
-        new_session_id = update_session(session, session_id)
+                flight_results, next_question = await _search_flights(turn.session, flight_parameters, request.session_id)
+
+        turn.add_message("assistant", next_question)
+        new_session_id = await turn.save()
+        if not conversation_complete:
+            _prefetch_flights(new_session_id, updated_state)
 
         return ChatResponse(
             extracted_params=updated_state,
@@ -110,4 +231,91 @@ async def chat_endpoint(request: ChatRequest):
             flight_results=flight_results
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming version of /chat as server-sent events, in this order:
+    - "token": {"text"} pieces of the next question as they are generated
+    - "state": the ChatResponse fields as soon as the state is updated
+    - "flights": {"flight_parameters", "flight_results", "message"} once a completed
+      conversation's flight search finishes
+    - "done": the final ChatResponse
+    - "error": {"detail"} if the turn fails
+    The streamed tokens are a preview; follow_up_questions in "state"/"done" is authoritative.
+    """
+    turn = await _ChatTurn.load(request.session_id)
+
+    async def events():
+        try:
+            result = None
+            async for kind, payload in stream_gemini_update_state(turn.state, request.message, turn.context):
+                if kind == "token":
+                    yield _sse("token", {"text": payload})
+                else:
+                    result = payload
+            updated_state, missing_fields, next_question = result
+            conversation_complete, next_question = _apply_state_update(
+                turn, request.message, updated_state, missing_fields, next_question
+            )
+            # Saved before the slower flight steps, so the state survives a dropped connection
+            session_id = await turn.save()
+            response = ChatResponse(
+                extracted_params=updated_state,
+                follow_up_questions=[next_question] if next_question else [],
+                session_id=session_id,
+                conversation_complete=conversation_complete
+            )
+            yield _sse("state", response.model_dump())
+
+            if not conversation_complete:
+                _prefetch_flights(session_id, updated_state)
+            else:
+                response.flight_parameters = await _extract_flight_parameters(turn.session, updated_state)
+                if response.flight_parameters and "error" not in response.flight_parameters:
+                    response.flight_results, next_question = await _search_flights(turn.session, response.flight_parameters, session_id)
+                    response.follow_up_questions = [next_question]
+                yield _sse("flights", {
+                    "flight_parameters": response.flight_parameters,
+                    "flight_results": response.flight_results,
+                    "message": next_question
+                })
+
+            turn.add_message("assistant", next_question)
+            await turn.save()
+            yield _sse("done", response.model_dump())
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/sessions/stats")
+async def session_store_stats():
+    """
+    Size and eviction metrics for the chat session store
+    """
+    return await asyncio.to_thread(get_session_store().stats)
+
+
+@router.get("/prefetch/stats")
+async def flight_prefetch_stats():
+    """
+    How often completed conversations found their flight search already done or in flight
+    """
+    return get_flight_prefetcher().stats()
+
+
+@router.get("/extractor/stats")
+async def preference_extractor_stats():
+    """
+    How many chat turns the rule-based extractor handled without calling Gemini
+    """
+    return get_preference_extractor().stats()
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import List
-from app.models.travel_models import FlightSearchRequest, FlightSearchResponse
-from app.flights.flight_search import FlightSearchService
-from app.utils.session_manager import get_session
-from app.conversational_bot import extract_flight_parameters_from_state
+from app.models.travel_models import (
+    FlexibleFlightSearchRequest, FlexibleFlightSearchResponse, FlightSearchRequest, FlightSearchResponse
+)
+from app.flights.flight_search import get_flight_search_service
+from app.flights.airport_index import get_airport_index
+from app.utils.session_manager import get_session, modify_session
+from app.conversational_bot import extract_flight_parameters_from_state_async
+from app.config import settings
 from datetime import datetime, date
+import asyncio
+import json
 
 router = APIRouter()
 
@@ -15,36 +21,52 @@ async def search_flights(request: FlightSearchRequest):
     Search for flights with accessibility considerations
     """
     try:
-        service = FlightSearchService()
+        service = get_flight_search_service()
         response = await service.search_flights(request)
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Flight search failed: {str(e)}")
 
 
+@router.post("/search/flexible", response_model=FlexibleFlightSearchResponse)
+async def search_flexible_flights(request: FlexibleFlightSearchRequest):
+    """
+    Search round trips departing on any day of a date window, returning a price calendar
+    and the best offers across all dates
+    """
+    days = len(request.date_pairs())
+    if days > settings.FLEXIBLE_SEARCH_MAX_DAYS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Date window covers {days} departure days; the maximum is {settings.FLEXIBLE_SEARCH_MAX_DAYS}"
+        )
+    try:
+        service = get_flight_search_service()
+        return await service.search_flexible(request)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Flexible flight search failed: {str(e)}")
+
+
+@router.get("/cache/stats")
+async def flight_cache_stats():
+    """
+    Hit-rate metrics for the flight search result cache
+    """
+    return get_flight_search_service().cache.stats()
+
+
 @router.get("/airports/{query}")
-async def search_airports(query: str):
+async def search_airports(query: str, limit: int = Query(10, ge=1, le=50), offset: int = Query(0, ge=0)):
     """
-    Search for airports by name or code
+    Search for airports by code or city name, tolerating partial and misspelled queries
     """
+    total, matches = get_airport_index().search(query, limit=limit, offset=offset)
+    # airport_codes.csv has no airport names, so "name" (kept for existing clients) is the city
     airports = [
-        {"code": "JFK", "name": "John F. Kennedy International Airport", "city": "New York"},
-        {"code": "LAX", "name": "Los Angeles International Airport", "city": "Los Angeles"},
-        {"code": "ORD", "name": "O'Hare International Airport", "city": "Chicago"},
-        {"code": "ATL", "name": "Hartsfield-Jackson Atlanta International Airport", "city": "Atlanta"},
-        {"code": "DFW", "name": "Dallas/Fort Worth International Airport", "city": "Dallas"},
-        {"code": "DEN", "name": "Denver International Airport", "city": "Denver"},
-        {"code": "SFO", "name": "San Francisco International Airport", "city": "San Francisco"},
-        {"code": "LAS", "name": "McCarran International Airport", "city": "Las Vegas"},
-        {"code": "MCO", "name": "Orlando International Airport", "city": "Orlando"},
-        {"code": "CLT", "name": "Charlotte Douglas International Airport", "city": "Charlotte"},
+        {"code": airport.code, "name": airport.city, "city": airport.city, "score": score}
+        for airport, score in matches
     ]
-    
-    # Filter by query
-    filtered = [airport for airport in airports 
-                if query.upper() in airport["code"] or query.lower() in airport["name"].lower()]
-    
-    return {"airports": filtered}
+    return {"airports": airports, "total": total, "limit": limit, "offset": offset}
 
 
 @router.get("/auto-search/{session_id}", response_model=FlightSearchResponse)
@@ -54,8 +76,8 @@ async def auto_search_flights(session_id: str):
     """
     print(f"[DEBUG] Auto-search called for session: {session_id}")
     
-    # Get session data
-    session = get_session(session_id)
+    # Get session data (the session store may block, so off the event loop)
+    session = await asyncio.to_thread(get_session, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -73,7 +95,7 @@ async def auto_search_flights(session_id: str):
         # Try to extract from current state
         state = session.get("state", {})
         print(f"[DEBUG] Extracting from state: {json.dumps(state, indent=2)}")
-        flight_params = extract_flight_parameters_from_state(state)
+        flight_params = await extract_flight_parameters_from_state_async(state)
         print(f"[DEBUG] Extracted flight_parameters: {flight_params}")
         
         if not flight_params or "error" in flight_params:
@@ -94,17 +116,19 @@ async def auto_search_flights(session_id: str):
         print(f"[DEBUG] FlightSearchRequest: {search_request.dict()}")
         
         # Use existing flight search service
-        service = FlightSearchService()
+        service = get_flight_search_service()
         response = await service.search_flights(search_request)
         
         print(f"[DEBUG] Flight search response: Found {len(response.offers)} flights")
         
         # Store search results in session for future reference
-        session["last_flight_search"] = {
+        last_flight_search = {
             "search_request": search_request.dict(),
             "search_results": response.dict(),
             "search_timestamp": datetime.now().isoformat()
         }
+        await asyncio.to_thread(modify_session, session_id,
+                                lambda stored: stored.update(last_flight_search=last_flight_search))
         
         return response
         
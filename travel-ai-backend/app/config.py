@@ -23,6 +23,48 @@ class Settings:
     # SerpAPI for Google Flights
     SERPAPI_KEY = os.getenv("SERPAPI_KEY", "")
     
+    # Shared HTTP connection pool for SerpAPI requests
+    SERPAPI_CONNECTION_LIMIT = int(os.getenv("SERPAPI_CONNECTION_LIMIT", "20"))
+    SERPAPI_KEEPALIVE_SECONDS = float(os.getenv("SERPAPI_KEEPALIVE_SECONDS", "30"))
+    SERPAPI_DNS_CACHE_SECONDS = int(os.getenv("SERPAPI_DNS_CACHE_SECONDS", "300"))
+    SERPAPI_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_TIMEOUT_SECONDS", "30"))
+    
+    # Flight search result cache (served stale for up to STALE seconds past the TTL while refreshing)
+    FLIGHT_CACHE_TTL_SECONDS = float(os.getenv("FLIGHT_CACHE_TTL_SECONDS", "300"))
+    FLIGHT_CACHE_STALE_SECONDS = float(os.getenv("FLIGHT_CACHE_STALE_SECONDS", "600"))
+    FLIGHT_CACHE_MAX_ENTRIES = int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "1000"))
+    
+    # Flexible-date searches: departure days per search and concurrent upstream calls
+    FLEXIBLE_SEARCH_MAX_DAYS = int(os.getenv("FLEXIBLE_SEARCH_MAX_DAYS", "14"))
+    FLEXIBLE_SEARCH_CONCURRENCY = int(os.getenv("FLEXIBLE_SEARCH_CONCURRENCY", "4"))
+    # Airport-pair searches per flexible request, shared by its departure days (always at least one per day)
+    FLEXIBLE_SEARCH_MAX_SEARCHES = int(os.getenv("FLEXIBLE_SEARCH_MAX_SEARCHES", "28"))
+    
+    # Cities with several airports: airport pairs searched per request (main airports first)
+    MULTI_AIRPORT_MAX_SEARCHES = int(os.getenv("MULTI_AIRPORT_MAX_SEARCHES", "6"))
+    
+    # Speculative flight searches started once a chat knows the route and dates
+    FLIGHT_PREFETCH_ENABLED = os.getenv("FLIGHT_PREFETCH_ENABLED", "true").lower() == "true"
+    FLIGHT_PREFETCH_MAX_SESSIONS = int(os.getenv("FLIGHT_PREFETCH_MAX_SESSIONS", "1000"))
+    
+    # Gemini calls: per-call timeout and calls in flight per process
+    GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+    GEMINI_MAX_CONCURRENT_CALLS = int(os.getenv("GEMINI_MAX_CONCURRENT_CALLS", "8"))
+    
+    # Chat prompt context: recent turns kept verbatim, and the summary budget for older ones
+    CHAT_CONTEXT_WINDOW_TURNS = int(os.getenv("CHAT_CONTEXT_WINDOW_TURNS", "6"))
+    CHAT_CONTEXT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_CONTEXT_SUMMARY_MAX_CHARS", "1200"))
+    
+    # Parse short chat replies locally before falling back to Gemini
+    CHAT_FAST_PATH_ENABLED = os.getenv("CHAT_FAST_PATH_ENABLED", "true").lower() == "true"
+    
+    # Chat session store: "memory" (per process) or "sqlite" (shared by the workers on one host)
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite")
+    SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+    SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+    
     # Use real API if key is available, otherwise mock
     USE_MOCK_DATA = os.getenv("USE_MOCK_DATA", "false").lower() == "true"
 
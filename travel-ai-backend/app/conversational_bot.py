@@ -1,15 +1,17 @@
 import os
+import re
 import json
 from dotenv import load_dotenv
 from datetime import date
 from app.models.travel_models import FlightSearchRequest, BudgetLevel
 
+from app.core.ai_engine import generativeai, get_llm_gateway
+from app.core.conversation_context import ConversationContext
+from app.core.preference_extractor import get_preference_extractor
+from app.config import settings
+
 # Gemini setup
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+GEMINI_AVAILABLE = generativeai is not None
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -37,11 +39,14 @@ INITIAL_STATE = {
 
 # Gemini wrapper
 
-def call_gemini_update_state(state, user_message, conversation_history=[]):
+def _build_update_state_prompt(state, user_message, conversation_history):
     """
-    Calls Gemini to update the state JSON, return missing fields, and suggest the next question to ask.
-    If Gemini is not available, uses a mock function.
+    Build the prompt asking Gemini to update the trip state and pick the next question.
+    `conversation_history` is a ConversationContext or a list of earlier user messages;
+    the state itself carries everything learned so far and is rendered compactly with it.
     """
+    if not isinstance(conversation_history, ConversationContext):
+        conversation_history = ConversationContext.from_user_messages(conversation_history or [])
     # Define the schema outside the f-string to avoid formatting issues
     schema = '''
 {
@@ -75,8 +80,9 @@ def call_gemini_update_state(state, user_message, conversation_history=[]):
     The user's trip info is stored in a JSON object. Here is the schema:
     {schema}
 
-    CURRENT INFO: {json.dumps(state)}
-    CHAT HISTORY: {' '.join([f"USER: {msg}" for msg in conversation_history[-2:] if conversation_history])}
+    {conversation_history.render(state)}
+
+    KNOWN TRIP DETAILS lists only the fields filled in so far; every other field is still missing.
     USER SAID: "{user_message}"
     TODAY'S DATE: {date.today().strftime("%Y-%m-%d")}
 
@@ -103,112 +109,231 @@ def call_gemini_update_state(state, user_message, conversation_history=[]):
     - accessibility_needs (string, can be "none" if no needs)
     - dietary_needs (string, can be "none" if no needs)
 
-    RESPONSE (JSON ONLY):
+    RESPONSE (JSON ONLY, keys in this order):
     {{
+      "next_question": "ONE_NATURAL_CONVERSATIONAL_QUESTION_OR_EMPTY_STRING_IF_ALL_COMPLETE",
       "updated_json": {{UPDATED_STATE}},
-      "missing_fields": ["MOST_IMPORTANT_MISSING_FIELDS_FIRST"],
-      "next_question": "ONE_NATURAL_CONVERSATIONAL_QUESTION_OR_EMPTY_STRING_IF_ALL_COMPLETE"
+      "missing_fields": ["MOST_IMPORTANT_MISSING_FIELDS_FIRST"]
     }}
     """
+    return prompt
+
+
+def _parse_update_state_response(state, response_text):
+    """Parse Gemini's state update into (updated_state, missing_fields, next_question)."""
+    try:
+        match = re.search(r'\{[\s\S]*\}', response_text)
+        if match:
+            result = json.loads(match.group(0))
+            # Fields Gemini leaves out keep their current value
+            return {**state, **result["updated_json"]}, result["missing_fields"], result["next_question"]
+        print("[Gemini parsing error] no JSON object in the reply")
+    except Exception as e:
+        print("[Gemini parsing error]", e)
+    missing = [k for k, v in state.items() if v is None]
+    return state, missing, "Sorry, I had trouble understanding. Could you tell me more?"
+
+
+class _StreamedStringField:
+    """
+    Decodes one string field of a JSON object while the JSON is still streaming in,
+    so the next question can be forwarded before Gemini finishes the whole reply.
+    """
+
+    def __init__(self, field):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._position = None
+        self.done = False
+
+    def feed(self, text):
+        """Add streamed text; returns the newly decoded part of the field's value."""
+        self._buffer += text
+        if self.done:
+            return ""
+        if self._position is None:
+            match = self._start.search(self._buffer)
+            if not match:
+                return ""
+            self._position = match.end()
+
+        buffer, position, decoded = self._buffer, self._position, []
+        while position < len(buffer):
+            char = buffer[position]
+            if char == '"':
+                self.done = True
+                position += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                position += 1
+                continue
+            # Escapes are decoded once complete; \uD83D\uDE00-style surrogate pairs need both halves
+            size = 2
+            if buffer[position + 1:position + 2] == "u":
+                size = 12 if buffer[position + 2:position + 4].lower() in ("d8", "d9", "da", "db") else 6
+            if position + size > len(buffer):
+                break
+            try:
+                decoded.append(json.loads(f'"{buffer[position:position + size]}"'))
+            except ValueError:
+                decoded.append(buffer[position:position + size])
+            position += size
+        self._position = position
+        return "".join(decoded)
+
+
+def _mock_update_state(state):
+    # Mock: just fill the first missing field with a dummy value and ask about the next
+    missing = [k for k, v in state.items() if v is None]
+    if not missing:
+        return state, [], "Thank you! All information is collected."
+    state = state.copy()
+    state[missing[0]] = f"mock_{missing[0]}"
+    next_question = f"Could you please tell me your {missing[1].replace('_', ' ')}?" if len(missing) > 1 else "Thank you! All information is collected."
+    return state, missing[1:], next_question
+
+
+def call_gemini_update_state(state, user_message, conversation_history=[]):
+    """
+    Calls Gemini to update the state JSON, return missing fields, and suggest the next question to ask.
+    Short replies the rule-based extractor can fully parse skip Gemini.
+    If Gemini is not available, uses a mock function.
+    """
+    if settings.CHAT_FAST_PATH_ENABLED:
+        local_update = get_preference_extractor().update_state(state, user_message, conversation_history)
+        if local_update:
+            return local_update
+    prompt = _build_update_state_prompt(state, user_message, conversation_history)
     if GEMINI_AVAILABLE and GEMINI_API_KEY:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-2.5-flash")  # Updated to latest model
-        response = model.generate_content(prompt)
-        try:
-            import re
-            match = re.search(r'\{[\s\S]*\}', response.text)
-            if match:
-                result = json.loads(match.group(0))
-                return result["updated_json"], result["missing_fields"], result["next_question"]
-        except Exception as e:
-            print("[Gemini parsing error]", e)
-            missing = [k for k, v in state.items() if v is None]
-            return state, missing, "Sorry, I had trouble understanding. Could you tell me more?"
+        response = get_llm_gateway(GEMINI_API_KEY).generate_content(prompt)
+        return _parse_update_state_response(state, response.text)
     else:
-        # Mock: just fill the first missing field with a dummy value and ask about the next
-        missing = [k for k, v in state.items() if v is None]
-        if not missing:
-            return state, [], "Thank you! All information is collected."
-        state = state.copy()
-        state[missing[0]] = f"mock_{missing[0]}"
-        next_question = f"Could you please tell me your {missing[1].replace('_', ' ')}?" if len(missing) > 1 else "Thank you! All information is collected."
-        return state, missing[1:], next_question
+        return _mock_update_state(state)
 
 
-def extract_flight_parameters_from_state(state):
+async def call_gemini_update_state_async(state, user_message, conversation_history=[]):
     """
-    Extract flight search parameters from the conversation state using Gemini.
-    Maps the collected travel information to FlightSearchRequest format.
+    Async version of call_gemini_update_state for request handlers.
+    Awaits Gemini without blocking the event loop, so other requests keep being served.
     """
-    from app.flights.serpapi_adapter import SerpApiAdapter
-    
-    print(f"[DEBUG] Extracting from state: {json.dumps(state, indent=2)}")
-    
-    # Initialize airport code mapper
-    serpapi_adapter = SerpApiAdapter()
-    
-    # Extract and convert city names to airport codes
-    origin_city = state.get("starting_location")
-    destination_city = state.get("destination")
+    if settings.CHAT_FAST_PATH_ENABLED:
+        local_update = get_preference_extractor().update_state(state, user_message, conversation_history)
+        if local_update:
+            return local_update
+    prompt = _build_update_state_prompt(state, user_message, conversation_history)
+    if GEMINI_AVAILABLE and GEMINI_API_KEY:
+        response = await get_llm_gateway(GEMINI_API_KEY).generate_content_async(prompt)
+        return _parse_update_state_response(state, response.text)
+    else:
+        return _mock_update_state(state)
+
+
+async def stream_gemini_update_state(state, user_message, conversation_history=[]):
+    """
+    Streaming version of call_gemini_update_state_async.
+
+    Yields ("token", text) events with the next question as Gemini writes it, then a single
+    ("result", (updated_state, missing_fields, next_question)) event. The streamed text is a
+    preview: the question in the result is authoritative (e.g. when the reply fails to parse).
+    """
+    if settings.CHAT_FAST_PATH_ENABLED:
+        local_update = get_preference_extractor().update_state(state, user_message, conversation_history)
+        if local_update:
+            if local_update[2]:
+                yield "token", local_update[2]
+            yield "result", local_update
+            return
+    prompt = _build_update_state_prompt(state, user_message, conversation_history)
+    if GEMINI_AVAILABLE and GEMINI_API_KEY:
+        question = _StreamedStringField("next_question")
+        response_text = ""
+        async for chunk in get_llm_gateway(GEMINI_API_KEY).generate_content_stream_async(prompt):
+            response_text += chunk.text
+            text = question.feed(chunk.text)
+            if text:
+                yield "token", text
+        yield "result", _parse_update_state_response(state, response_text)
+    else:
+        result = _mock_update_state(state)
+        if result[2]:
+            yield "token", result[2]
+        yield "result", result
+
+
+def normalize_budget(budget_value):
+    """Convert various budget terms to accepted enum values"""
+    if not budget_value:
+        return "medium"
     
-    origin_code = serpapi_adapter.get_airport_code(origin_city) if origin_city else None
-    destination_code = serpapi_adapter.get_airport_code(destination_city) if destination_city else None
+    budget_str = str(budget_value).lower().strip()
     
-    # Budget mapping function
-    def normalize_budget(budget_value):
-        """Convert various budget terms to accepted enum values"""
-        if not budget_value:
-            return "medium"
-        
-        budget_str = str(budget_value).lower().strip()
+    # Map common budget terms to enum values
+    budget_mapping = {
+        # Low budget terms
+        "low": "low",
+        "cheap": "low", 
+        "budget": "low",
+        "economy": "low",
+        "basic": "low",
+        "minimal": "low",
         
-        # Map common budget terms to enum values
-        budget_mapping = {
-            # Low budget terms
-            "low": "low",
-            "cheap": "low", 
-            "budget": "low",
-            "economy": "low",
-            "basic": "low",
-            "minimal": "low",
-            
-            # Medium budget terms
-            "medium": "medium",
-            "moderate": "medium",
-            "standard": "medium",
-            "regular": "medium",
-            "average": "medium",
-            
-            # High budget terms
-            "high": "high",
-            "expensive": "high",
-            "premium": "high",
-            "luxury": "high",
-            "first-class": "high",
-            "business": "high"
-        }
+        # Medium budget terms
+        "medium": "medium",
+        "moderate": "medium",
+        "standard": "medium",
+        "regular": "medium",
+        "average": "medium",
         
-        return budget_mapping.get(budget_str, "medium")
+        # High budget terms
+        "high": "high",
+        "expensive": "high",
+        "premium": "high",
+        "luxury": "high",
+        "first-class": "high",
+        "business": "high"
+    }
+    
+    return budget_mapping.get(budget_str, "medium")
+
+
+def flight_parameters_from_state(state):
+    """Map the collected travel information to flight search parameters without Gemini."""
+    from app.flights.airport_index import resolve_airport_codes
+    
+    # Convert city names to airport codes (the airport index is shared process-wide).
+    # Cities with several airports stay as names so the flight search covers all of them.
+    def search_location(city):
+        codes = resolve_airport_codes(city)
+        return city if len(codes) > 1 else codes[0]
     
-    manual_params = {
-        "origin": origin_code,
-        "destination": destination_code,
+    origin_city = state.get("starting_location")
+    destination_city = state.get("destination")
+    return {
+        "origin": search_location(origin_city) if origin_city else None,
+        "destination": search_location(destination_city) if destination_city else None,
         "departure_date": state.get("dates_of_travel", {}).get("start_date"),
         "return_date": state.get("dates_of_travel", {}).get("end_date"),
         "num_travelers": state.get("number_of_travelers", 1),
         "budget": normalize_budget(state.get("budget")),
         "accessibility_requirements": bool(state.get("accessibility_needs"))
     }
+
+
+def _manual_flight_parameters(state):
+    """flight_parameters_from_state with debug logging."""
+    print(f"[DEBUG] Extracting from state: {json.dumps(state, indent=2)}")
+    
+    manual_params = flight_parameters_from_state(state)
     
     print(f"[DEBUG] Manual extraction result: {json.dumps(manual_params, indent=2)}")
-    print(f"[DEBUG] Converted {origin_city} -> {origin_code}, {destination_city} -> {destination_code}")
+    print(f"[DEBUG] Converted {state.get('starting_location')} -> {manual_params['origin']}, {state.get('destination')} -> {manual_params['destination']}")
     print(f"[DEBUG] Budget normalized: {state.get('budget')} -> {manual_params['budget']}")
-    
-    if manual_params.get("origin") and manual_params.get("destination"):
-        return manual_params
+    return manual_params
 
-    # Otherwise try Gemini extraction
-    prompt = f"""
+
+def _build_flight_extraction_prompt(state):
+    return f"""
     You are a travel data processor. Extract flight search parameters from the collected travel information.
     
     COLLECTED TRAVEL DATA: {json.dumps(state)}
@@ -235,35 +360,74 @@ def extract_flight_parameters_from_state(state):
       "accessibility_requirements": BOOLEAN
     }}
     """
+
+
+def _parse_flight_extraction_response(response_text):
+    print(f"[DEBUG] Gemini response: {response_text}")
     
+    import re
+    match = re.search(r'\{[\s\S]*\}', response_text)
+    if match:
+        flight_params = json.loads(match.group(0))
+        # Ensure budget is normalized even from Gemini response
+        if 'budget' in flight_params:
+            flight_params['budget'] = normalize_budget(flight_params['budget'])
+        print(f"[DEBUG] Gemini extraction result: {json.dumps(flight_params, indent=2)}")
+        return flight_params
+    return None
+
+
+_FLIGHT_EXTRACTION_UNAVAILABLE = {
+    "error": "Flight extraction not available. Please try again later."
+}
+
+
+def extract_flight_parameters_from_state(state):
+    """
+    Extract flight search parameters from the conversation state using Gemini.
+    Maps the collected travel information to FlightSearchRequest format.
+    """
+    manual_params = _manual_flight_parameters(state)
+    if manual_params.get("origin") and manual_params.get("destination"):
+        return manual_params
+
+    # Otherwise try Gemini extraction
     if GEMINI_AVAILABLE and GEMINI_API_KEY:
         try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            response = model.generate_content(prompt)
-            print(f"[DEBUG] Gemini response: {response.text}")
-            
-            import re
-            match = re.search(r'\{[\s\S]*\}', response.text)
-            if match:
-                flight_params = json.loads(match.group(0))
-                # Ensure budget is normalized even from Gemini response
-                if 'budget' in flight_params:
-                    flight_params['budget'] = normalize_budget(flight_params['budget'])
-                print(f"[DEBUG] Gemini extraction result: {json.dumps(flight_params, indent=2)}")
+            response = get_llm_gateway(GEMINI_API_KEY).generate_content(_build_flight_extraction_prompt(state))
+            flight_params = _parse_flight_extraction_response(response.text)
+            if flight_params:
                 return flight_params
         except Exception as e:
             print(f"[Flight extraction error]: {e}")
-            # Fall back to manual extraction
-            return manual_params if manual_params.get("origin") and manual_params.get("destination") else None
+            return None
     
-    # If Gemini not available, return manual extraction or error
+    # If Gemini not available, the manual extraction is incomplete
+    return dict(_FLIGHT_EXTRACTION_UNAVAILABLE)
+
+
+async def extract_flight_parameters_from_state_async(state):
+    """
+    Async version of extract_flight_parameters_from_state for request handlers.
+    """
+    manual_params = _manual_flight_parameters(state)
     if manual_params.get("origin") and manual_params.get("destination"):
         return manual_params
-    else:
-        return {
-            "error": "Flight extraction not available. Please try again later."
-        }
+
+    # Otherwise try Gemini extraction
+    if GEMINI_AVAILABLE and GEMINI_API_KEY:
+        try:
+            response = await get_llm_gateway(GEMINI_API_KEY).generate_content_async(
+                _build_flight_extraction_prompt(state))
+            flight_params = _parse_flight_extraction_response(response.text)
+            if flight_params:
+                return flight_params
+        except Exception as e:
+            print(f"[Flight extraction error]: {e}")
+            return None
+    
+    # If Gemini not available, the manual extraction is incomplete
+    return dict(_FLIGHT_EXTRACTION_UNAVAILABLE)
 
 
 def is_conversation_complete(state):
@@ -0,0 +1,167 @@
+"""
+Shared gateway for Gemini calls
+
+Owns long-lived Gemini clients so callers stop configuring the SDK and
+building models on every call. Both SDKs used in this project are
+supported: google.generativeai (API key, GenerativeModel) and google.genai
+(Vertex AI Client). Models and clients are created lazily and reused,
+every call gets a timeout, and a per-process semaphore caps how many
+Gemini calls are in flight (GEMINI_TIMEOUT_SECONDS and
+GEMINI_MAX_CONCURRENT_CALLS in the settings). The ai-brain scripts share it.
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+try:
+    import google.generativeai as generativeai
+except ImportError:
+    generativeai = None
+
+try:
+    from google import genai as vertex_genai
+    from google.genai import types as vertex_types
+except ImportError:
+    vertex_genai = None
+    vertex_types = None
+
+from app.config import settings
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the Gemini SDK a call needs is not installed."""
+
+
+class LLMGateway:
+    """
+    Long-lived Gemini models and clients behind a concurrency limit.
+
+    Sync callers wait on a thread semaphore and async callers on an asyncio
+    semaphore (created for the running event loop), each with
+    `max_concurrent_calls` slots. Unset limits come from the settings.
+    """
+
+    def __init__(self, api_key: Optional[str] = None,
+                 vertex_project: Optional[str] = None,
+                 vertex_location: str = "global",
+                 timeout_seconds: Optional[float] = None,
+                 max_concurrent_calls: Optional[int] = None):
+        self.api_key = api_key
+        self.vertex_project = vertex_project
+        self.vertex_location = vertex_location
+        self.timeout_seconds = timeout_seconds or settings.GEMINI_TIMEOUT_SECONDS
+        self.max_concurrent_calls = max_concurrent_calls or settings.GEMINI_MAX_CONCURRENT_CALLS
+
+        self._lock = threading.Lock()
+        self._models: Dict[str, Any] = {}
+        self._client = None
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrent_calls)
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # google.generativeai (API key)
+
+    def model(self, name: str = DEFAULT_MODEL):
+        """Return the shared GenerativeModel for `name`, configuring the SDK on first use."""
+        if generativeai is None:
+            raise LLMUnavailableError("google.generativeai is not installed")
+        with self._lock:
+            if name not in self._models:
+                if not self._models:
+                    generativeai.configure(api_key=self.api_key)
+                self._models[name] = generativeai.GenerativeModel(name)
+            return self._models[name]
+
+    def _request_options(self) -> Dict[str, float]:
+        return {"timeout": self.timeout_seconds}
+
+    def generate_content(self, prompt: Any, model: str = DEFAULT_MODEL,
+                         generation_config: Optional[Any] = None):
+        """Blocking generate_content on the shared model, within the concurrency limit."""
+        gemini_model = self.model(model)
+        with self._semaphore:
+            return gemini_model.generate_content(prompt, generation_config=generation_config,
+                                                 request_options=self._request_options())
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore is None or self._async_loop is not loop:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+            self._async_loop = loop
+        return self._async_semaphore
+
+    async def generate_content_async(self, prompt: Any, model: str = DEFAULT_MODEL,
+                                     generation_config: Optional[Any] = None):
+        """Async generate_content on the shared model, within the concurrency limit."""
+        gemini_model = self.model(model)
+        async with self._get_async_semaphore():
+            return await gemini_model.generate_content_async(prompt, generation_config=generation_config,
+                                                             request_options=self._request_options())
+
+    async def generate_content_stream_async(self, prompt: Any, model: str = DEFAULT_MODEL,
+                                            generation_config: Optional[Any] = None) -> AsyncIterator[Any]:
+        """Stream response chunks from the shared model; the call holds a slot until it finishes."""
+        gemini_model = self.model(model)
+        async with self._get_async_semaphore():
+            response = await gemini_model.generate_content_async(prompt, generation_config=generation_config,
+                                                                 stream=True,
+                                                                 request_options=self._request_options())
+            async for chunk in response:
+                yield chunk
+
+    # google.genai (Vertex AI)
+
+    def client(self):
+        """Return the shared google.genai Client for the configured Vertex AI project."""
+        if vertex_genai is None:
+            raise LLMUnavailableError("google.genai is not installed")
+        with self._lock:
+            if self._client is None:
+                self._client = vertex_genai.Client(
+                    vertexai=True,
+                    project=self.vertex_project,
+                    location=self.vertex_location,
+                    # google.genai timeouts are in milliseconds
+                    http_options=vertex_types.HttpOptions(timeout=int(self.timeout_seconds * 1000)),
+                )
+            return self._client
+
+    def client_generate_content(self, contents: Any, config: Optional[Any] = None,
+                                model: str = DEFAULT_MODEL):
+        """Blocking generate_content on the shared Vertex AI client, within the concurrency limit."""
+        client = self.client()
+        with self._semaphore:
+            return client.models.generate_content(model=model, contents=contents, config=config)
+
+    def client_generate_content_stream(self, contents: Any, config: Optional[Any] = None,
+                                       model: str = DEFAULT_MODEL) -> Iterator[Any]:
+        """Stream chunks from the shared Vertex AI client; the call holds a slot until it finishes."""
+        client = self.client()
+        with self._semaphore:
+            yield from client.models.generate_content_stream(model=model, contents=contents, config=config)
+
+
+_gateways: Dict[Tuple[Optional[str], Optional[str], str], LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def get_llm_gateway(api_key: Optional[str] = None,
+                    vertex_project: Optional[str] = None,
+                    vertex_location: str = "global") -> LLMGateway:
+    """
+    Return the process-wide gateway for a set of credentials, creating it on first use.
+
+    google.generativeai keeps its API key in global SDK state, so only one API
+    key is supported per process; asking for a second one raises ValueError
+    instead of silently calling Gemini with the first.
+    """
+    key = (api_key, vertex_project, vertex_location)
+    with _gateways_lock:
+        if key not in _gateways:
+            if api_key and any(other[0] and other[0] != api_key for other in _gateways):
+                raise ValueError("Only one Gemini API key is supported per process")
+            _gateways[key] = LLMGateway(api_key, vertex_project, vertex_location)
+        return _gateways[key]
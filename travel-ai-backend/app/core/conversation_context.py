@@ -0,0 +1,96 @@
+"""
+Bounded conversation context for Gemini prompts
+
+Chat prompts used to carry the whole conversation, so their size (and
+latency and cost) grew with every turn. A ConversationContext keeps the
+most recent turns verbatim and folds older ones into a short summary with
+a fixed character budget. The trip details extracted so far are the
+canonical memory: they are rendered with every prompt, so facts from
+turns that have been folded away are never lost. Like the LLM gateway,
+the ai-brain chatbot shares it.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+# How much of a folded turn is kept in the summary. User turns carry the
+# trip details, assistant turns are mostly the questions that prompted them.
+FOLDED_CHARS = {"user": 200, "assistant": 80}
+ROLE_LABELS = {"user": "USER", "assistant": "ASSISTANT"}
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def compact_state(state: Optional[Dict[str, Any]]) -> str:
+    """Serialize only the filled-in trip details, compactly."""
+    filled = {key: value for key, value in (state or {}).items() if value not in (None, "", [], {})}
+    return json.dumps(filled, separators=(",", ":"), default=str)
+
+
+class ConversationContext:
+    """
+    Rolling window of recent turns plus a summary of older ones.
+
+    Turns are (role, text) pairs with role "user" or "assistant". Once more
+    than `window_turns` turns are held, the oldest is shortened and appended
+    to the summary; when the summary exceeds `summary_max_chars`, its oldest
+    lines are dropped. Both default to the CHAT_CONTEXT_* settings.
+    """
+
+    def __init__(self, window_turns: Optional[int] = None,
+                 summary_max_chars: Optional[int] = None,
+                 turns: Optional[Iterable[Tuple[str, str]]] = None,
+                 summary: str = ""):
+        self.window_turns = window_turns or settings.CHAT_CONTEXT_WINDOW_TURNS
+        self.summary_max_chars = summary_max_chars or settings.CHAT_CONTEXT_SUMMARY_MAX_CHARS
+        self.turns: List[Tuple[str, str]] = []
+        self.summary = summary
+        for role, text in turns or []:
+            self.add(role, text)
+
+    def add(self, role: str, text: str):
+        """Record a turn, folding the oldest turns into the summary when the window is full."""
+        if not text:
+            return
+        self.turns.append((role, text))
+        while len(self.turns) > self.window_turns:
+            self._fold(*self.turns.pop(0))
+
+    def _fold(self, role: str, text: str):
+        line = f"{ROLE_LABELS.get(role, role.upper())}: {_shorten(text, FOLDED_CHARS.get(role, 80))}"
+        lines = self.summary.splitlines() + [line]
+        while len(lines) > 1 and sum(len(kept) + 1 for kept in lines) > self.summary_max_chars:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def render(self, state: Optional[Dict[str, Any]] = None) -> str:
+        """Render the context as prompt text: known trip details, earlier summary, then recent turns."""
+        sections = []
+        if state is not None:
+            sections.append(f"KNOWN TRIP DETAILS: {compact_state(state)}")
+        if self.summary:
+            sections.append(f"EARLIER IN THE CONVERSATION (condensed):\n{self.summary}")
+        if self.turns:
+            recent = "\n".join(f"{ROLE_LABELS.get(role, role.upper())}: {text}" for role, text in self.turns)
+            sections.append(f"RECENT MESSAGES:\n{recent}")
+        return "\n\n".join(sections)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly form for storing the context in a session."""
+        return {"summary": self.summary, "turns": [list(turn) for turn in self.turns]}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]], **kwargs) -> "ConversationContext":
+        data = data or {}
+        return cls(turns=[tuple(turn) for turn in data.get("turns", [])],
+                   summary=data.get("summary", ""), **kwargs)
+
+    @classmethod
+    def from_user_messages(cls, messages: Iterable[str], **kwargs) -> "ConversationContext":
+        """Build a context from a plain list of user messages (the old session "history" format)."""
+        return cls(turns=[("user", message) for message in messages], **kwargs)
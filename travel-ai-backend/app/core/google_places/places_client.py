@@ -0,0 +1,246 @@
+"""
+Pooled HTTP client for the Google Places web service
+
+Shared by the backend and the ai-brain scripts, so it only depends on
+requests and aiohttp. One client keeps its connections alive across calls,
+applies a per-call timeout and retries throttled or failing requests with
+exponential backoff. The sync interface is safe to share between threads;
+the async interface keeps one aiohttp session per event loop.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+PLACES_BASE_URL = "https://maps.googleapis.com/maps/api/place/"
+
+DEFAULT_TIMEOUT_SECONDS = 15.0
+DEFAULT_POOL_SIZE = 8
+DEFAULT_KEEPALIVE_SECONDS = 30.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 8.0
+
+# Places statuses that mean "try again later" rather than "this request is wrong"
+RETRYABLE_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PlacesApiError(Exception):
+    """Raised when a Places request fails at the HTTP level after all retries."""
+
+
+def _describe_failure(error: BaseException) -> str:
+    """Describe a failed request without echoing its URL, which carries the API key."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"HTTP {error.status}"
+    return type(error).__name__
+
+
+def backoff_delay(attempt: int, base_seconds: float = DEFAULT_BACKOFF_SECONDS,
+                  max_seconds: float = MAX_BACKOFF_SECONDS) -> float:
+    """Exponential backoff with jitter for the given retry attempt (0-based)."""
+    delay = min(max_seconds, base_seconds * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class PlacesClient:
+    """
+    Google Places client with connection pooling, timeouts and retries.
+
+    Responses are returned as decoded JSON whatever their Places "status";
+    only OVER_QUERY_LIMIT/UNKNOWN_ERROR responses, 429/5xx answers, bodies
+    that are not JSON, timeouts and connection errors are retried. When
+    retries run out, the last Places response is returned, or PlacesApiError
+    is raised for HTTP and decoding failures.
+    """
+
+    def __init__(self, api_key: str,
+                 timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 keepalive_seconds: float = DEFAULT_KEEPALIVE_SECONDS,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+                 base_url: str = PLACES_BASE_URL):
+        self.api_key = api_key
+        self.timeout_seconds = timeout_seconds
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.base_url = base_url
+        self.requests_made = 0
+        self.retries = 0
+
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._async_session: Optional[aiohttp.ClientSession] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _url(self, endpoint: str) -> str:
+        return f"{self.base_url}{endpoint}/json"
+
+    def _params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {**params, "key": self.api_key}
+
+    def _should_retry(self, data: Dict[str, Any], attempt: int) -> bool:
+        return data.get("status") in RETRYABLE_STATUSES and attempt < self.max_retries
+
+    def _count(self, attempt: int):
+        with self._lock:
+            self.requests_made += 1
+            if attempt:
+                self.retries += 1
+
+    # Sync interface
+
+    def _get_session(self) -> requests.Session:
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def get_json(self, endpoint: str, params: Dict[str, Any],
+                 timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        GET a Places endpoint (e.g. "details", "nearbysearch") and return its JSON body.
+
+        Args:
+            endpoint (str): Endpoint name under the Places base URL.
+            params (dict): Query parameters; the API key is added automatically.
+            timeout_seconds (float): Overrides the client's timeout for this call.
+        """
+        session = self._get_session()
+        url, params = self._url(endpoint), self._params(params)
+        timeout = timeout_seconds or self.timeout_seconds
+        attempt = 0
+        while True:
+            self._count(attempt)
+            try:
+                response = session.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                data = response.json()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = e.response is None or e.response.status_code in RETRYABLE_HTTP_STATUSES
+                if not retryable or attempt >= self.max_retries:
+                    raise PlacesApiError(f"Places {endpoint} request failed: {_describe_failure(e)}") from e
+            except ValueError as e:
+                # A body that is not JSON (e.g. a proxy error page)
+                if attempt >= self.max_retries:
+                    raise PlacesApiError(f"Places {endpoint} returned a response that is not JSON") from e
+            else:
+                if not self._should_retry(data, attempt):
+                    return data
+            time.sleep(backoff_delay(attempt, self.backoff_seconds))
+            attempt += 1
+
+    def place_details(self, place_id: str, fields: List[str], language: str = "en",
+                      timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Fetch Place Details for `fields` and return the full response (status and result)."""
+        return self.get_json("details", {
+            "place_id": place_id,
+            "fields": ",".join(fields),
+            "language": language
+        }, timeout_seconds)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Async interface
+
+    async def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            await self._close_stale_async_session()
+            connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                             keepalive_timeout=self.keepalive_seconds)
+            self._async_session = aiohttp.ClientSession(connector=connector)
+            self._async_loop = loop
+        return self._async_session
+
+    async def _close_stale_async_session(self):
+        """Close the session opened on a previous event loop instead of leaking its connections."""
+        session, loop = self._async_session, self._async_loop
+        self._async_session = self._async_loop = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running():
+            # Still in use by another thread's loop: close it there
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        try:
+            await session.close()
+        except RuntimeError:
+            # Its loop is already closed, and the open sockets with it
+            pass
+
+    async def get_json_async(self, endpoint: str, params: Dict[str, Any],
+                             timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Async version of get_json, on a pooled aiohttp session."""
+        session = await self._get_async_session()
+        url, params = self._url(endpoint), self._params(params)
+        timeout = aiohttp.ClientTimeout(total=timeout_seconds or self.timeout_seconds)
+        attempt = 0
+        while True:
+            self._count(attempt)
+            try:
+                async with session.get(url, params=params, timeout=timeout) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+            except (aiohttp.ContentTypeError, ValueError) as e:
+                # A body that is not JSON (e.g. a proxy error page)
+                if attempt >= self.max_retries:
+                    raise PlacesApiError(f"Places {endpoint} returned a response that is not JSON") from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = (not isinstance(e, aiohttp.ClientResponseError)
+                             or e.status in RETRYABLE_HTTP_STATUSES)
+                if not retryable or attempt >= self.max_retries:
+                    raise PlacesApiError(f"Places {endpoint} request failed: {_describe_failure(e)}") from e
+            else:
+                if not self._should_retry(data, attempt):
+                    return data
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_seconds))
+            attempt += 1
+
+    async def place_details_async(self, place_id: str, fields: List[str], language: str = "en",
+                                  timeout_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Async version of place_details."""
+        return await self.get_json_async("details", {
+            "place_id": place_id,
+            "fields": ",".join(fields),
+            "language": language
+        }, timeout_seconds)
+
+    async def aclose(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+            self._async_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
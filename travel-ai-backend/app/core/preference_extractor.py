@@ -0,0 +1,484 @@
+"""
+Rule-based fast path for the chat flow
+
+Many chat turns answer the last question with a short, predictable reply
+("2 people", "March 3 to March 7", "vegetarian", "no"). PreferenceExtractor
+parses those locally into the trip state, so the turn skips the Gemini
+round trip. It only answers when every word of the message is accounted
+for; anything it cannot fully explain is left to Gemini.
+"""
+
+import re
+import threading
+from collections import Counter
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.conversation_context import ConversationContext
+
+# Missing fields are reported core trip details first, like the Gemini prompt asks for
+FIELD_ORDER = [
+    "starting_location", "destination", "dates_of_travel", "number_of_travelers", "trip_type", "budget",
+    "interests", "how_packed_trip", "ok_with_walking", "age_group_of_travelers", "accessibility_needs",
+    "dietary_needs"
+]
+
+FIELD_QUESTIONS = {
+    "starting_location": "Where will you be traveling from?",
+    "destination": "Where would you like to go?",
+    "dates_of_travel": "What dates are you thinking of for the trip?",
+    "number_of_travelers": "How many people are traveling?",
+    "trip_type": "What kind of trip is this - leisure, business, adventure, cultural, family or romantic?",
+    "budget": "What's your budget like - economy, mid-range or luxury?",
+    "interests": "What do you enjoy doing when you travel?",
+    "how_packed_trip": "Do you prefer a relaxed, moderate or busy pace?",
+    "ok_with_walking": "Are you okay with a fair amount of walking?",
+    "age_group_of_travelers": "What age group are the travelers in?",
+    "accessibility_needs": "Does anyone in your group have accessibility needs?",
+    "dietary_needs": "Any dietary restrictions I should know about?",
+}
+
+# Which field the last question asked about, checked in order
+QUESTION_TOPICS = [
+    ("ok_with_walking", r"\bwalk"),
+    ("dietary_needs", r"\bdiet|\ballerg|\beat\b|\bfood restriction"),
+    ("accessibility_needs", r"\baccessib|\bmobility|\bwheelchair|\bdisabilit"),
+    ("age_group_of_travelers", r"\bage\b|\bages\b|\bhow old"),
+    ("number_of_travelers", r"\bhow many (?:people|persons|travell?ers|adults|guests|of you)\b"
+                            r"|\bparty size|\bwho(?:'s| is) (?:coming|going|traveling)"),
+    ("starting_location", r"\b(?:traveling|travelling|flying|leaving|departing|coming|starting) from\b"
+                          r"|\bwhere\b.*\bfrom\b|\bhome (?:city|airport)"),
+    ("destination", r"\bwhere\b.*\b(?:go|going|travel|traveling|head|heading|visit|fly|flying)\b|\bdestination"),
+    ("trip_type", r"\b(?:type|kind|sort) of (?:trip|travel|vacation)|\bpurpose of"),
+    ("how_packed_trip", r"\bpace\b|\bpacked\b"),
+    ("budget", r"\bbudget|\bspend\b|\bprice range"),
+    ("interests", r"\binterest|\benjoy|\bactivities|\blike to do"),
+    ("dates_of_travel", r"\bdates?\b|\bwhen\b|\bhow long"),
+]
+
+# "How many" questions about anything but the whole party ("how many nights", "how many are kids")
+# make a bare number ambiguous
+OTHER_COUNT_QUESTION_RE = r"\bhow many\b.*\b(?:days?|nights?|weeks?|kids?|child|children)\b"
+
+FILLER_WORDS = set("""
+a an the and or but so to of for in on at from with by as my our we us i i'm im we're were it it's its
+is are was be will would like prefer want wanna think please thanks thank you well um uh hmm actually
+just about around roughly let's lets say that this there then also trip travel traveling travelling
+flying fly going go leaving leave heading head visit visiting planning plan dates date budget pace
+schedule through thru until till between back returning return looking
+""".split())
+
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                 "nine": 9, "ten": 10}
+_NUMBER = r"(\d{1,2}|" + "|".join(_NUMBER_WORDS) + r")"
+TRAVELERS_RE = _NUMBER + r"\s+(?:people|persons|travell?ers|adults|guests|of us|pax)\b"
+SOLO_RE = r"\b(?:just me|only me|myself|solo|alone)\b"
+
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s*(\d{4}))?"
+_RANGE = r"\s*(?:-|–|to|through|thru|until|till)\s*"
+SAME_MONTH_RANGE_RE = rf"\b{_MONTH}\s+{_DAY}{_RANGE}{_DAY}\b{_YEAR}"
+# Single dates as (pattern, order of the year/month/day groups)
+DATE_PATTERNS = [
+    (r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b", "ymd"),
+    (rf"\b{_MONTH}\s+{_DAY}\b{_YEAR}", "mdy"),
+    (rf"\b{_DAY}\s+(?:of\s+)?{_MONTH}{_YEAR}", "dmy"),
+    (r"\b(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?\b", "mdy"),
+]
+
+BUDGET_CHOICES = [
+    (r"\b(?:luxury|luxurious|high[- ]end|splurge)\b", "luxury"),
+    (r"\b(?:mid[- ]?range|medium budget|moderate budget)\b", "mid-range"),
+    (r"\b(?:cheap|cheapest|economy|budget[- ]friendly|on a budget|low budget|tight budget|affordable)\b", "economy"),
+]
+BUDGET_ANSWERS = [
+    (r"\b(?:high|expensive|premium)\b", "luxury"),
+    (r"\b(?:mid|medium|moderate|average|middle)\b", "mid-range"),
+    (r"\b(?:low|budget|frugal)\b", "economy"),
+]
+
+_TRIP_TYPES = {
+    "Leisure": r"leisure|vacation|holiday|relaxing",
+    "Business": r"business|work",
+    "Adventure": r"adventure|adventurous",
+    "Cultural": r"cultural|culture",
+    "Family": r"family",
+    "Romantic": r"romantic|romance",
+}
+TRIP_TYPE_CHOICES = [
+    (rf"\b(?:{words})\s+(?:trip|travel|vacation|getaway|holiday)\b", trip_type)
+    for trip_type, words in _TRIP_TYPES.items()
+] + [(r"\b(?:honeymoon|anniversary)\b", "Romantic")]
+TRIP_TYPE_ANSWERS = [(rf"\b(?:{words})\b", trip_type) for trip_type, words in _TRIP_TYPES.items()]
+
+_PACES = {
+    "Relaxed": r"relaxed|slow|laid[- ]back|easy|leisurely|chill",
+    "Moderate": r"moderate|balanced|medium",
+    "Busy": r"busy|packed|fast|full|intense",
+}
+PACE_CHOICES = [
+    (rf"\b(?:{words})\s+(?:pace|schedule|itinerary)\b", pace) for pace, words in _PACES.items()
+] + [(r"\btake it easy\b", "Relaxed"), (r"\bjam[- ]packed\b", "Busy")]
+PACE_ANSWERS = [(rf"\b(?:{words})\b", pace) for pace, words in _PACES.items()]
+
+WALKING_CHOICES = [
+    (r"\b(?:walking is (?:fine|ok|okay|good|great)|(?:fine|ok|okay|happy|good) with walking|love walking"
+     r"|(?:don't|do not) mind walking)\b", True),
+    (r"\b(?:no (?:long )?walking|(?:can't|cannot) walk(?: much| far)?|not (?:much|a lot of) walking"
+     r"|(?:minimal|limited) walking|avoid walking)\b", False),
+]
+YES_NO_ANSWERS = [
+    (r"\b(?:yes|yeah|yep|yup|sure|definitely|absolutely|of course|ok|okay|fine|totally)\b", True),
+    (r"\b(?:no|nope|nah|not really|not much|not at all)\b", False),
+]
+
+DIET_RE = (r"\b(?:vegetarian|vegan|pescatarian|gluten[- ]free|dairy[- ]free|lactose[- ]intolerant|nut[- ]free"
+           r"|(?:nut|peanut|shellfish) allerg(?:y|ies)|halal|kosher|keto|celiac)\b")
+ACCESSIBILITY_CHOICES = [
+    (r"\bwheelchair(?: user| access| accessible)?\b", "wheelchair accessible"),
+    (r"\b(?:limited|reduced) mobility\b", "limited mobility"),
+]
+NONE_ANSWER_RE = (r"\b(?:no restrictions|no dietary (?:needs|restrictions)|no needs|(?:we|i) eat anything"
+                  r"|none|nothing|no|nope|n/a|not really)\b")
+
+AGE_RE = (r"\b(?:adults?|seniors?|kids?|children|child|teens?|teenagers?|toddlers?|infants?|bab(?:y|ies)"
+          r"|elderly|retirees?|retired|young|middle[- ]aged|\d0s|\d{1,2}\s*(?:-|to)\s*\d{1,2}|\d{1,2})\b")
+INTERESTS_PREFIX_RE = r"^(?:(?:i|we)(?:'m|'re| am| are)?\s+)?(?:really\s+)?(?:like|love|enjoy|into|interested in)\s+"
+INTERESTS_SPLIT_RE = r"\s*(?:,|;|&|/|\band\b|\bplus\b)\s*"
+# Replies that do not answer the question, or only hedge ("not sure", "anything", "maybe 30"):
+# free-text fields are left to Gemini
+NON_ANSWER_RE = (r"\b(?:not sure|unsure|(?:don't|do not|dont) know|idk|dunno|no idea|whatever|anything|no preference"
+                 r"|(?:don't|do not|dont) care|(?:doesn't|does not) matter|maybe|perhaps|probably)\b")
+# Counts, travelers and dates inside a free-text answer belong to other fields
+# ("hiking, and we're 3 people")
+OTHER_FIELD_WORDS_RE = (rf"\d|\b{_NUMBER}\b|{SOLO_RE}|\b(?:people|persons|travell?ers|adults|of us)\b"
+                        r"|\b(?:january|february|march|april|june|july|august|september|october|november|december"
+                        r"|weekend|days?|nights?|weeks?)\b")
+# A single date described as the way home sets the end date
+RETURN_RE = r"\b(?:back|return|returning|(?:coming|heading|going|flying) home)\b"
+# Longest trip a range may span when its end has to roll over into the next year ("dec 28 to jan 4")
+MAX_ROLLOVER_TRIP_DAYS = 31
+FROM_TO_RE = r"\bfrom\s+(.+?)\s+to\s+(.+?)(?=$|[,.!?]|\s+(?:on|in|for|with)\b)"
+
+
+class _NotConfident(Exception):
+    """The message says something the rules cannot interpret; let Gemini handle the turn."""
+
+
+class _Message:
+    """A lowercased user message whose parsed parts are blanked out as they are consumed."""
+
+    def __init__(self, text: str):
+        self.original = text.strip()
+        self.text = " ".join(text.lower().replace("’", "'").split())
+
+    def take(self, pattern: str) -> Optional[re.Match]:
+        match = re.search(pattern, self.text)
+        if match:
+            self.cut(match)
+        return match
+
+    def cut(self, match: re.Match):
+        """Blank out a match found in the current text."""
+        self.text = f"{self.text[:match.start()]} {self.text[match.end():]}"
+
+    def take_all(self) -> str:
+        text, self.text = self.text, ""
+        return text
+
+    def take_choice(self, choices: List[Tuple[str, Any]]) -> Optional[Any]:
+        found = set()
+        for pattern, value in choices:
+            while self.take(pattern):
+                found.add(value)
+        if len(found) > 1:
+            raise _NotConfident()
+        return found.pop() if found else None
+
+    def residue(self) -> List[str]:
+        return [word for word in re.findall(r"[a-z0-9']+", self.text) if word not in FILLER_WORDS]
+
+
+def is_missing(state: Dict[str, Any], field: str) -> bool:
+    """Same rules as is_conversation_complete: empty strings, empty lists and unset dates count as missing."""
+    value = state.get(field)
+    if field == "dates_of_travel":
+        return not value or not value.get("start_date") or not value.get("end_date")
+    if field == "interests":
+        return not value
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def missing_fields(state: Dict[str, Any]) -> List[str]:
+    return [field for field in FIELD_ORDER if is_missing(state, field)]
+
+
+def expected_field(question: Optional[str]) -> Optional[str]:
+    """
+    The state field a follow-up question asks about, if it can be told from the wording.
+    Raises _NotConfident for questions whose bare answers would be misread.
+    """
+    if not question:
+        return None
+    question = question.lower()
+    if re.search(OTHER_COUNT_QUESTION_RE, question):
+        raise _NotConfident()
+    for field, pattern in QUESTION_TOPICS:
+        if re.search(pattern, question):
+            return field
+    return None
+
+
+def _to_date(year: Optional[str], month: str, day: str, today: date) -> date:
+    month_number = _MONTHS.index(month[:3]) + 1 if not month.isdigit() else int(month)
+    try:
+        if year:
+            return date(int(year) + (2000 if len(year) == 2 else 0), month_number, int(day))
+        # Dates without a year are the next occurrence, as the Gemini prompt assumes
+        parsed = date(today.year, month_number, int(day))
+        return parsed if parsed >= today else parsed.replace(year=today.year + 1)
+    except ValueError:
+        raise _NotConfident()
+
+
+def _take_dates(message: _Message, today: date) -> List[Tuple[date, bool]]:
+    """Consume up to two dates from the message, as (date, year_given) in the order they appear."""
+    match = message.take(SAME_MONTH_RANGE_RE)
+    if match:
+        month, start_day, end_day, year = match.groups()
+        if int(end_day) < int(start_day):
+            # "june 10 - 5" is a typo or a different month, not next year
+            raise _NotConfident()
+        return [(_to_date(year, month, start_day, today), bool(year)),
+                (_to_date(year, month, end_day, today), bool(year))]
+
+    found = []
+    while len(found) < 3:
+        matches = [(re.search(pattern, message.text), order) for pattern, order in DATE_PATTERNS]
+        matches = [(match, order) for match, order in matches if match]
+        if not matches:
+            break
+        match, order = min(matches, key=lambda item: item[0].start())
+        parts = dict(zip(order, match.groups()))
+        found.append((match.start(), _to_date(parts["y"], parts["m"], parts["d"], today), bool(parts["y"])))
+        message.cut(match)
+    if len(found) > 2:
+        raise _NotConfident()
+    return [(parsed, year_given) for _, parsed, year_given in sorted(found, key=lambda item: item[0])]
+
+
+class PreferenceExtractor:
+    """
+    Fills trip state fields from short, unambiguous replies without calling Gemini.
+
+    Self-describing values are recognized in any reply: date ranges,
+    traveler counts ("3 people"), enum values with context ("business trip",
+    "relaxed pace", "mid-range budget"), diets and walking preferences.
+    Bare answers ("2", "no", "luxury", "Boston", "museums and food") are
+    only accepted for the field the previous question asked about. Cities
+    must be known to the airport index.
+
+    Counters for turns handled locally and turns left to Gemini are exposed
+    through `stats`.
+    """
+
+    def __init__(self, city_matcher: Optional[Callable[[str], Optional[str]]] = None,
+                 today: Callable[[], date] = date.today):
+        self._city_matcher = city_matcher
+        self._today = today
+        self._lock = threading.Lock()
+        self.local_turns = 0
+        self.llm_turns = 0
+        self.fields_filled: Counter = Counter()
+
+    def _match_city(self, text: str) -> Optional[str]:
+        if self._city_matcher is None:
+            from app.flights.airport_index import get_airport_index
+            self._city_matcher = get_airport_index().match_city
+        return self._city_matcher(text)
+
+    def update_state(self, state: Dict[str, Any], user_message: str,
+                     conversation_history: Any = None) -> Optional[Tuple[Dict[str, Any], List[str], str]]:
+        """
+        Try to apply the user's message to the state locally.
+
+        Returns:
+            tuple: (updated_state, missing_fields, next_question), like the Gemini
+                   update, or None when the message needs Gemini.
+        """
+        question = None
+        if isinstance(conversation_history, ConversationContext):
+            question = next((text for role, text in reversed(conversation_history.turns) if role == "assistant"), None)
+
+        try:
+            updates = self._parse(state, _Message(user_message), expected_field(question))
+        except _NotConfident:
+            updates = None
+        if not updates:
+            with self._lock:
+                self.llm_turns += 1
+            return None
+
+        updated_state = {**state, **updates}
+        if "dates_of_travel" in updates:
+            updated_state["dates_of_travel"] = {**(state.get("dates_of_travel") or {}), **updates["dates_of_travel"]}
+        missing = missing_fields(updated_state)
+        with self._lock:
+            self.local_turns += 1
+            self.fields_filled.update(updates.keys())
+        return updated_state, missing, FIELD_QUESTIONS[missing[0]] if missing else ""
+
+    def _parse(self, state: Dict[str, Any], message: _Message, expected: Optional[str]) -> Dict[str, Any]:
+        updates: Dict[str, Any] = {}
+
+        # Free-text answers take the whole message, so they go first
+        if expected in ("age_group_of_travelers", "interests") and re.search(NON_ANSWER_RE, message.text):
+            raise _NotConfident()
+        if expected == "age_group_of_travelers" and re.search(AGE_RE, message.text) and len(message.text.split()) <= 10:
+            updates["age_group_of_travelers"] = message.original.rstrip(".!")
+            message.take_all()
+        elif expected == "interests":
+            interests = self._parse_interests(message.take_all())
+            if interests is None:
+                raise _NotConfident()
+            updates["interests"] = interests
+
+        self._parse_locations(message, expected, updates)
+        self._parse_dates(state, message, expected, updates)
+
+        travelers = message.take(TRAVELERS_RE)
+        if travelers:
+            updates["number_of_travelers"] = _NUMBER_WORDS.get(travelers.group(1)) or int(travelers.group(1))
+        elif message.take(SOLO_RE):
+            updates["number_of_travelers"] = 1
+        elif expected == "number_of_travelers":
+            number = message.take(rf"\b{_NUMBER}\b")
+            if number:
+                updates["number_of_travelers"] = _NUMBER_WORDS.get(number.group(1)) or int(number.group(1))
+        if updates.get("number_of_travelers") == 0:
+            raise _NotConfident()
+
+        for field, choices, answers in [
+            ("budget", BUDGET_CHOICES, BUDGET_ANSWERS),
+            ("trip_type", TRIP_TYPE_CHOICES, TRIP_TYPE_ANSWERS),
+            ("how_packed_trip", PACE_CHOICES, PACE_ANSWERS),
+            ("ok_with_walking", WALKING_CHOICES, YES_NO_ANSWERS),
+        ]:
+            value = message.take_choice(choices + answers if expected == field else choices)
+            if value is not None:
+                updates[field] = value
+
+        diets = []
+        while True:
+            diet = message.take(DIET_RE)
+            if not diet:
+                break
+            diets.append(diet.group(0))
+        if diets:
+            updates["dietary_needs"] = ", ".join(diets)
+        accessibility = message.take_choice(ACCESSIBILITY_CHOICES)
+        if accessibility:
+            updates["accessibility_needs"] = accessibility
+        if expected in ("dietary_needs", "accessibility_needs") and expected not in updates and message.take(NONE_ANSWER_RE):
+            updates[expected] = "none"
+
+        if message.residue():
+            raise _NotConfident()
+        return updates
+
+    def _parse_locations(self, message: _Message, expected: Optional[str], updates: Dict[str, Any]):
+        route = re.search(FROM_TO_RE, message.text)
+        if route and self._match_city(route.group(1)) and self._match_city(route.group(2)):
+            updates["starting_location"] = route.group(1).title()
+            updates["destination"] = route.group(2).title()
+            message.cut(route)
+            return
+        if expected not in ("starting_location", "destination"):
+            return
+
+        code = re.fullmatch(r"[A-Z]{3}", message.original.rstrip(".!"))
+        if code and self._match_city(code.group(0)):
+            updates[expected] = code.group(0)
+            message.take_all()
+            return
+        # The longest run of words naming a known city
+        words = re.findall(r"[^\W_]+(?:['-][^\W_]+)*", message.text)
+        for size in range(min(len(words), 4), 0, -1):
+            for start in range(len(words) - size + 1):
+                span = " ".join(words[start:start + size])
+                if span not in FILLER_WORDS and self._match_city(span):
+                    updates[expected] = span.title()
+                    message.take(r"\b" + r"\W+".join(re.escape(word) for word in words[start:start + size]) + r"\b")
+                    return
+
+    def _parse_dates(self, state: Dict[str, Any], message: _Message, expected: Optional[str],
+                     updates: Dict[str, Any]):
+        returning = re.search(RETURN_RE, message.text)
+        dates = _take_dates(message, self._today())
+        if not dates:
+            return
+        current = state.get("dates_of_travel") or {}
+        if len(dates) == 2:
+            (start, _), (end, end_year_given) = dates
+            if end < start and not end_year_given:
+                end = end.replace(year=end.year + 1)
+            if end < start:
+                raise _NotConfident()
+            if not end_year_given and end.year > start.year and (end - start).days > MAX_ROLLOVER_TRIP_DAYS:
+                # Only a short range across the new year, like "dec 28 to jan 4"; "jun 10 to may 5"
+                # is more likely a mistake than an 11-month trip
+                raise _NotConfident()
+            updates["dates_of_travel"] = {"start_date": start.isoformat(), "end_date": end.isoformat()}
+        elif returning:
+            # "heading back on the 20th" is the end of the trip
+            if not current.get("start_date") or dates[0][0].isoformat() < current["start_date"]:
+                raise _NotConfident()
+            updates["dates_of_travel"] = {"end_date": dates[0][0].isoformat()}
+        elif not current.get("start_date"):
+            updates["dates_of_travel"] = {"start_date": dates[0][0].isoformat()}
+        elif not current.get("end_date") and dates[0][0].isoformat() >= current["start_date"]:
+            updates["dates_of_travel"] = {"end_date": dates[0][0].isoformat()}
+        else:
+            raise _NotConfident()
+
+    @staticmethod
+    def _parse_interests(text: str) -> Optional[List[str]]:
+        if re.search(OTHER_FIELD_WORDS_RE, text):
+            return None
+        text = re.sub(INTERESTS_PREFIX_RE, "", text.strip(" .!"))
+        interests = [item.strip(" .!") for item in re.split(INTERESTS_SPLIT_RE, text)]
+        interests = [item for item in interests if item]
+        if not 1 <= len(interests) <= 8:
+            return None
+        for item in interests:
+            if len(item.split()) > 3 or len(item) > 40 or re.fullmatch(NONE_ANSWER_RE, item):
+                return None
+        return interests
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how many turns were handled locally versus by Gemini, and which fields were filled"""
+        with self._lock:
+            turns = self.local_turns + self.llm_turns
+            return {
+                "turns": turns,
+                "local_turns": self.local_turns,
+                "llm_turns": self.llm_turns,
+                "local_rate": round(self.local_turns / turns, 4) if turns else 0.0,
+                "fields_filled": dict(self.fields_filled)
+            }
+
+
+_extractor: Optional[PreferenceExtractor] = None
+_extractor_lock = threading.Lock()
+
+
+def get_preference_extractor() -> PreferenceExtractor:
+    """Return the process-wide preference extractor, creating it on first use."""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = PreferenceExtractor()
+    return _extractor
@@ -0,0 +1,279 @@
+"""
+In-memory airport index built once per process from airport_codes.csv
+"""
+
+import csv
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+AIRPORT_CODES_PATH = os.path.join(os.path.dirname(__file__), 'airport_codes.csv')
+# Multi-airport cities whose airports are listed under other names (EWR is "Newark"), main airport first
+METRO_AIRPORTS_PATH = os.path.join(os.path.dirname(__file__), 'metro_airports.csv')
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+# Search ranking: exact matches first, then prefixes, then typo-tolerant trigram matches
+EXACT_CODE_SCORE = 100.0
+EXACT_CITY_SCORE = 90.0
+CITY_PREFIX_SCORE = 80.0
+CODE_PREFIX_SCORE = 75.0
+WORD_PREFIX_SCORE = 70.0
+FUZZY_MAX_SCORE = 60.0
+# Minimum trigram (Dice) similarity for a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.45
+
+
+@dataclass(frozen=True)
+class Airport:
+    """One row of airport_codes.csv; `line` is its position in the file."""
+    code: str
+    city: str
+    line: int
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a normalized name, padded so word starts weigh more."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def normalize_place_name(text: str) -> str:
+    """Lowercase, strip accents and punctuation, and collapse whitespace ("São Paulo," -> "sao paulo")."""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(_NON_ALNUM.sub(' ', text.lower()).split())
+
+
+class AirportIndex:
+    """
+    Precomputed lookup structures over airport_codes.csv.
+
+    City names resolve through, in order: an exact (lowercased) match, the
+    IATA code itself, a normalized match on the full name or on its primary
+    part ("Birmingham, West Midlands" -> "birmingham"), a known city named
+    inside the query ("new york city" -> "new york") and finally a prefix
+    match. When several airports share a name, the first one in the file wins,
+    except for metro areas, which resolve to their main airport.
+
+    `airport_set` returns every airport serving a city: the metro area's
+    airports when it is one, otherwise all airports listed under that name.
+
+    `search` ranks every airport against a partial or misspelled query using
+    sorted prefix keys and a trigram inverted index over city names.
+    """
+
+    def __init__(self, airports: List[Airport], metros: Optional[Dict[str, List[str]]] = None):
+        self.airports = airports
+        self.by_code: Dict[str, Airport] = {}
+        self._exact: Dict[str, str] = {}
+        self._normalized: Dict[str, str] = {}
+        for airport in airports:
+            self.by_code.setdefault(airport.code, airport)
+            self._add(self._exact, airport.city.lower().strip(), airport.code)
+            self._add(self._normalized, normalize_place_name(airport.city), airport.code)
+        # Primary names only fill gaps, so a city keeps its own entry if it has one
+        for airport in airports:
+            primary = normalize_place_name(airport.city.split(',')[0])
+            if primary:
+                self._normalized.setdefault(primary, airport.code)
+        self._metros: Dict[str, List[str]] = {}
+        for metro, codes in (metros or {}).items():
+            name = normalize_place_name(metro)
+            codes = [code for code in codes if code in self.by_code]
+            if name and codes:
+                self._metros[name] = codes
+                self._exact[metro.lower().strip()] = self._normalized[name] = codes[0]
+        self._max_name_tokens = max((len(name.split()) for name in self._normalized), default=0)
+        # Sorted names for prefix lookups
+        self._sorted_names = sorted(self._normalized)
+        self._build_search_index()
+
+    def _build_search_index(self):
+        self._city_names = [normalize_place_name(airport.city) for airport in self.airports]
+        # (key, is_full_name, airport position) for the full name and every word start in it
+        prefix_keys = []
+        self._trigram_postings: Dict[str, List[int]] = defaultdict(list)
+        self._trigram_counts: List[int] = []
+        for position, name in enumerate(self._city_names):
+            words = name.split()
+            for start in range(len(words)):
+                prefix_keys.append((' '.join(words[start:]), start == 0, position))
+            grams = trigrams(name)
+            for gram in grams:
+                self._trigram_postings[gram].append(position)
+            self._trigram_counts.append(len(grams))
+        prefix_keys.sort()
+        self._prefix_keys = prefix_keys
+        self._sorted_codes = sorted((airport.code, position) for position, airport in enumerate(self.airports))
+
+    @staticmethod
+    def _add(mapping: Dict[str, str], key: str, code: str):
+        # Prioritize 3-letter IATA codes over others, as the original mapping did
+        if key and (key not in mapping or (len(code) == 3 and len(mapping[key]) != 3)):
+            mapping[key] = code
+
+    @classmethod
+    def from_csv(cls, path: str = AIRPORT_CODES_PATH, metros_path: Optional[str] = METRO_AIRPORTS_PATH) -> "AirportIndex":
+        airports = []
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)  # header: iata_code,city
+            for line, row in enumerate(reader, start=2):
+                if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                    continue
+                airports.append(Airport(code=row[0].strip().upper(), city=row[1].strip(), line=line))
+        metros: Dict[str, List[str]] = defaultdict(list)
+        if metros_path and os.path.exists(metros_path):
+            with open(metros_path, newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # header: metro,iata_code
+                for row in reader:
+                    if len(row) >= 2 and row[0].strip() and row[1].strip():
+                        metros[row[0].strip()].append(row[1].strip().upper())
+        return cls(airports, metros)
+
+    def lookup(self, query: str) -> Optional[str]:
+        """Return the IATA code for a city name or code, or None if nothing matches."""
+        if not query:
+            return None
+        exact = self._exact.get(query.lower().strip())
+        if exact:
+            return exact
+
+        code = query.strip().upper()
+        if code in self.by_code:
+            return code
+
+        normalized = normalize_place_name(query)
+        if not normalized:
+            return None
+        if normalized in self._normalized:
+            return self._normalized[normalized]
+
+        # A known city named inside a longer query, longest span first
+        tokens = normalized.split()
+        for size in range(min(len(tokens), self._max_name_tokens), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                span = ' '.join(tokens[start:start + size])
+                if span in self._normalized:
+                    return self._normalized[span]
+
+        return self.prefix_lookup(normalized)
+
+    def airport_set(self, query: str) -> List[str]:
+        """
+        Return the IATA codes of every airport serving the city `query` names, the code
+        `lookup` returns first. Only the curated metro groups expand to several airports;
+        other cities, and airport codes, resolve to a single airport.
+        """
+        code = query.strip().upper()
+        if len(code) == 3 and code.isalpha() and code in self.by_code:
+            # Passed through like the search endpoint always has, even where a city shares the
+            # letters ("Mao" is AMO, but MAO is Manaus)
+            return [code]
+        code = self.lookup(query)
+        if code is None:
+            return []
+        names = (normalize_place_name(query), normalize_place_name(self.by_code[code].city))
+        group = next((self._metros[name] for name in names if name in self._metros), [])
+        return [code] + [other for other in group if other != code]
+
+    def match_city(self, text: str) -> Optional[str]:
+        """
+        Return the code for a city named exactly by `text` (after normalization), without
+        span, prefix or fuzzy matching. IATA codes only count when written in capitals,
+        since many are also common words ("THE", "YES").
+        """
+        normalized = normalize_place_name(text)
+        if normalized in self._normalized:
+            return self._normalized[normalized]
+        code = text.strip()
+        return code if code.isupper() and code in self.by_code else None
+
+    def prefix_lookup(self, prefix: str) -> Optional[str]:
+        """Return the code of the alphabetically first indexed name starting with `prefix`."""
+        start = bisect_left(self._sorted_names, prefix)
+        if start < len(self._sorted_names) and self._sorted_names[start].startswith(prefix):
+            return self._normalized[self._sorted_names[start]]
+        return None
+
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Tuple[int, List[Tuple[Airport, float]]]:
+        """
+        Rank airports matching a code, city name, prefix or misspelling.
+
+        Returns:
+            tuple: The total number of matches and the (airport, score) pairs for
+                   the requested page, best first. Ties go to shorter city names,
+                   then to earlier rows in the file.
+        """
+        scores: Dict[int, float] = {}
+
+        def offer(position: int, score: float):
+            if score > scores.get(position, 0.0):
+                scores[position] = score
+
+        code = query.strip().upper()
+        if code.isalnum() and len(code) <= 3:
+            start = bisect_left(self._sorted_codes, (code,))
+            for candidate, position in self._sorted_codes[start:]:
+                if not candidate.startswith(code):
+                    break
+                offer(position, EXACT_CODE_SCORE if candidate == code else CODE_PREFIX_SCORE)
+
+        normalized = normalize_place_name(query)
+        if normalized:
+            start = bisect_left(self._prefix_keys, (normalized,))
+            for key, is_full_name, position in self._prefix_keys[start:]:
+                if not key.startswith(normalized):
+                    break
+                if is_full_name:
+                    offer(position, EXACT_CITY_SCORE if key == normalized else CITY_PREFIX_SCORE)
+                else:
+                    offer(position, WORD_PREFIX_SCORE)
+
+            if len(normalized) >= 3:
+                query_grams = trigrams(normalized)
+                shared: Dict[int, int] = defaultdict(int)
+                for gram in query_grams:
+                    for position in self._trigram_postings.get(gram, ()):
+                        shared[position] += 1
+                for position, count in shared.items():
+                    similarity = 2 * count / (len(query_grams) + self._trigram_counts[position])
+                    if similarity >= FUZZY_MIN_SIMILARITY:
+                        offer(position, round(FUZZY_MAX_SCORE * similarity, 2))
+
+        ranked = sorted(scores.items(), key=lambda item: (
+            -item[1], len(self.airports[item[0]].city), self.airports[item[0]].line
+        ))
+        page = ranked[offset:offset + limit]
+        return len(ranked), [(self.airports[position], score) for position, score in page]
+
+
+_index: Optional[AirportIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_airport_index() -> AirportIndex:
+    """Return the process-wide airport index, building it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AirportIndex.from_csv()
+    return _index
+
+
+def resolve_airport_code(city_name: str) -> str:
+    """Get the airport code for a city, falling back to the input (it might already be a code)."""
+    return get_airport_index().lookup(city_name) or city_name.upper()
+
+
+def resolve_airport_codes(city_name: str) -> List[str]:
+    """Get every airport code for a city, main airport first, falling back to the input like resolve_airport_code."""
+    return get_airport_index().airport_set(city_name) or [city_name.upper()]
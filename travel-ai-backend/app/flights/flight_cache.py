@@ -0,0 +1,131 @@
+"""
+Async TTL cache for flight searches with request coalescing
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.models.travel_models import FlightSearchRequest
+
+
+def flight_search_key(request: FlightSearchRequest) -> Tuple:
+    """Cache key for the upstream part of a search (budget and accessibility only affect ranking)"""
+    return (
+        request.origin.strip().upper(),
+        request.destination.strip().upper(),
+        request.departure_date.isoformat(),
+        request.return_date.isoformat(),
+        request.num_travelers
+    )
+
+
+class FlightSearchCache:
+    """
+    In-memory cache for upstream flight results.
+
+    - Fresh entries (younger than `ttl_seconds`) are served directly.
+    - Stale entries (up to `stale_seconds` past the TTL) are served immediately
+      while one background task refreshes them.
+    - On a miss, concurrent callers for the same key share a single fetch.
+
+    Failed fetches are never cached; their error is raised to every waiter.
+    Entries are evicted least recently used first beyond `max_entries`.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, stale_seconds: float = 600, max_entries: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refresh_errors = 0
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for `key`, calling `fetch` only when it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = self._clock() - fetched_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._in_flight:
+                    self._start_fetch(key, fetch, refresh=True)
+                return value
+            del self._entries[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            in_flight = self._start_fetch(key, fetch)
+        # Shielded, so a caller that goes away does not cancel the fetch for the others
+        return await asyncio.shield(in_flight)
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], refresh: bool = False) -> asyncio.Task:
+        task = asyncio.create_task(self._fetch_and_store(key, fetch))
+        self._in_flight[key] = task
+
+        def done(task: asyncio.Task):
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+            if task.cancelled():
+                return
+            # Retrieving the error here also keeps asyncio from warning when nobody awaited it
+            error = task.exception()
+            if error is not None and refresh:
+                # Keep serving the stale entry; the next stale hit retries
+                self.refresh_errors += 1
+                print(f"Flight cache refresh failed for {key}: {error}")
+
+        task.add_done_callback(done)
+        return task
+
+    async def _fetch_and_store(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (value, self._clock())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def close(self):
+        """Cancel fetches still in flight"""
+        tasks = list(self._in_flight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current number of entries"""
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight)
+        }
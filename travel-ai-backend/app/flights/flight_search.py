@@ -1,50 +1,74 @@
+import asyncio
+import heapq
 import uuid
-from typing import List
-from datetime import datetime
+from itertools import product
+from typing import Iterable, List, Optional, Tuple
 
-from app.models.travel_models import FlightSearchRequest, FlightSearchResponse, FlightOffer
+from app.models.travel_models import (
+    FlexibleFlightSearchRequest, FlexibleFlightSearchResponse, FlightOffer,
+    FlightSearchRequest, FlightSearchResponse, PriceCalendarEntry
+)
 from app.flights.serpapi_adapter import SerpApiAdapter
+from app.flights.airport_index import resolve_airport_codes
+from app.flights.flight_cache import FlightSearchCache, flight_search_key
+from app.flights.offer_selection import FlightColumns, offer_rank_key, select_from_columns, select_top_models
 from app.utils.mock_data import get_mock_flights
 from app.config import settings
 
 
+def airport_routes(request: FlightSearchRequest, limit: int) -> List[FlightSearchRequest]:
+    """
+    One request per distinct origin x destination airport pair for the request's cities,
+    main airports first (ordered by how far down each city's airport list they are),
+    keeping at most `limit`.
+    """
+    origins = resolve_airport_codes(request.origin)
+    destinations = resolve_airport_codes(request.destination)
+    pairs = sorted(
+        ((i, j) for i, j in product(range(len(origins)), range(len(destinations)))
+         if origins[i] != destinations[j]),
+        key=lambda pair: (pair[0] + pair[1], pair[0])
+    )
+    return [
+        request.model_copy(update={"origin": origins[i], "destination": destinations[j]})
+        for i, j in pairs[:limit]
+    ]
+
+
 class FlightSearchService:
     """Minimal flight search for hackathon"""
     
-    def __init__(self):
-        self.serpapi = SerpApiAdapter()
+    # Number of offers returned per search
+    max_offers = 3
+    
+    def __init__(self, serpapi: Optional[SerpApiAdapter] = None, cache: Optional[FlightSearchCache] = None):
+        self.serpapi = serpapi or SerpApiAdapter()
+        self.cache = cache or FlightSearchCache(
+            ttl_seconds=settings.FLIGHT_CACHE_TTL_SECONDS,
+            stale_seconds=settings.FLIGHT_CACHE_STALE_SECONDS,
+            max_entries=settings.FLIGHT_CACHE_MAX_ENTRIES
+        )
+    
+    async def start(self):
+        await self.serpapi.start()
+    
+    async def close(self):
+        await self.cache.close()
+        await self.serpapi.close()
+    
+    def uses_mock_data(self) -> bool:
+        """Whether searches are answered with mock data instead of SerpAPI"""
+        return settings.USE_MOCK_DATA or not settings.SERPAPI_KEY
     
     async def search_flights(self, request: FlightSearchRequest) -> FlightSearchResponse:
         """Search flights with fallback to mock"""
         search_id = str(uuid.uuid4())
-        
-        # Use mock data if no API key or configured
-        if settings.USE_MOCK_DATA or not settings.SERPAPI_KEY:
-            offers = get_mock_flights(request)
-        else:
-            try:
-                raw_flights = await self.serpapi.search_flights(request)
-                if not raw_flights:
-                    # If SerpAPI returns no flights, use mock data as a fallback for the demo
-                    offers = get_mock_flights(request)
-                else:
-                    offers = self._process_flights(raw_flights, request)
-            except Exception as e:
-                print(f"Error processing flights, falling back to mock data. Error: {e}")
-                import traceback
-                traceback.print_exc()
-                offers = get_mock_flights(request)
-        
-        # Sort by accessibility then price
-        offers = sorted(offers, key=lambda x: (-x.accessibility_score, x.price))
-        
-        # Take the top 3 best offers
-        top_offers = offers[:3]
+        top_offers, total_results, _ = await self._rank_offers(request)
 
         return FlightSearchResponse(
             search_id=search_id,
             offers=top_offers,
-            total_results=len(offers), # Report total flights found before slicing
+            total_results=total_results, # Report total flights found before slicing
             search_summary={
                 "origin": request.origin,
                 "destination": request.destination,
@@ -55,45 +79,144 @@ class FlightSearchService:
             }
         )
     
-    def _process_flights(self, raw_data: List[dict], request: FlightSearchRequest) -> List[FlightOffer]:
-        """Process API data to FlightOffer objects"""
-        offers = []
+    async def search_flexible(self, request: FlexibleFlightSearchRequest) -> FlexibleFlightSearchResponse:
+        """
+        Search every departure day of the window concurrently and merge the results.
         
-        for flight in raw_data:
-            try:
-                # Ensure date/time strings are valid before parsing
-                dep_at = flight.get("departure", {}).get("at")
-                arr_at = flight.get("arrival", {}).get("at")
-                if not dep_at or not arr_at:
-                    continue # Skip flight if essential time info is missing
-
-                departure_time = datetime.strptime(dep_at, "%Y-%m-%d %H:%M")
-                arrival_time = datetime.strptime(arr_at, "%Y-%m-%d %H:%M")
-                
-                # Simple accessibility score
-                score = 7.0 if flight.get("stops", 0) == 0 else 5.0
-                if request.accessibility_requirements:
-                    score += 2.0
-                
-                offers.append(FlightOffer(
-                    flight_id=flight.get("id", ""),
-                    airline=flight.get("airline", "Unknown"),
-                    flight_number=flight.get("id", ""), # Use the flight ID as the number
-                    origin=flight["departure"]["iataCode"],
-                    destination=flight["arrival"]["iataCode"],
-                    departure_time=departure_time,
-                    arrival_time=arrival_time,
-                    duration_minutes=flight.get("duration", 0),
-                    price=flight.get("price", 0),
-                    currency="USD",
-                    accessibility_score=min(10.0, score),
-                    accessibility_features=["Direct flight"] if flight.get("stops", 0) == 0 else [],
-                    is_direct=flight.get("stops", 0) == 0,
-                    stops=flight.get("stops", 0),
-                    aircraft_type=None
-                ))
-            except (KeyError, ValueError, TypeError) as e:
-                print(f"Skipping a flight due to parsing error: {e}")
-                continue
+        Each date pair is an ordinary cached search, so narrowing or shifting the window
+        reuses earlier results; at most FLEXIBLE_SEARCH_CONCURRENCY upstream calls run at once.
+        Cities with several airports share FLEXIBLE_SEARCH_MAX_SEARCHES airport-pair searches
+        across the days, so wide windows search the main airports only.
+        """
+        search_id = str(uuid.uuid4())
+        pairs = request.date_pairs()
+        upstream_slots = asyncio.Semaphore(settings.FLEXIBLE_SEARCH_CONCURRENCY)
+        routes_per_date = min(settings.MULTI_AIRPORT_MAX_SEARCHES,
+                              max(1, settings.FLEXIBLE_SEARCH_MAX_SEARCHES // max(len(pairs), 1)))
+        results = await asyncio.gather(*[
+            self._rank_offers(request.for_dates(departure_date, return_date), upstream_slots, routes_per_date)
+            for departure_date, return_date in pairs
+        ])
+
+        calendar = [
+            PriceCalendarEntry(
+                departure_date=departure_date,
+                return_date=return_date,
+                lowest_price=lowest_price,
+                total_results=total_results
+            )
+            for (departure_date, return_date), (_, total_results, lowest_price) in zip(pairs, results)
+        ]
+        top_offers = self._best_offers(offers for offers, _, _ in results)
+        priced = [entry for entry in calendar if entry.lowest_price is not None]
+        cheapest = min(priced, key=lambda entry: entry.lowest_price) if priced else None
+
+        return FlexibleFlightSearchResponse(
+            search_id=search_id,
+            calendar=calendar,
+            offers=top_offers,
+            total_results=sum(entry.total_results for entry in calendar),
+            search_summary={
+                "origin": request.origin,
+                "destination": request.destination,
+                "earliest_departure": request.earliest_departure.isoformat(),
+                "latest_departure": request.latest_departure.isoformat(),
+                "trip_length_days": request.trip_length_days,
+                "num_travelers": request.num_travelers,
+                "budget": request.budget.value,
+                "accessibility_requirements": request.accessibility_requirements,
+                "cheapest_departure_date": cheapest.departure_date.isoformat() if cheapest else None
+            }
+        )
+    
+    async def _rank_offers(self, request: FlightSearchRequest,
+                           upstream_slots: Optional[asyncio.Semaphore] = None,
+                           max_routes: Optional[int] = None
+                           ) -> Tuple[List[FlightOffer], int, Optional[float]]:
+        """
+        Top offers, total valid results and lowest price for one search, with fallback to mock.
         
-        return offers 
\ No newline at end of file
+        Cities with several airports are searched on every origin x destination airport route
+        concurrently (main airports first, at most `max_routes` routes, by default
+        MULTI_AIRPORT_MAX_SEARCHES) and merged into one ranking. When `upstream_slots` is
+        given, cache misses wait for a slot before calling SerpAPI.
+        """
+        # Use mock data if no API key or configured
+        if self.uses_mock_data():
+            return self._mock_offers(request)
+
+        routes = airport_routes(request, max_routes or settings.MULTI_AIRPORT_MAX_SEARCHES)
+        results = await asyncio.gather(*[self._search_route(route, upstream_slots) for route in routes])
+        results = [result for result in results if result is not None]
+        if not results:
+            # If SerpAPI returns no flights, use mock data as a fallback for the demo
+            return self._mock_offers(request)
+        prices = [lowest_price for _, _, lowest_price in results if lowest_price is not None]
+        return (
+            self._best_offers(offers for offers, _, _ in results),
+            sum(total_results for _, total_results, _ in results),
+            min(prices, default=None)
+        )
+    
+    async def _search_route(self, request: FlightSearchRequest,
+                            upstream_slots: Optional[asyncio.Semaphore] = None
+                            ) -> Optional[Tuple[List[FlightOffer], int, Optional[float]]]:
+        """Rank the flights of a single airport pair; None if the search failed or found nothing"""
+        async def fetch():
+            if upstream_slots is None:
+                return await self.serpapi.search_flights(request)
+            async with upstream_slots:
+                return await self.serpapi.search_flights(request)
+
+        try:
+            # Identical searches share one upstream SerpAPI call
+            raw_flights = await self.cache.get_or_fetch(flight_search_key(request), fetch)
+            if not raw_flights:
+                return None
+            # Sort by accessibility then price, building models only for the top offers
+            columns = FlightColumns(raw_flights)
+            top_offers, total_results = select_from_columns(
+                columns, request.accessibility_requirements, self.max_offers
+            )
+            return top_offers, total_results, min(columns.prices, default=None)
+        except Exception as e:
+            print(f"Error processing flights for {request.origin}-{request.destination}. Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def _best_offers(self, offer_lists: Iterable[List[FlightOffer]]) -> List[FlightOffer]:
+        """Merge ranked offer lists; the overall best are among each list's best, and ties keep list order"""
+        return heapq.nsmallest(
+            self.max_offers, (offer for offers in offer_lists for offer in offers), key=offer_rank_key
+        )
+    
+    def _mock_offers(self, request: FlightSearchRequest) -> Tuple[List[FlightOffer], int, Optional[float]]:
+        mock_flights = get_mock_flights(request)
+        top_offers, total_results = select_top_models(mock_flights, self.max_offers)
+        return top_offers, total_results, min((offer.price for offer in mock_flights), default=None)
+
+
+# Application-scoped service, started and closed by the FastAPI lifespan
+_service: Optional[FlightSearchService] = None
+
+
+def get_flight_search_service() -> FlightSearchService:
+    """Return the shared flight search service, creating it if the app has not started one."""
+    global _service
+    if _service is None:
+        _service = FlightSearchService()
+    return _service
+
+
+async def start_flight_search_service() -> FlightSearchService:
+    service = get_flight_search_service()
+    await service.start()
+    return service
+
+
+async def close_flight_search_service():
+    global _service
+    if _service is not None:
+        await _service.close()
+        _service = None
@@ -0,0 +1,165 @@
+"""
+Scoring and top-k selection of flight offers
+
+Raw SerpAPI flights are unpacked once into parallel columns (stops, price,
+duration, times), scored column-wise and ranked with a heap, so only the
+offers that are actually returned get a FlightOffer model.
+"""
+
+import heapq
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from app.models.travel_models import FlightOffer
+
+DIRECT_FLIGHT_SCORE = 7.0
+CONNECTING_FLIGHT_SCORE = 5.0
+ACCESSIBILITY_REQUESTED_BONUS = 2.0
+MAX_ACCESSIBILITY_SCORE = 10.0
+
+
+def offer_rank_key(offer: FlightOffer) -> Tuple[float, float]:
+    """Best accessibility first, then cheapest"""
+    return (-offer.accessibility_score, offer.price)
+
+
+def parse_timestamp(text: str) -> datetime:
+    """Parse SerpAPI's fixed "YYYY-MM-DD HH:MM" times by slicing; anything else goes through strptime"""
+    if (len(text) == 16 and text[4] == "-" and text[7] == "-" and text[10] == " " and text[13] == ":"
+            and (text[:4] + text[5:7] + text[8:10] + text[11:13] + text[14:]).isdigit()):
+        return datetime(int(text[:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:]))
+    return datetime.strptime(text, "%Y-%m-%d %H:%M")
+
+
+def _as_int(value: Any) -> int:
+    # The same coercions FlightOffer accepts for int fields
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise ValueError(f"not an integer: {value!r}")
+
+
+def _as_float(value: Any) -> float:
+    if isinstance(value, (int, float, str)):
+        return float(value)
+    raise ValueError(f"not a number: {value!r}")
+
+
+def _as_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    raise ValueError(f"not a string: {value!r}")
+
+
+class FlightColumns:
+    """
+    Raw flights as parallel columns, keeping only rows that make a valid FlightOffer,
+    so len() is the exact number of usable results.
+    """
+
+    def __init__(self, raw_data: List[Dict[str, Any]]):
+        self.raw = raw_data
+        self.rows: List[int] = []
+        self.stops: List[int] = []
+        self.prices: List[float] = []
+        self.durations: List[int] = []
+        self.departure_times: List[datetime] = []
+        self.arrival_times: List[datetime] = []
+        self.skipped = 0
+
+        for row, flight in enumerate(raw_data):
+            try:
+                departure, arrival = flight["departure"], flight["arrival"]
+                dep_at, arr_at = departure.get("at"), arrival.get("at")
+                if not dep_at or not arr_at:
+                    continue  # Skip flight if essential time info is missing
+                departure_time = parse_timestamp(dep_at)
+                arrival_time = parse_timestamp(arr_at)
+                _as_str(departure["iataCode"])
+                _as_str(arrival["iataCode"])
+                _as_str(flight.get("id", ""))
+                _as_str(flight.get("airline", "Unknown"))
+                stops = _as_int(flight.get("stops", 0))
+                price = _as_float(flight.get("price", 0))
+                duration = _as_int(flight.get("duration", 0))
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                print(f"Skipping a flight due to parsing error: {e}")
+                self.skipped += 1
+                continue
+            self.rows.append(row)
+            self.stops.append(stops)
+            self.prices.append(price)
+            self.durations.append(duration)
+            self.departure_times.append(departure_time)
+            self.arrival_times.append(arrival_time)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def accessibility_scores(self, accessibility_requirements: bool) -> List[float]:
+        bonus = ACCESSIBILITY_REQUESTED_BONUS if accessibility_requirements else 0.0
+        direct = min(MAX_ACCESSIBILITY_SCORE, DIRECT_FLIGHT_SCORE + bonus)
+        connecting = min(MAX_ACCESSIBILITY_SCORE, CONNECTING_FLIGHT_SCORE + bonus)
+        return [direct if stops == 0 else connecting for stops in self.stops]
+
+    def offer(self, index: int, accessibility_score: float) -> FlightOffer:
+        """Build the FlightOffer for column position `index`"""
+        flight = self.raw[self.rows[index]]
+        stops = self.stops[index]
+        return FlightOffer(
+            flight_id=flight.get("id", ""),
+            airline=flight.get("airline", "Unknown"),
+            flight_number=flight.get("id", ""),  # Use the flight ID as the number
+            origin=flight["departure"]["iataCode"],
+            destination=flight["arrival"]["iataCode"],
+            departure_time=self.departure_times[index],
+            arrival_time=self.arrival_times[index],
+            duration_minutes=self.durations[index],
+            price=self.prices[index],
+            currency="USD",
+            accessibility_score=accessibility_score,
+            accessibility_features=["Direct flight"] if stops == 0 else [],
+            is_direct=stops == 0,
+            stops=stops,
+            aircraft_type=None
+        )
+
+
+def select_top_offers(raw_data: List[Dict[str, Any]], accessibility_requirements: bool,
+                      limit: int) -> Tuple[List[FlightOffer], int]:
+    """
+    Rank raw flights by (-accessibility_score, price) and build models for the best `limit`.
+
+    Returns:
+        tuple: The top offers, best first (ties keep their upstream order), and the
+               total number of valid flights.
+    """
+    return select_from_columns(FlightColumns(raw_data), accessibility_requirements, limit)
+
+
+def select_from_columns(columns: FlightColumns, accessibility_requirements: bool,
+                        limit: int) -> Tuple[List[FlightOffer], int]:
+    """select_top_offers for flights that are already unpacked into columns"""
+    scores = columns.accessibility_scores(accessibility_requirements)
+    heap = [(-score, price, index) for index, (score, price) in enumerate(zip(scores, columns.prices))]
+    heapq.heapify(heap)
+
+    total = len(columns)
+    offers = []
+    while heap and len(offers) < limit:
+        _, _, index = heapq.heappop(heap)
+        try:
+            offers.append(columns.offer(index, scores[index]))
+        except ValueError as e:
+            # The column checks should already have caught this; keep the total exact anyway
+            print(f"Skipping a flight due to parsing error: {e}")
+            total -= 1
+    return offers, total
+
+
+def select_top_models(offers: List[FlightOffer], limit: int) -> Tuple[List[FlightOffer], int]:
+    """Same ranking for offers that are already models (e.g. mock data)"""
+    return heapq.nsmallest(limit, offers, key=offer_rank_key), len(offers)
@@ -0,0 +1,145 @@
+"""
+Speculative flight searches for chat sessions
+
+The route and dates are usually known several turns before a conversation
+is complete. As soon as they are, the flight search starts in the
+background, so when the conversation completes its upstream results are
+already in the flight cache, or still in flight and shared with the final
+search by the cache's request coalescing. Budget and accessibility only
+affect ranking, so the final search can still change them for free.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+from app.flights.flight_cache import flight_search_key
+from app.flights.flight_search import get_flight_search_service
+from app.models.travel_models import FlightSearchRequest
+
+
+class FlightPrefetcher:
+    """
+    One speculative search per chat session, keyed by the upstream search parameters.
+
+    `update` starts the search for a session, or cancels and replaces it when the
+    route, dates or number of travelers change. `claim` hands a session's search over
+    to the final search when the conversation completes. Cancelling a search stops
+    the routes that have not been sent yet; requests already sent to SerpAPI finish
+    into the cache. At most `max_sessions` searches are kept, oldest dropped first.
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._searches: "OrderedDict[str, Tuple[Hashable, asyncio.Task]]" = OrderedDict()
+        self.started = 0
+        self.cancelled = 0
+        self.ready = 0
+        self.in_flight = 0
+        self.misses = 0
+
+    def update(self, session_id: Optional[str], request: Optional[FlightSearchRequest]) -> bool:
+        """
+        Make sure the search for `request` is running for the session; None cancels it.
+        Returns True if a new search was started.
+        """
+        if not session_id:
+            return False
+        key = flight_search_key(request) if request is not None else None
+        current = self._searches.get(session_id)
+        if current is not None:
+            if current[0] == key:
+                return False
+            self.cancel(session_id)
+        service = get_flight_search_service()
+        if key is None or service.uses_mock_data():
+            return False
+
+        task = asyncio.create_task(self._search(request))
+        self._searches[session_id] = (key, task)
+        self.started += 1
+        while len(self._searches) > self.max_sessions:
+            _, (_, oldest) = self._searches.popitem(last=False)
+            oldest.cancel()
+        return True
+
+    async def _search(self, request: FlightSearchRequest):
+        try:
+            await get_flight_search_service().search_flights(request)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Speculative flight search failed: {e}")
+
+    def claim(self, session_id: Optional[str], request: FlightSearchRequest) -> str:
+        """
+        Take over the session's speculative search for the final `request`.
+
+        Returns:
+            str: "ready" if it already finished, "in_flight" if the final search will
+                 join it, or "miss" if there was none for these parameters.
+        """
+        entry = self._searches.pop(session_id, None) if session_id else None
+        if entry is None:
+            self.misses += 1
+            return "miss"
+        key, task = entry
+        if key != flight_search_key(request):
+            task.cancel()
+            self.cancelled += 1
+            self.misses += 1
+            return "miss"
+        if task.done():
+            self.ready += 1
+            return "ready"
+        self.in_flight += 1
+        return "in_flight"
+
+    def cancel(self, session_id: str):
+        entry = self._searches.pop(session_id, None)
+        if entry is not None and not entry[1].done():
+            entry[1].cancel()
+            self.cancelled += 1
+
+    async def close(self):
+        """Cancel the searches still running"""
+        tasks = [task for _, task in self._searches.values()]
+        self._searches.clear()
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how often completed conversations found their flights already searched"""
+        claims = self.ready + self.in_flight + self.misses
+        return {
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "ready": self.ready,
+            "in_flight": self.in_flight,
+            "misses": self.misses,
+            "hit_rate": round((self.ready + self.in_flight) / claims, 4) if claims else 0.0,
+            "sessions": len(self._searches),
+            "running": sum(1 for _, task in self._searches.values() if not task.done())
+        }
+
+
+# Application-scoped prefetcher, closed by the FastAPI lifespan
+_prefetcher: Optional[FlightPrefetcher] = None
+
+
+def get_flight_prefetcher() -> FlightPrefetcher:
+    """Return the shared flight prefetcher, creating it on first use."""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = FlightPrefetcher(max_sessions=settings.FLIGHT_PREFETCH_MAX_SESSIONS)
+    return _prefetcher
+
+
+async def close_flight_prefetcher():
+    global _prefetcher
+    if _prefetcher is not None:
+        await _prefetcher.close()
+        _prefetcher = None
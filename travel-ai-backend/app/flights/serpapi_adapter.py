@@ -1,8 +1,9 @@
 import aiohttp
-from typing import Dict, Any, List
+from itertools import chain
+from typing import Dict, Any, List, Optional
 from app.models.travel_models import FlightSearchRequest
 from app.config import settings
-import pandas as pd
+from app.flights.airport_index import resolve_airport_code
 
 
 class SerpApiAdapter:
@@ -10,49 +11,30 @@ class SerpApiAdapter:
     
     def __init__(self):
         self.api_key = settings.SERPAPI_KEY
-        self._airport_mapping = None
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def start(self):
+        """Open the pooled HTTP session reused by every search until close()"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.SERPAPI_CONNECTION_LIMIT,
+                keepalive_timeout=settings.SERPAPI_KEEPALIVE_SECONDS,
+                ttl_dns_cache=settings.SERPAPI_DNS_CACHE_SECONDS
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.SERPAPI_TIMEOUT_SECONDS)
+            )
+    
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
-    def _load_airport_mapping(self):
-        """Load airport code mapping from CSV"""
-        if self._airport_mapping is None:
-            import os
-            csv_path = os.path.join(os.path.dirname(__file__), 'airport_codes.csv')
-            try:
-                df = pd.read_csv(csv_path, names=['iata_code', 'city'])
-                
-                # Create mapping, but prioritize 3-letter IATA codes over others
-                mapping = {}
-                for _, row in df.iterrows():
-                    city = row['city'].lower()
-                    code = row['iata_code'].upper()
-                    
-                    # If city not in mapping, or current code is 3 letters and existing isn't
-                    if (city not in mapping or 
-                        (len(code) == 3 and len(mapping[city]) != 3)):
-                        mapping[city] = code
-                
-                self._airport_mapping = mapping
-            except Exception as e:
-                print(f"Warning: Could not load airport mapping: {e}")
-                self._airport_mapping = {}
-        return self._airport_mapping
-
     def get_airport_code(self, city_name: str) -> str:
         """Get airport code for a city"""
-        mapping = self._load_airport_mapping()
-        
-        # Try exact match first
-        city_lower = city_name.lower().strip()
-        if city_lower in mapping:
-            return mapping[city_lower]
-        
-        # Try partial matches for cities with multiple airports
-        for city, code in mapping.items():
-            if city_lower in city or city in city_lower:
-                return code
-        
-        # If no match found, return the original (might already be an airport code)
-        return city_name.upper()
+        return resolve_airport_code(city_name)
     
     async def search_flights(self, request: FlightSearchRequest) -> List[Dict[str, Any]]:
         """Search flights via SerpAPI (always round trip)"""
@@ -73,76 +55,75 @@ class SerpApiAdapter:
             "type": "1"  # Always round trip
         }
         
+        if self._session is not None and not self._session.closed:
+            return await self._get_flights(self._session, params)
+        
+        # Not started (e.g. used outside the app): fall back to a one-off session
         async with aiohttp.ClientSession() as session:
-            async with session.get("https://serpapi.com/search", params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return self._extract_flights(data)
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"SerpAPI error: {response.status} - {error_text}")
+            return await self._get_flights(session, params)
+    
+    async def _get_flights(self, session: aiohttp.ClientSession, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        async with session.get("https://serpapi.com/search", params=params) as response:
+            if response.status == 200:
+                data = await response.json()
+                return self._extract_flights(data)
+            else:
+                error_text = await response.text()
+                raise Exception(f"SerpAPI error: {response.status} - {error_text}")
     
     def _extract_flights(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Extract flight data from SerpAPI response"""
-        flights = []
+        """
+        Extract flight data from SerpAPI response in a single pass over best_flights and other_flights.
         
-        # SerpAPI returns best_flights and other_flights
-        best_flights = data.get("best_flights", [])
-        other_flights = data.get("other_flights", [])
-        
-        # Process best flights first
-        for flight_group in best_flights:
-            if "flights" in flight_group:
-                for flight in flight_group["flights"]:
-                    try:
-                        flights.append({
-                            "id": flight.get("flight_number", ""),
-                            "airline": flight.get("airline", "Unknown"),
-                            "price": self._extract_price(str(flight_group.get("price", "0"))),
-                            "departure": {
-                                "at": flight.get("departure_airport", {}).get("time", ""),
-                                "iataCode": flight.get("departure_airport", {}).get("id", "")
-                            },
-                            "arrival": {
-                                "at": flight.get("arrival_airport", {}).get("time", ""),
-                                "iataCode": flight.get("arrival_airport", {}).get("id", "")
-                            },
-                            "duration": flight.get("duration", 0),
-                            "stops": 0  # best_flights are typically direct
-                        })
-                    except:
-                        continue
+        Each flight group becomes one itinerary: from the first leg's departure to the last
+        leg's arrival, with stops and layovers taken from the legs. Groups that are
+        malformed are skipped.
+        """
+        flights = []
         
-        # Process other flights
-        for flight_group in other_flights:
-            if "flights" in flight_group:
-                for flight in flight_group["flights"]:
-                    try:
-                        flights.append({
-                            "id": flight.get("flight_number", ""),
-                            "airline": flight.get("airline", "Unknown"),
-                            "price": self._extract_price(str(flight_group.get("price", "0"))),
-                            "departure": {
-                                "at": flight.get("departure_airport", {}).get("time", ""),
-                                "iataCode": flight.get("departure_airport", {}).get("id", "")
-                            },
-                            "arrival": {
-                                "at": flight.get("arrival_airport", {}).get("time", ""),
-                                "iataCode": flight.get("arrival_airport", {}).get("id", "")
-                            },
-                            "duration": flight.get("duration", 0),
-                            "stops": 0  # other_flights are typically direct
-                        })
-                    except:
-                        continue
+        # SerpAPI returns best_flights and other_flights; best ones first
+        for flight_group in chain(data.get("best_flights") or (), data.get("other_flights") or ()):
+            try:
+                legs = flight_group.get("flights")
+                if not legs:
+                    continue
+                departure = legs[0].get("departure_airport") or {}
+                arrival = legs[-1].get("arrival_airport") or {}
+                layovers = flight_group.get("layovers") or ()
+                airlines = list(dict.fromkeys(leg.get("airline", "Unknown") for leg in legs))
+                duration = flight_group.get("total_duration")
+                if duration is None:
+                    duration = (sum(leg.get("duration", 0) for leg in legs)
+                                + sum(layover.get("duration", 0) for layover in layovers))
+                flights.append({
+                    "id": "/".join(leg.get("flight_number", "") for leg in legs),
+                    "airline": ", ".join(airlines),
+                    # One price per group, parsed once
+                    "price": self._extract_price(flight_group.get("price", 0)),
+                    "departure": {
+                        "at": departure.get("time", ""),
+                        "iataCode": departure.get("id", "")
+                    },
+                    "arrival": {
+                        "at": arrival.get("time", ""),
+                        "iataCode": arrival.get("id", "")
+                    },
+                    "duration": duration,
+                    "stops": len(legs) - 1,
+                    "layovers": [layover.get("id", "") for layover in layovers]
+                })
+            except (AttributeError, TypeError) as e:
+                print(f"Skipping a malformed SerpAPI flight group: {e}")
         
         return flights
     
-    def _extract_price(self, price_str: str) -> float:
-        """Extract price"""
+    def _extract_price(self, price: Any) -> float:
+        """Extract price from a number or a string like "$1,234" """
+        if isinstance(price, (int, float)):
+            return float(price)
         try:
-            return float(price_str.replace("$", "").replace(",", ""))
-        except:
+            return float(str(price).replace("$", "").replace(",", ""))
+        except ValueError:
             return 0.0
     
     def _parse_duration(self, duration_str: str) -> int:
@@ -157,5 +138,5 @@ class SerpApiAdapter:
                 elif 'm' in part:
                     minutes = int(part.replace('m', ''))
             return hours * 60 + minutes
-        except:
+        except (AttributeError, ValueError):
             return 0
\ No newline at end of file
@@ -2,13 +2,30 @@
 Simple FastAPI app for hackathon
 """
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api import flight_routes, chat_routes
+from app.flights.airport_index import get_airport_index
+from app.flights.flight_search import start_flight_search_service, close_flight_search_service
+from app.flights.prefetch import close_flight_prefetcher
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the airport index before the first chat or search needs it
+    get_airport_index()
+    # One flight search service (and SerpAPI connection pool) serves every request
+    await start_flight_search_service()
+    yield
+    await close_flight_prefetcher()
+    await close_flight_search_service()
+
 
 # Create app
-app = FastAPI(title="Travel AI Backend", version="1.0.0")
+app = FastAPI(title="Travel AI Backend", version="1.0.0", lifespan=lifespan)
 
 # Add CORS
 app.add_middleware(
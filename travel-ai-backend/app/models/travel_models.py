@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from enum import Enum
 from app.models.session_models import BudgetLevel
 
@@ -18,6 +18,40 @@ class FlightSearchRequest(BaseModel):
     budget: BudgetLevel = BudgetLevel.MEDIUM
     accessibility_requirements: bool = False
 
+class FlexibleFlightSearchRequest(BaseModel):
+    """Round trips of a fixed length departing on any day of a date window"""
+    origin: str
+    destination: str
+    earliest_departure: date
+    latest_departure: date
+    trip_length_days: int = Field(ge=0)
+    num_travelers: int = 1
+    budget: BudgetLevel = BudgetLevel.MEDIUM
+    accessibility_requirements: bool = False
+
+    @model_validator(mode="after")
+    def check_window(self):
+        if self.latest_departure < self.earliest_departure:
+            raise ValueError("latest_departure must not be before earliest_departure")
+        return self
+
+    def date_pairs(self) -> List[tuple]:
+        """(departure_date, return_date) for every departure day in the window"""
+        days = (self.latest_departure - self.earliest_departure).days + 1
+        departures = [self.earliest_departure + timedelta(days=offset) for offset in range(days)]
+        return [(departure, departure + timedelta(days=self.trip_length_days)) for departure in departures]
+
+    def for_dates(self, departure_date: date, return_date: date) -> FlightSearchRequest:
+        return FlightSearchRequest(
+            origin=self.origin,
+            destination=self.destination,
+            departure_date=departure_date,
+            return_date=return_date,
+            num_travelers=self.num_travelers,
+            budget=self.budget,
+            accessibility_requirements=self.accessibility_requirements
+        )
+
 class FlightOffer(BaseModel):
     flight_id: str
     airline: str
@@ -39,4 +73,17 @@ class FlightSearchResponse(BaseModel):
     search_id: str
     offers: List[FlightOffer]
     total_results: int
+    search_summary: dict
+
+class PriceCalendarEntry(BaseModel):
+    departure_date: date
+    return_date: date
+    lowest_price: Optional[float] = None  # None when no valid flight was found
+    total_results: int
+
+class FlexibleFlightSearchResponse(BaseModel):
+    search_id: str
+    calendar: List[PriceCalendarEntry]
+    offers: List[FlightOffer]
+    total_results: int
     search_summary: dict
\ No newline at end of file
@@ -1,18 +1,307 @@
+import json
+import sqlite3
+import threading
+import time
 import uuid
-from typing import Dict, Any, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+
+SessionData = Dict[str, Any]
+
+
+def _serialize(session_data: SessionData) -> str:
+    # Sessions hold dates and datetimes from flight searches; store them as strings
+    return json.dumps(session_data, default=str)
+
+
+class SessionStore(ABC):
+    """
+    Interface for chat session storage.
+
+    Sessions are stored serialized, so callers always get their own copy:
+    changes are only visible to other requests (and workers) once saved.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[SessionData]:
+        """Return a copy of a stored session, or None if it is missing or expired."""
+
+    @abstractmethod
+    def save(self, session_id: Optional[str], session_data: SessionData) -> str:
+        """Store a session under `session_id`, or under a new id if it is missing or unknown."""
+
+    @abstractmethod
+    def update(self, session_id: str, mutate: Callable[[SessionData], None]) -> Optional[SessionData]:
+        """Atomically apply `mutate` to a stored session; returns the result, or None if not found."""
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Remove a session if it exists."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """Return size and eviction counters."""
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process store with LRU eviction, a sliding TTL and a memory budget.
+
+    Every access extends a session's lifetime by `ttl_seconds`. Once there
+    are more than `max_sessions` sessions or their serialized size exceeds
+    `max_bytes`, the least recently used ones are evicted.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _load(self, session_id: str, now: float) -> Optional[str]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at <= now:
+            self._remove(session_id)
+            self.expirations += 1
+            return None
+        self._sessions[session_id] = (data, now + self.ttl_seconds)
+        self._sessions.move_to_end(session_id)
+        return data
+
+    def _store(self, session_id: str, data: str, now: float):
+        self._remove(session_id)
+        self._sessions[session_id] = (data, now + self.ttl_seconds)
+        self._bytes += len(data)
+        self._evict(now)
+
+    def _remove(self, session_id: str):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def _evict(self, now: float):
+        expired = [session_id for session_id, (_, expires_at) in self._sessions.items() if expires_at <= now]
+        for session_id in expired:
+            self._remove(session_id)
+        self.expirations += len(expired)
+        # Always keep the session that was just written
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            oldest = next(iter(self._sessions))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        with self._lock:
+            data = self._load(session_id, time.time())
+        return json.loads(data) if data is not None else None
+
+    def save(self, session_id: Optional[str], session_data: SessionData) -> str:
+        data = _serialize(session_data)
+        with self._lock:
+            now = time.time()
+            if not session_id or self._load(session_id, now) is None:
+                session_id = str(uuid.uuid4())
+            self._store(session_id, data, now)
+        return session_id
+
+    def update(self, session_id: str, mutate: Callable[[SessionData], None]) -> Optional[SessionData]:
+        with self._lock:
+            now = time.time()
+            data = self._load(session_id, now)
+            if data is None:
+                return None
+            session_data = json.loads(data)
+            mutate(session_data)
+            self._store(session_id, _serialize(session_data), now)
+        return session_data
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite-backed store that every worker process on the host can share.
+
+    Updates run in IMMEDIATE transactions, so a read-modify-write cannot
+    interleave with another worker's. Expiry and LRU eviction follow the
+    same rules as MemorySessionStore.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_sessions: int, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def _transaction(self, work: Callable[[float], Any]) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(time.time())
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _load(self, session_id: str, now: float) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE sessions SET expires_at = ?, last_access = ? WHERE session_id = ?",
+            (now + self.ttl_seconds, now, session_id)
+        )
+        return row[0]
+
+    def _store(self, session_id: str, data: str, now: float):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (session_id, data, len(data), now + self.ttl_seconds, now)
+        )
+        self._evict(session_id, now)
+
+    def _evict(self, keep_session_id: str, now: float):
+        self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        if count <= self.max_sessions and total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT session_id, size FROM sessions WHERE session_id != ? ORDER BY last_access ASC", (keep_session_id,)
+        )
+        evicted = []
+        for session_id, size in rows:
+            if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                break
+            evicted.append((session_id,))
+            count -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", evicted)
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        data = self._transaction(lambda now: self._load(session_id, now))
+        return json.loads(data) if data is not None else None
+
+    def save(self, session_id: Optional[str], session_data: SessionData) -> str:
+        data = _serialize(session_data)
+
+        def work(now):
+            target_id = session_id
+            if not target_id or self._load(target_id, now) is None:
+                target_id = str(uuid.uuid4())
+            self._store(target_id, data, now)
+            return target_id
+
+        return self._transaction(work)
+
+    def update(self, session_id: str, mutate: Callable[[SessionData], None]) -> Optional[SessionData]:
+        def work(now):
+            data = self._load(session_id, now)
+            if data is None:
+                return None
+            session_data = json.loads(data)
+            mutate(session_data)
+            self._store(session_id, _serialize(session_data), now)
+            return session_data
+
+        return self._transaction(work)
+
+    def delete(self, session_id: str):
+        self._transaction(lambda now: self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "bytes": total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by settings.SESSION_BACKEND ("memory" or "sqlite")"""
+    if settings.SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(settings.SESSION_DB_PATH, settings.SESSION_TTL_SECONDS,
+                                  settings.SESSION_MAX_ENTRIES, settings.SESSION_MAX_BYTES)
+    return MemorySessionStore(settings.SESSION_TTL_SECONDS, settings.SESSION_MAX_ENTRIES,
+                              settings.SESSION_MAX_BYTES)
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_session_store()
+    return _store
 
-# In-memory session storage for simplicity in a hackathon context
-_sessions: Dict[str, Dict[str, Any]] = {}
 
 def get_session(session_id: Optional[str]) -> Optional[Dict[str, Any]]:
-    """Retrieves a session from the in-memory store."""
-    if session_id and session_id in _sessions:
-        return _sessions[session_id]
-    return None
+    """Retrieves a copy of a session from the session store."""
+    if not session_id:
+        return None
+    return get_session_store().get(session_id)
+
 
 def update_session(session_data: Dict[str, Any], session_id: Optional[str] = None) -> str:
-    """Updates or creates a session in the in-memory store."""
-    if not session_id or session_id not in _sessions:
-        session_id = str(uuid.uuid4())
-    _sessions[session_id] = session_data
-    return session_id
\ No newline at end of file
+    """Updates or creates a session in the session store."""
+    return get_session_store().save(session_id, session_data)
+
+
+def modify_session(session_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+    """Atomically applies `mutate` to a stored session and saves it; returns None if it does not exist."""
+    return get_session_store().update(session_id, mutate)
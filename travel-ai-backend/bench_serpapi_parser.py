@@ -0,0 +1,122 @@
+"""
+Microbenchmark for SerpAPI response parsing and offer selection
+
+Usage:
+    python bench_serpapi_parser.py [recorded_response.json] [--groups N] [--repeat N]
+
+Without a recorded response, a synthetic Google Flights response with
+--groups itineraries (1-3 legs each) is generated. Reports the best of
+--repeat runs for the previous per-leg parser (strptime, a FlightOffer
+for every row, full sort) and for the current single-pass parser with
+heap selection.
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+from app.flights.offer_selection import offer_rank_key, select_top_offers
+from app.flights.serpapi_adapter import SerpApiAdapter
+from app.models.travel_models import FlightOffer
+
+
+def synthetic_response(groups: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    airports = ["SFO", "JFK", "ORD", "DEN", "ATL", "SEA", "BOS", "LAX"]
+
+    def group():
+        legs = []
+        hour = rng.randint(0, 12)
+        for _ in range(rng.choice([1, 1, 2, 3])):
+            legs.append({
+                "departure_airport": {"name": "Airport", "id": rng.choice(airports), "time": f"2025-09-15 {hour:02d}:{rng.randint(0, 59):02d}"},
+                "arrival_airport": {"name": "Airport", "id": rng.choice(airports), "time": f"2025-09-15 {hour + 2:02d}:{rng.randint(0, 59):02d}"},
+                "duration": rng.randint(60, 300),
+                "airline": rng.choice(["United", "Delta", "American", "JetBlue"]),
+                "flight_number": f"{rng.choice(['UA', 'DL', 'AA', 'B6'])} {rng.randint(1, 9999)}",
+            })
+            hour += 3
+        return {
+            "flights": legs,
+            "layovers": [{"id": leg["arrival_airport"]["id"], "duration": 60} for leg in legs[:-1]],
+            "total_duration": sum(leg["duration"] for leg in legs) + 60 * (len(legs) - 1),
+            "price": rng.randint(90, 1500),
+        }
+
+    best = max(1, groups // 10)
+    return {"best_flights": [group() for _ in range(best)], "other_flights": [group() for _ in range(groups - best)]}
+
+
+def previous_parser(data: dict) -> list:
+    """The previous per-leg parsing and offer building, kept here for comparison"""
+    adapter = SerpApiAdapter()
+    rows = []
+    for group in data.get("best_flights", []) + data.get("other_flights", []):
+        for leg in group.get("flights", []):
+            rows.append({
+                "id": leg.get("flight_number", ""),
+                "airline": leg.get("airline", "Unknown"),
+                "price": adapter._extract_price(str(group.get("price", "0"))),
+                "departure": {"at": leg.get("departure_airport", {}).get("time", ""),
+                              "iataCode": leg.get("departure_airport", {}).get("id", "")},
+                "arrival": {"at": leg.get("arrival_airport", {}).get("time", ""),
+                            "iataCode": leg.get("arrival_airport", {}).get("id", "")},
+                "duration": leg.get("duration", 0),
+                "stops": 0,
+            })
+    offers = [
+        FlightOffer(
+            flight_id=row["id"], airline=row["airline"], flight_number=row["id"],
+            origin=row["departure"]["iataCode"], destination=row["arrival"]["iataCode"],
+            departure_time=datetime.strptime(row["departure"]["at"], "%Y-%m-%d %H:%M"),
+            arrival_time=datetime.strptime(row["arrival"]["at"], "%Y-%m-%d %H:%M"),
+            duration_minutes=row["duration"], price=row["price"],
+            accessibility_score=7.0 if row["stops"] == 0 else 5.0,
+            accessibility_features=["Direct flight"] if row["stops"] == 0 else [],
+            is_direct=row["stops"] == 0, stops=row["stops"]
+        )
+        for row in rows
+    ]
+    return sorted(offers, key=offer_rank_key)[:3]
+
+
+def current_parser(data: dict) -> list:
+    raw_flights = SerpApiAdapter()._extract_flights(data)
+    return select_top_offers(raw_flights, accessibility_requirements=False, limit=3)[0]
+
+
+def best_time(func, data: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("response", nargs="?", help="Recorded SerpAPI Google Flights JSON response")
+    parser.add_argument("--groups", type=int, default=5000, help="Itineraries in the synthetic response")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.response:
+        with open(args.response, encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        data = synthetic_response(args.groups)
+    groups = len(data.get("best_flights", [])) + len(data.get("other_flights", []))
+    legs = sum(len(group.get("flights", [])) for group in data.get("best_flights", []) + data.get("other_flights", []))
+
+    previous = best_time(previous_parser, data, args.repeat)
+    current = best_time(current_parser, data, args.repeat)
+    print(f"{groups} itineraries, {legs} legs (best of {args.repeat})")
+    print(f"  previous parser + full sort:     {previous * 1000:8.1f} ms")
+    print(f"  single-pass parser + heap top-k: {current * 1000:8.1f} ms  ({previous / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ import re # Import the regular expression module
 # Set the environment variable for testing before importing the app
 import os
 # os.environ['USE_MOCK_DATA'] = 'True'  # Commented out to ensure no backend mock data is used
+# No speculative flight searches in tests that don't ask for them (.env may set a SerpAPI key)
+os.environ['FLIGHT_PREFETCH_ENABLED'] = 'false'
 
 from app.main import app
 from app.models.travel_models import FlightSearchResponse
@@ -98,13 +100,13 @@ def test_chat_endpoint(client, monkeypatch):
     Tests the chat endpoint, ensuring it handles session state and returns the correct response format.
     """
     # Mock the call_gemini_update_state function to return a predictable response
-    def mock_update_state(state, message, history):
+    async def mock_update_state(state, message, history):
         # Simulate extracting one piece of information and asking the next question
         updated_state = state.copy()
         updated_state["destination"] = "New York"
         return updated_state, ["dates_of_travel"], "When would you like to travel?"
 
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state)
 
     # First request (no session_id)
     initial_request = {"message": "I want to go to New York"}
@@ -132,7 +134,7 @@ def test_chat_endpoint_flight_parameter_extraction(client, monkeypatch):
     Tests that the chat endpoint extracts flight parameters when conversation is complete.
     """
     # Mock the call_gemini_update_state function to simulate a complete conversation
-    def mock_update_state_complete(state, message, history):
+    async def mock_update_state_complete(state, message, history):
         # Simulate a complete conversation with all required fields filled
         complete_state = {
             "budget": "mid-range",
@@ -151,7 +153,7 @@ def test_chat_endpoint_flight_parameter_extraction(client, monkeypatch):
         return complete_state, [], ""  # Empty next_question indicates completion
 
     # Mock the extract_flight_parameters_from_state function
-    def mock_extract_flight_params(state):
+    async def mock_extract_flight_params(state):
         return {
             "origin": "San Francisco",
             "destination": "New York",
@@ -162,8 +164,8 @@ def test_chat_endpoint_flight_parameter_extraction(client, monkeypatch):
             "accessibility_requirements": False
         }
 
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state_complete)
-    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state", mock_extract_flight_params)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state_complete)
+    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state_async", mock_extract_flight_params)
 
     # Send a message that completes the conversation
     request = {"message": "That sounds perfect, I'm ready to book!"}
@@ -200,12 +202,12 @@ def test_chat_endpoint_incomplete_conversation_no_flight_params(client, monkeypa
     Tests that flight parameters are NOT extracted when conversation is incomplete.
     """
     # Mock incomplete conversation
-    def mock_update_state_incomplete(state, message, history):
+    async def mock_update_state_incomplete(state, message, history):
         updated_state = state.copy()
         updated_state["destination"] = "Paris"
         return updated_state, ["dates_of_travel", "budget"], "When would you like to travel and what's your budget?"
 
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state_incomplete)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state_incomplete)
 
     request = {"message": "I want to visit Paris"}
     response = client.post("/api/v1/chat/chat", json=request)
@@ -226,7 +228,7 @@ def test_chat_endpoint_flight_parameter_extraction_error_handling(client, monkey
     Tests error handling when flight parameter extraction fails.
     """
     # Mock complete conversation
-    def mock_update_state_complete(state, message, history):
+    async def mock_update_state_complete(state, message, history):
         complete_state = {
             "budget": "luxury",
             "starting_location": "Los Angeles",
@@ -244,11 +246,11 @@ def test_chat_endpoint_flight_parameter_extraction_error_handling(client, monkey
         return complete_state, [], ""  # Empty next_question indicates completion
 
     # Mock extraction function that returns None (simulating failure)
-    def mock_extract_flight_params_failure(state):
+    async def mock_extract_flight_params_failure(state):
         return None
 
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state_complete)
-    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state", mock_extract_flight_params_failure)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state_complete)
+    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state_async", mock_extract_flight_params_failure)
 
     request = {"message": "Perfect, let's proceed!"}
     response = client.post("/api/v1/chat/chat", json=request)
@@ -266,7 +268,7 @@ def test_session_stores_flight_parameters(client, monkeypatch):
     Tests that flight parameters are stored in the session when extracted.
     """
     # Mock complete conversation and extraction
-    def mock_update_state_complete(state, message, history):
+    async def mock_update_state_complete(state, message, history):
         complete_state = {
             "budget": "economy",
             "starting_location": "Chicago",
@@ -283,7 +285,7 @@ def test_session_stores_flight_parameters(client, monkeypatch):
         }
         return complete_state, [], ""
 
-    def mock_extract_flight_params(state):
+    async def mock_extract_flight_params(state):
         return {
             "origin": "Chicago",
             "destination": "Miami",
@@ -306,8 +308,8 @@ def test_session_stores_flight_parameters(client, monkeypatch):
         stored_sessions[session_id] = session
         return session_id
 
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state_complete)
-    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state", mock_extract_flight_params)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state_complete)
+    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state_async", mock_extract_flight_params)
     monkeypatch.setattr("app.api.chat_routes.get_session", mock_get_session)
     monkeypatch.setattr("app.api.chat_routes.update_session", mock_update_session)
 
@@ -383,7 +385,7 @@ def test_flight_search_with_economy_budget(client, monkeypatch):
     """
     stored_sessions = {}
     
-    def mock_update_state_with_economy_budget(state, message, history=None):
+    async def mock_update_state_with_economy_budget(state, message, history=None):
         # Changed parameter name back to 'history' to match how it's called
         return {
             "starting_location": "Los Angeles",
@@ -394,7 +396,13 @@ def test_flight_search_with_economy_budget(client, monkeypatch):
             },
             "number_of_travelers": 1,
             "budget": "economy",  # This should be converted to "low"
-            "accessibility_needs": None
+            "accessibility_needs": "none",
+            "dietary_needs": "none",
+            "age_group_of_travelers": "adults",
+            "interests": ["museums"],
+            "how_packed_trip": "moderate",
+            "ok_with_walking": True,
+            "trip_type": "leisure"
         }, [], "Perfect! I have all the information I need."
     
     def mock_get_session(session_id):
@@ -406,7 +414,7 @@ def test_flight_search_with_economy_budget(client, monkeypatch):
         stored_sessions[session_id] = session
         return session_id
     
-    async def mock_flight_search(request):
+    async def mock_flight_search(self, request):
         from app.models.travel_models import FlightSearchResponse, FlightOffer
         from datetime import datetime
         
@@ -436,7 +444,7 @@ def test_flight_search_with_economy_budget(client, monkeypatch):
             search_summary={"message": "Found 1 budget flight"}
         )
     
-    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state", mock_update_state_with_economy_budget)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state_with_economy_budget)
     monkeypatch.setattr("app.api.chat_routes.get_session", mock_get_session)
     monkeypatch.setattr("app.api.chat_routes.update_session", mock_update_session)
     monkeypatch.setattr("app.flights.flight_search.FlightSearchService.search_flights", mock_flight_search)
@@ -460,4 +468,751 @@ def test_flight_search_with_economy_budget(client, monkeypatch):
     response_data = response.json()
     assert response_data["conversation_complete"] == True
     assert "flight_results" in response_data
-    assert len(response_data["flight_results"]["offers"]) > 0
\ No newline at end of file
+    assert len(response_data["flight_results"]["offers"]) > 0
+
+
+def test_places_client_retries_over_query_limit(monkeypatch):
+    """
+    Tests that the Places client backs off and retries throttled responses, returning the first usable one.
+    """
+    from app.core.google_places import places_client
+
+    class FakeResponse:
+        def __init__(self, body):
+            self.body = body
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.body
+
+    bodies = [{"status": "OVER_QUERY_LIMIT"}, {"status": "OK", "result": {"name": "Louvre"}}]
+    calls = []
+
+    class FakeSession:
+        def get(self, url, params=None, timeout=None):
+            calls.append((url, params, timeout))
+            return FakeResponse(bodies[len(calls) - 1])
+
+    monkeypatch.setattr(places_client, "backoff_delay", lambda *args: 0)
+    client = places_client.PlacesClient("test-key", timeout_seconds=5)
+    monkeypatch.setattr(client, "_get_session", lambda: FakeSession())
+
+    data = client.place_details("place-1", ["name", "rating"])
+
+    assert data["result"]["name"] == "Louvre"
+    assert len(calls) == 2 and client.retries == 1
+    url, params, timeout = calls[0]
+    assert url.endswith("/details/json")
+    assert params == {"place_id": "place-1", "fields": "name,rating", "language": "en", "key": "test-key"}
+    assert timeout == 5
+
+    # A body that is not JSON is retried, then reported as a PlacesApiError rather than a ValueError
+    class HtmlResponse(FakeResponse):
+        def json(self):
+            raise ValueError("Expecting value")
+
+    html_calls = []
+    monkeypatch.setattr(client, "_get_session", lambda: type("HtmlSession", (), {
+        "get": lambda self, url, params=None, timeout=None: html_calls.append(url) or HtmlResponse(None)
+    })())
+    with pytest.raises(places_client.PlacesApiError):
+        client.get_json("details", {"place_id": "place-1"})
+    assert len(html_calls) == client.max_retries + 1
+
+
+def test_airport_code_resolution():
+    """
+    Tests that the shared airport index resolves exact, normalized, embedded and prefix city names.
+    """
+    from app.flights.airport_index import get_airport_index, resolve_airport_code
+
+    assert get_airport_index() is get_airport_index()
+    assert resolve_airport_code("San Francisco") == "SFO"
+    assert resolve_airport_code("  san francisco ") == "SFO"
+    assert resolve_airport_code("lax") == "LAX"
+    assert resolve_airport_code("São Paulo") == resolve_airport_code("sao paulo")
+    assert resolve_airport_code("Boston, MA") == "BOS"
+    assert resolve_airport_code("san fran") == "SFO"
+    # Unknown input is passed through, since it might already be an airport code
+    assert resolve_airport_code("Zzzz") == "ZZZZ"
+
+def test_airport_search_endpoint(client):
+    """
+    Tests ranked, typo-tolerant airport search with a result limit and pagination.
+    """
+    response = client.get("/api/v1/flights/airports/san fransisco")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["airports"][0]["code"] == "SFO"
+
+    response = client.get("/api/v1/flights/airports/SFO")
+    assert response.json()["airports"][0] == {"code": "SFO", "name": "San Francisco", "city": "San Francisco", "score": 100.0}
+
+    first_page = client.get("/api/v1/flights/airports/lon", params={"limit": 3}).json()
+    second_page = client.get("/api/v1/flights/airports/lon", params={"limit": 3, "offset": 3}).json()
+    assert len(first_page["airports"]) == 3
+    assert first_page["total"] == second_page["total"] > 3
+    assert not {a["code"] for a in first_page["airports"]} & {a["code"] for a in second_page["airports"]}
+    assert all(a["score"] >= b["score"] for a, b in zip(first_page["airports"], first_page["airports"][1:]))
+
+    assert client.get("/api/v1/flights/airports/lon", params={"limit": 0}).status_code == 422
+
+def test_flight_searches_share_pooled_session(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests that flight searches reuse the app-scoped SerpAPI connection pool opened at startup.
+    """
+    from app.config import settings
+    from app.flights.flight_search import get_flight_search_service
+
+    sessions = []
+
+    async def mock_get_flights(self, session, params):
+        sessions.append(session)
+        return mock_serpapi_response
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter._get_flights", mock_get_flights)
+    # Earlier tests may have cached these routes (city names resolve to the same airports)
+    get_flight_search_service().cache.clear()
+
+    for departure_date in ("2025-09-15", "2025-09-16"):
+        payload = {
+            "origin": "SFO",
+            "destination": "JFK",
+            "departure_date": departure_date,
+            "return_date": "2025-09-22"
+        }
+        response = client.post("/api/v1/flights/search", json=payload)
+        assert response.status_code == 200
+        assert response.json()["total_results"] == len(mock_serpapi_response)
+
+    assert len(sessions) == 2
+    assert sessions[0] is sessions[1]
+    assert not sessions[0].closed
+    assert sessions[0].connector.limit == settings.SERPAPI_CONNECTION_LIMIT
+
+
+def test_identical_flight_searches_are_cached(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests that repeated searches are served from the cache and concurrent ones share one upstream call.
+    """
+    import asyncio
+    from app.config import settings
+    from app.flights.flight_cache import FlightSearchCache
+
+    upstream_calls = []
+
+    async def mock_search(self, request):
+        upstream_calls.append(request)
+        return mock_serpapi_response
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+
+    before = client.get("/api/v1/flights/cache/stats").json()
+    payload = {
+        "origin": "ORD",
+        "destination": "MIA",
+        "departure_date": "2025-10-01",
+        "return_date": "2025-10-08",
+        "budget": "low"
+    }
+    first = client.post("/api/v1/flights/search", json=payload)
+    # Budget only affects ranking, so it shares the cached upstream results
+    second = client.post("/api/v1/flights/search", json={**payload, "budget": "high"})
+    assert first.status_code == second.status_code == 200
+    assert len(upstream_calls) == 1
+
+    after = client.get("/api/v1/flights/cache/stats").json()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+    # Concurrent identical lookups are coalesced into a single fetch
+    cache = FlightSearchCache(ttl_seconds=60)
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.01)
+        return mock_serpapi_response
+
+    async def concurrent_lookups():
+        return await asyncio.gather(*[cache.get_or_fetch("key", fetch) for _ in range(5)])
+
+    results = asyncio.run(concurrent_lookups())
+    assert len(fetches) == 1
+    assert all(result == mock_serpapi_response for result in results)
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_session_stores_evict_and_share_sessions(tmp_path):
+    """
+    Tests LRU/TTL eviction in the memory store and sharing through the SQLite store.
+    """
+    from app.utils.session_manager import MemorySessionStore, SQLiteSessionStore
+
+    store = MemorySessionStore(ttl_seconds=60, max_sessions=2, max_bytes=10_000)
+    first = store.save(None, {"history": ["hi"], "departure": date(2025, 10, 1)})
+    second = store.save(None, {"history": []})
+    assert store.get(first)["departure"] == "2025-10-01"
+    # Reading `first` made `second` the least recently used session
+    third = store.save(None, {"history": []})
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+    assert store.stats()["evictions"] == 1
+    # Unknown ids get a fresh session instead of being created under the caller's id
+    assert store.save("unknown", {}) != "unknown"
+
+    expired = MemorySessionStore(ttl_seconds=0, max_sessions=10, max_bytes=10_000)
+    assert expired.get(expired.save(None, {})) is None
+
+    bounded = MemorySessionStore(ttl_seconds=60, max_sessions=10, max_bytes=100)
+    old = bounded.save(None, {"history": ["x" * 60]})
+    bounded.save(None, {"history": ["y" * 60]})
+    assert bounded.get(old) is None
+    assert bounded.stats()["bytes"] <= 100
+
+    path = str(tmp_path / "sessions.sqlite")
+    worker_a = SQLiteSessionStore(path, ttl_seconds=60, max_sessions=10, max_bytes=10_000)
+    worker_b = SQLiteSessionStore(path, ttl_seconds=60, max_sessions=10, max_bytes=10_000)
+    session_id = worker_a.save(None, {"history": ["hi"]})
+    worker_b.update(session_id, lambda session: session["history"].append("again"))
+    assert worker_a.get(session_id)["history"] == ["hi", "again"]
+    assert worker_a.save(session_id, {"history": []}) == session_id
+    assert worker_b.get(session_id) == {"history": []}
+    assert worker_b.update("missing", lambda session: None) is None
+    worker_a.close()
+    worker_b.close()
+
+
+def test_conversation_context_keeps_prompt_bounded():
+    """
+    Tests that old turns are folded into a bounded summary so the prompt stops growing.
+    """
+    from app.conversational_bot import _build_update_state_prompt
+    from app.core.conversation_context import ConversationContext
+
+    context = ConversationContext(window_turns=4, summary_max_chars=300)
+    prompt_sizes = []
+    for turn in range(40):
+        context.add("user", f"message {turn}: we love museums and food " * 3)
+        context.add("assistant", f"question {turn}: anything else?")
+        prompt_sizes.append(len(_build_update_state_prompt({"destination": "Paris"}, "next", context)))
+
+    assert len(context.turns) == 4
+    assert context.turns[-1] == ("assistant", "question 39: anything else?")
+    assert len(context.summary) <= 300
+    assert "message 37" in context.summary and "message 0:" not in context.summary
+    assert prompt_sizes[-1] == prompt_sizes[20]
+
+    restored = ConversationContext.from_dict(context.to_dict(), window_turns=4, summary_max_chars=300)
+    assert restored.turns == context.turns and restored.summary == context.summary
+    rendered = restored.render({"destination": "Paris", "budget": None, "interests": []})
+    assert 'KNOWN TRIP DETAILS: {"destination":"Paris"}' in rendered
+    # The prompt carries the compacted state once, alongside the condensed history
+    prompt = _build_update_state_prompt({"destination": "Paris", "budget": None}, "next", restored)
+    assert prompt.count('KNOWN TRIP DETAILS: {"destination":"Paris"}') == 1
+    assert "CURRENT INFO" not in prompt
+    # The old list-of-messages history is still accepted
+    assert "USER: hello" in _build_update_state_prompt({}, "next", ["hello"])
+
+
+def test_rule_based_fast_path_skips_gemini(client, monkeypatch):
+    """
+    Tests that short, unambiguous replies update the state locally and only the rest reach Gemini.
+    """
+    from app import conversational_bot
+    from app.conversational_bot import INITIAL_STATE, call_gemini_update_state
+    from app.core.conversation_context import ConversationContext
+    from app.core.preference_extractor import FIELD_QUESTIONS, PreferenceExtractor
+
+    extractor = PreferenceExtractor(today=lambda: date(2025, 6, 1))
+    monkeypatch.setattr(conversational_bot, "get_preference_extractor", lambda: extractor)
+    # Turns that reach the LLM path get the offline mock update instead of a real Gemini call
+    monkeypatch.setattr(conversational_bot, "GEMINI_AVAILABLE", False)
+    llm_prompts = []
+    monkeypatch.setattr(conversational_bot, "_build_update_state_prompt",
+                        lambda state, message, history: llm_prompts.append(message) or "prompt")
+
+    def reply(state, question, message):
+        context = ConversationContext()
+        context.add("assistant", question)
+        return call_gemini_update_state(state, message, context)
+
+    state, missing, question = reply(INITIAL_STATE.copy(), FIELD_QUESTIONS["starting_location"],
+                                     "from Boston to Chicago")
+    assert (state["starting_location"], state["destination"]) == ("Boston", "Chicago")
+    assert missing[0] == "dates_of_travel" and question == FIELD_QUESTIONS["dates_of_travel"]
+
+    state, missing, question = reply(state, question, "dec 28 to jan 4")
+    assert state["dates_of_travel"] == {"start_date": "2025-12-28", "end_date": "2026-01-04"}
+    state, _, _ = reply(state, question, "2 people")
+    assert state["number_of_travelers"] == 2
+    state, _, _ = reply(state, FIELD_QUESTIONS["ok_with_walking"], "nope")
+    assert state["ok_with_walking"] is False
+    state, _, _ = reply(state, FIELD_QUESTIONS["dietary_needs"], "vegetarian")
+    assert state["dietary_needs"] == "vegetarian"
+    returning, _, _ = reply({**state, "dates_of_travel": {"start_date": "2025-06-10"}},
+                            FIELD_QUESTIONS["dates_of_travel"], "heading back june 20")
+    assert returning["dates_of_travel"] == {"start_date": "2025-06-10", "end_date": "2025-06-20"}
+    assert not llm_prompts
+
+    # Anything the rules cannot fully account for goes to Gemini
+    reply(state, FIELD_QUESTIONS["destination"], "somewhere warm with beaches")
+    reply(state, FIELD_QUESTIONS["budget"], "luxury but cheap")
+    reply(state, "How many nights will you stay?", "3")
+    reply(state, "Great, 4 travelers! How many are kids?", "2")
+    reply(INITIAL_STATE.copy(), FIELD_QUESTIONS["dates_of_travel"], "june 10 - 5")
+    reply(INITIAL_STATE.copy(), FIELD_QUESTIONS["dates_of_travel"], "jun 10 to may 5")
+    reply(INITIAL_STATE.copy(), FIELD_QUESTIONS["dates_of_travel"], "heading back june 20")
+    reply(state, FIELD_QUESTIONS["interests"], "not sure")
+    reply(state, FIELD_QUESTIONS["interests"], "hiking, and we're 3 people")
+    reply(state, FIELD_QUESTIONS["age_group_of_travelers"], "we are not sure, maybe 30")
+    assert llm_prompts == ["somewhere warm with beaches", "luxury but cheap", "3", "2", "june 10 - 5",
+                           "jun 10 to may 5", "heading back june 20", "not sure",
+                           "hiking, and we're 3 people", "we are not sure, maybe 30"]
+
+    stats = extractor.stats()
+    assert (stats["local_turns"], stats["llm_turns"]) == (6, 10)
+    assert stats["fields_filled"]["destination"] == 1
+    assert client.get("/api/v1/chat/extractor/stats").status_code == 200
+
+
+def test_llm_gateway_takes_settings_and_one_api_key(monkeypatch):
+    """
+    Tests that gateways are shared per credentials, use the Gemini settings and refuse a second API key.
+    """
+    from app.config import settings
+    from app.core import ai_engine
+
+    monkeypatch.setattr(ai_engine, "_gateways", {})
+    monkeypatch.setattr(settings, "GEMINI_TIMEOUT_SECONDS", 12.0)
+    monkeypatch.setattr(settings, "GEMINI_MAX_CONCURRENT_CALLS", 3)
+
+    gateway = ai_engine.get_llm_gateway("key-a")
+    assert ai_engine.get_llm_gateway("key-a") is gateway
+    assert (gateway.timeout_seconds, gateway.max_concurrent_calls) == (12.0, 3)
+    # Vertex AI gateways don't use the API key
+    assert ai_engine.get_llm_gateway(vertex_project="trip-project") is not gateway
+    with pytest.raises(ValueError):
+        ai_engine.get_llm_gateway("key-b")
+
+
+def test_non_json_gemini_reply_keeps_the_state(monkeypatch):
+    """
+    Tests that a Gemini reply without a JSON object falls back to the current state and a retry question.
+    """
+    import asyncio
+    from app import conversational_bot
+    from app.config import settings
+    from app.conversational_bot import INITIAL_STATE
+
+    class FakeGateway:
+        def generate_content(self, prompt):
+            return type("Response", (), {"text": "Sorry, I can't help with that."})()
+
+    monkeypatch.setattr(conversational_bot, "GEMINI_AVAILABLE", True)
+    monkeypatch.setattr(conversational_bot, "GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "CHAT_FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(conversational_bot, "get_llm_gateway", lambda api_key: FakeGateway())
+
+    state = {**INITIAL_STATE, "destination": "Lisbon"}
+    updated_state, missing, question = conversational_bot.call_gemini_update_state(state, "Lisbon", None)
+    assert updated_state == state
+    assert "destination" not in missing and "budget" in missing
+    assert question == "Sorry, I had trouble understanding. Could you tell me more?"
+
+    async def streamed():
+        async def chunks(prompt):
+            yield type("Chunk", (), {"text": "no JSON here"})()
+        FakeGateway.generate_content_stream_async = lambda self, prompt: chunks(prompt)
+        return [event async for event in conversational_bot.stream_gemini_update_state(state, "Lisbon", None)]
+
+    assert asyncio.run(streamed())[-1] == ("result", (state, missing, question))
+
+
+def test_chat_stream_sends_tokens_state_and_flights(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests the SSE chat endpoint: question tokens first, then the state, then flight results.
+    """
+    import json as json_module
+    from app.config import settings
+    from app.conversational_bot import _StreamedStringField
+
+    complete_state = {
+        "budget": "mid-range", "starting_location": "Boston", "destination": "Chicago",
+        "accessibility_needs": "none", "dietary_needs": "none", "age_group_of_travelers": "Adults",
+        "interests": ["Food"], "how_packed_trip": "Moderate", "ok_with_walking": True,
+        "dates_of_travel": {"start_date": "2025-10-01", "end_date": "2025-10-08"},
+        "trip_type": "Leisure", "number_of_travelers": 1
+    }
+
+    async def mock_stream(state, message, history):
+        for piece in ["Perfect, ", "that's ", "everything!"]:
+            yield "token", piece
+        yield "result", (complete_state, [], "")
+
+    async def mock_extract_flight_params(state):
+        return {"origin": "BOS", "destination": "ORD", "departure_date": "2025-10-01",
+                "return_date": "2025-10-08", "num_travelers": 1, "budget": "medium"}
+
+    async def mock_search(self, request):
+        return mock_serpapi_response
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+    monkeypatch.setattr("app.api.chat_routes.stream_gemini_update_state", mock_stream)
+    monkeypatch.setattr("app.api.chat_routes.extract_flight_parameters_from_state_async", mock_extract_flight_params)
+
+    response = client.post("/api/v1/chat/chat/stream", json={"message": "Let's book it"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (frame.split("\n")[0][len("event: "):], json_module.loads(frame.split("\n")[1][len("data: "):]))
+        for frame in response.text.strip().split("\n\n")
+    ]
+    names = [name for name, _ in events]
+    assert names == ["token", "token", "token", "state", "flights", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "Perfect, that's everything!"
+
+    state, flights, done = events[3][1], events[4][1], events[5][1]
+    assert state["conversation_complete"] is True and state["flight_results"] is None
+    assert flights["flight_results"]["total_results"] == len(mock_serpapi_response)
+    assert done["flight_results"] == flights["flight_results"]
+    assert "found" in done["follow_up_questions"][0].lower()
+    # The session was saved with the search results and the final question
+    from app.utils.session_manager import get_session
+    session = get_session(done["session_id"])
+    assert session["flight_results"] == flights["flight_results"]
+    assert session["context"]["turns"][-1] == ["assistant", done["follow_up_questions"][0]]
+
+    # The next question is decoded from Gemini's JSON as it streams, escapes included
+    field = _StreamedStringField("next_question")
+    reply = '{"next_question": "Caf\\u00e9 or \\"bistro\\"?\\nPick one", "updated_json": {}}'
+    streamed = "".join(field.feed(char) for char in reply)
+    assert streamed == 'Café or "bistro"?\nPick one'
+    assert field.done
+
+
+def test_top_offers_selected_without_building_every_model(monkeypatch):
+    """
+    Tests that only the returned offers become FlightOffer models while total_results stays exact.
+    """
+    from app.flights.offer_selection import FlightColumns, select_top_offers
+
+    raw = []
+    for i in range(200):
+        raw.append({
+            "id": f"XX-{i}", "airline": "Test Air", "price": float(1000 - i), "duration": 300,
+            "stops": 0 if i % 2 else 1,
+            "departure": {"at": "2025-09-15 09:00", "iataCode": "SFO"},
+            "arrival": {"at": "2025-09-15 17:00", "iataCode": "JFK"},
+        })
+    raw[199]["departure"]["at"] = ""            # missing time
+    raw[197]["arrival"]["at"] = "not a time"    # unparseable time
+    raw[195]["price"] = None                    # invalid price
+
+    built = []
+    original_offer = FlightColumns.offer
+    monkeypatch.setattr(FlightColumns, "offer", lambda self, index, score: built.append(index) or original_offer(self, index, score))
+
+    offers, total = select_top_offers(raw, accessibility_requirements=True, limit=3)
+    assert total == 197
+    assert len(built) == 3
+    # Direct flights (odd ids) score 9.0, then the cheapest wins
+    assert [offer.flight_id for offer in offers] == ["XX-193", "XX-191", "XX-189"]
+    assert all(offer.accessibility_score == 9.0 and offer.is_direct for offer in offers)
+
+
+def test_serpapi_parser_builds_itineraries_in_one_pass():
+    """
+    Tests that SerpAPI flight groups become one itinerary each, with stops and layovers from the legs.
+    """
+    from app.flights.serpapi_adapter import SerpApiAdapter
+    from app.flights.offer_selection import parse_timestamp
+
+    def leg(number, origin, destination, departs, arrives, duration):
+        return {
+            "flight_number": number, "airline": "United", "duration": duration,
+            "departure_airport": {"id": origin, "time": departs},
+            "arrival_airport": {"id": destination, "time": arrives},
+        }
+
+    data = {
+        "best_flights": [{
+            "flights": [leg("UA 1", "SFO", "JFK", "2025-09-15 08:00", "2025-09-15 16:30", 330)],
+            "total_duration": 330, "price": 412,
+        }],
+        "other_flights": [
+            {
+                "flights": [leg("UA 2", "SFO", "ORD", "2025-09-15 07:00", "2025-09-15 13:00", 240),
+                            leg("UA 3", "ORD", "JFK", "2025-09-15 14:30", "2025-09-15 17:45", 135)],
+                "layovers": [{"id": "ORD", "duration": 90}],
+                "price": "$1,234",
+            },
+            {"flights": []},
+            {"flights": None, "price": 10},
+            "not a flight group",
+        ],
+    }
+    flights = SerpApiAdapter()._extract_flights(data)
+    assert len(flights) == 2
+    direct, connecting = flights
+    assert direct["stops"] == 0 and direct["price"] == 412.0 and direct["layovers"] == []
+    assert connecting["stops"] == 1
+    assert connecting["departure"] == {"at": "2025-09-15 07:00", "iataCode": "SFO"}
+    assert connecting["arrival"] == {"at": "2025-09-15 17:45", "iataCode": "JFK"}
+    assert connecting["layovers"] == ["ORD"]
+    assert connecting["duration"] == 240 + 135 + 90
+    assert connecting["price"] == 1234.0
+    assert connecting["id"] == "UA 2/UA 3"
+
+    for text in ["2025-09-15 07:00", "2025-9-5 7:05"]:
+        assert parse_timestamp(text) == datetime.strptime(text, "%Y-%m-%d %H:%M")
+    with pytest.raises(ValueError):
+        parse_timestamp("2025-02-30 10:00")
+
+
+def test_flexible_date_search_fans_out_with_bounded_concurrency(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests the price calendar, the merged top offers, the concurrency limit and per-date caching.
+    """
+    import asyncio
+    from app.config import settings
+
+    upstream_calls = []
+    running = {"now": 0, "peak": 0}
+
+    async def mock_search(self, request):
+        upstream_calls.append(request.departure_date)
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        # Later departures are cheaper
+        discount = 10.0 * request.departure_date.day
+        return [{**flight, "price": flight["price"] - discount} for flight in mock_serpapi_response]
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr(settings, "FLEXIBLE_SEARCH_CONCURRENCY", 2)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+
+    payload = {
+        "origin": "BOS",
+        "destination": "SEA",
+        "earliest_departure": "2025-11-01",
+        "latest_departure": "2025-11-05",
+        "trip_length_days": 7
+    }
+    response = client.post("/api/v1/flights/search/flexible", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [entry["departure_date"] for entry in data["calendar"]] == [f"2025-11-0{day}" for day in range(1, 6)]
+    assert data["calendar"][0]["return_date"] == "2025-11-08"
+    assert [entry["lowest_price"] for entry in data["calendar"]] == [280.0 - 10.0 * day for day in range(1, 6)]
+    assert data["total_results"] == 5 * len(mock_serpapi_response)
+    assert data["search_summary"]["cheapest_departure_date"] == "2025-11-05"
+    # The cheapest direct flights across the whole window, whichever day they leave
+    assert [offer["price"] for offer in data["offers"]] == [230.0, 240.0, 250.0]
+    assert len(upstream_calls) == 5
+    assert running["peak"] == 2
+
+    # A narrower window is served entirely from the per-date cache
+    narrowed = client.post("/api/v1/flights/search/flexible",
+                           json={**payload, "earliest_departure": "2025-11-02", "latest_departure": "2025-11-03"})
+    assert narrowed.status_code == 200
+    assert len(narrowed.json()["calendar"]) == 2
+    assert len(upstream_calls) == 5
+
+    too_wide = client.post("/api/v1/flights/search/flexible", json={**payload, "latest_departure": "2025-12-31"})
+    assert too_wide.status_code == 422
+    reversed_window = client.post("/api/v1/flights/search/flexible",
+                                  json={**payload, "latest_departure": "2025-10-30"})
+    assert reversed_window.status_code == 422
+
+
+def test_multi_airport_cities_search_every_airport_pair(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests that city names expand to their airports and the routes are searched within the budget and merged.
+    """
+    from app.config import settings
+    from app.flights.airport_index import resolve_airport_codes
+
+    assert resolve_airport_codes("New York") == ["JFK", "LGA", "EWR"]
+    assert resolve_airport_codes("new york city")[0] == "JFK"
+    assert resolve_airport_codes("Los Angeles")[:3] == ["LAX", "BUR", "LGB"]
+    assert resolve_airport_codes("Chicago") == ["ORD", "MDW"]
+    # An airport code means that airport only
+    assert resolve_airport_codes("LGA") == ["LGA"]
+    # Codes that are also city names stay codes; cities outside the metro list stay one airport
+    assert [resolve_airport_codes(code) for code in ("MAO", "REG", "ELY")] == [["MAO"], ["REG"], ["ELY"]]
+    assert resolve_airport_codes("Boston") == ["BOS"]
+    assert len(resolve_airport_codes("Portland")) == len(resolve_airport_codes("Columbus")) == 1
+
+    routes = []
+    fares = {("JFK", "LAX"): 400.0, ("JFK", "BUR"): 250.0, ("LGA", "LAX"): 300.0}
+
+    async def mock_search(self, request):
+        routes.append((request.origin, request.destination))
+        return [{**flight, "id": f"{request.origin}-{request.destination}-{flight['id']}",
+                 "price": fares[(request.origin, request.destination)] + index}
+                for index, flight in enumerate(mock_serpapi_response)]
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr(settings, "MULTI_AIRPORT_MAX_SEARCHES", 3)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+
+    payload = {
+        "origin": "New York",
+        "destination": "Los Angeles",
+        "departure_date": "2025-12-01",
+        "return_date": "2025-12-08"
+    }
+    response = client.post("/api/v1/flights/search", json=payload)
+    assert response.status_code == 200
+    data = response.json()
+
+    # Main airports first, each pair once, stopping at the budget
+    assert sorted(routes) == sorted(fares)
+    assert data["total_results"] == 3 * len(mock_serpapi_response)
+    # Direct flights first, cheapest across all routes
+    assert [offer["price"] for offer in data["offers"]] == [250.0, 251.0, 253.0]
+    assert all(offer["flight_id"].startswith("JFK-BUR-") for offer in data["offers"])
+
+    # Repeating the search is served from the per-route cache
+    assert client.post("/api/v1/flights/search", json=payload).status_code == 200
+    assert len(routes) == 3
+
+
+def test_flexible_search_shares_one_airport_pair_budget(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests that a flexible search between multi-airport cities stays within one upstream budget for all its days.
+    """
+    from app.config import settings
+    from app.flights.flight_search import get_flight_search_service
+
+    upstream_calls = []
+
+    async def mock_search(self, request):
+        upstream_calls.append((request.origin, request.destination, request.departure_date))
+        return mock_serpapi_response
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr(settings, "MULTI_AIRPORT_MAX_SEARCHES", 6)
+    monkeypatch.setattr(settings, "FLEXIBLE_SEARCH_MAX_SEARCHES", 14)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+    get_flight_search_service().cache.clear()
+
+    payload = {"origin": "New York", "destination": "Los Angeles", "trip_length_days": 5,
+               "earliest_departure": "2026-02-01", "latest_departure": "2026-02-07"}
+    assert client.post("/api/v1/flights/search/flexible", json=payload).status_code == 200
+    # Two airport pairs for each of the 7 days instead of 6
+    assert len(upstream_calls) == 14
+    assert {(origin, destination) for origin, destination, _ in upstream_calls} == {("JFK", "LAX"), ("JFK", "BUR")}
+
+    # A wider window searches the main airports only
+    upstream_calls.clear()
+    wide = {**payload, "earliest_departure": "2026-03-01", "latest_departure": "2026-03-14"}
+    assert client.post("/api/v1/flights/search/flexible", json=wide).status_code == 200
+    assert len(upstream_calls) == 14
+    assert {(origin, destination) for origin, destination, _ in upstream_calls} == {("JFK", "LAX")}
+
+
+def test_flight_search_prefetched_before_conversation_completes(client, monkeypatch, mock_serpapi_response):
+    """
+    Tests that the flight search starts once route and dates are known, restarts when they change,
+    and is reused by the final search.
+    """
+    import time
+    import asyncio
+    from app.config import settings
+    from app.conversational_bot import INITIAL_STATE
+
+    upstream_calls = []
+
+    async def mock_search(self, request):
+        upstream_calls.append((request.origin, request.destination, request.departure_date.isoformat()))
+        await asyncio.sleep(0.05)
+        return mock_serpapi_response
+
+    partial = {**INITIAL_STATE, "starting_location": "DEN", "destination": "PHX",
+               "dates_of_travel": {"start_date": "2026-01-10", "end_date": "2026-01-15"}}
+    moved = {**partial, "dates_of_travel": {"start_date": "2026-01-12", "end_date": "2026-01-17"}}
+    complete = {**moved, "budget": "low", "accessibility_needs": "none", "dietary_needs": "none",
+                "age_group_of_travelers": "adults", "interests": ["food"], "how_packed_trip": "relaxed",
+                "ok_with_walking": "yes", "trip_type": "leisure", "number_of_travelers": 1}
+    turns = iter([partial, moved, complete])
+
+    async def mock_update_state(state, message, history):
+        return next(turns), [], "Anything else?"
+
+    monkeypatch.setattr(settings, "SERPAPI_KEY", "test-key")
+    monkeypatch.setattr(settings, "USE_MOCK_DATA", False)
+    monkeypatch.setattr(settings, "FLIGHT_PREFETCH_ENABLED", True)
+    monkeypatch.setattr("app.flights.serpapi_adapter.SerpApiAdapter.search_flights", mock_search)
+    monkeypatch.setattr("app.api.chat_routes.call_gemini_update_state_async", mock_update_state)
+
+    before = client.get("/api/v1/chat/prefetch/stats").json()
+    first = client.post("/api/v1/chat/chat", json={"message": "Denver to Phoenix, January 10th to 15th"}).json()
+    session_id = first["session_id"]
+    assert first["conversation_complete"] is False
+    time.sleep(0.01)
+    assert upstream_calls == [("DEN", "PHX", "2026-01-10")]
+
+    # New dates cancel the old search and start another
+    client.post("/api/v1/chat/chat", json={"message": "Actually the 12th to the 17th", "session_id": session_id})
+    time.sleep(0.01)
+    assert upstream_calls[-1] == ("DEN", "PHX", "2026-01-12")
+
+    final = client.post("/api/v1/chat/chat", json={"message": "That's all", "session_id": session_id}).json()
+    assert final["conversation_complete"] is True
+    assert final["flight_results"]["total_results"] == len(mock_serpapi_response)
+    # The final search reused the prefetched results instead of calling SerpAPI again
+    assert len(upstream_calls) == 2
+
+    after = client.get("/api/v1/chat/prefetch/stats").json()
+    assert after["started"] == before["started"] + 2
+    assert after["cancelled"] == before["cancelled"] + 1
+    assert after["ready"] + after["in_flight"] == before["ready"] + before["in_flight"] + 1
+
+
+def test_concurrent_chat_turns_merge_into_the_session():
+    """
+    Tests that two overlapping turns on one session keep each other's answers and messages.
+    """
+    import asyncio
+    from app.api.chat_routes import _ChatTurn
+    from app.utils.session_manager import get_session
+
+    async def turns():
+        first = await _ChatTurn.load(None)
+        first.session["state"] = {**first.state, "destination": "Lisbon"}
+        first.add_message("user", "Lisbon please")
+        session_id = await first.save()
+
+        # Both turns read the session before either one's LLM call returns
+        slow, fast = await _ChatTurn.load(session_id), await _ChatTurn.load(session_id)
+        fast.session["state"] = {**fast.state, "budget": "low"}
+        fast.add_message("user", "Cheap")
+        await fast.save()
+        slow.session["state"] = {**slow.state, "number_of_travelers": 2}
+        slow.session["conversation_complete"] = False
+        slow.add_message("user", "Two of us")
+        assert await slow.save() == session_id
+        return session_id
+
+    session_id = asyncio.run(turns())
+
+    stored = get_session(session_id)
+    assert stored["state"]["destination"] == "Lisbon"
+    assert stored["state"]["budget"] == "low"
+    assert stored["state"]["number_of_travelers"] == 2
+    assert stored["conversation_complete"] is False
+    assert [text for _, text in stored["context"]["turns"]] == ["Lisbon please", "Cheap", "Two of us"]